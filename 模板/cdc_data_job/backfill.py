@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*-coding:utf-8*-
+# 历史数据补数：按 hour/day 拆分 begin_date~end_date，多个周期并行执行同一个 sql_list
+# python3 backfill.py --sql_list_file etl/etl_sql_list_hour.txt --grain hour --window_workers 4 --sql_params begin_date="2023-03-01 00:00:00",end_date="2023-04-01 00:00:00"
+from config import cmd_args as args
+from launcher import backfill
+from service import alert
+from utils import common, pg_pool
+import main as etl_main
+
+
+logger = common.get_logger(__name__)
+
+
+def main():
+    logger.info("======================backfill begin======================")
+    parser = args.create_parser()
+    nacos_params = args.get_nacos_params(parser)
+    sql_params = args.get_sql_params(parser)
+    run_params = args.get_run_params(parser)
+    sql_params['run_id'] = common.new_run_id()
+    logger.info(f"sql_params: {sql_params}")
+    if not sql_params['sql_list_file'] or not sql_params.get('begin_date') or not sql_params.get('end_date'):
+        parser.error("backfill requires --sql_list_file and --sql_params begin_date=...,end_date=...")
+    pg_params = etl_main.get_pg_params(nacos_params)
+    # 每个周期的每个并发步骤各占一个连接
+    pool_size = max(run_params['pool_size'], run_params['workers'] * run_params['window_workers'])
+    try:
+        pool = pg_pool.create_pool(pool_size, **pg_params)
+    except Exception as e:
+        logger.error(f"数据库连接池创建失败: {e}.")
+        alert.warn('database:connection', f"数据库连接异常：{e}")
+        return
+    try:
+        summary = backfill.run_backfill(sql_params['sql_list_file'], pool, grain=run_params['grain'],
+                                        window_workers=run_params['window_workers'], workers=run_params['workers'],
+                                        resume=run_params['resume'], force=run_params['force'],
+                                        options=run_params['options'], downstream_of=run_params['downstream_of'],
+                                        **pg_params, **sql_params)
+        print(summary)
+    finally:
+        pool.closeall()
+    etl_main.write_metrics(run_params, sql_params)
+    logger.info("=======================backfill end=======================\n\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*-coding:utf-8*-
+# 执行引擎对比：生成一批短步骤，分别用 sync、async 引擎执行，输出耗时
+# python3 benchmark.py --steps 50 --rounds 3 --workers 4
+# 日志写入 etl_log 的 1970-01-01 周期(bench_ 开头的步骤)，不影响正常周期
+import os
+import shutil
+import tempfile
+import time
+
+import main as etl_main
+from config import cmd_args as args
+from launcher import executor
+from utils import common, pg_pool
+
+
+logger = common.get_logger(__name__)
+
+
+def create_parser():
+    # 在 main.py 参数的基础上增加步骤数、轮数，数据库连接、--workers 与 main.py 相同
+    parser = args.create_parser()
+    parser.add_option('--steps', dest='steps', type='int', default=50)
+    parser.add_option('--rounds', dest='rounds', type='int', default=3)
+    # 每个步骤的 sql，默认为只有一条语句的短步骤
+    parser.add_option('--step_sql', dest='step_sql', default='select 1;')
+    return parser
+
+
+def write_sql_lists(work_dir, steps, workers, step_sql):
+    """serial：没有依赖，按行串行；dag：每层 workers 个步骤，依赖上一层的全部步骤"""
+    names = [f"bench_{no:03d}" for no in range(steps)]
+    for name in names:
+        with open(os.path.join(work_dir, f"{name}.sql"), encoding='utf-8', mode='w') as f:
+            f.write(step_sql + '\n')
+    serial_file = os.path.join(work_dir, 'serial.txt')
+    with open(serial_file, encoding='utf-8', mode='w') as f:
+        f.writelines(f"{work_dir}/{name}.sql\n" for name in names)
+    dag_file = os.path.join(work_dir, 'dag.txt')
+    with open(dag_file, encoding='utf-8', mode='w') as f:
+        for i, name in enumerate(names):
+            layer = i // workers
+            after = names[(layer - 1) * workers:layer * workers] if layer > 0 else []
+            f.write(f"{work_dir}/{name}.sql" + (f" after {','.join(after)}" if after else '') + '\n')
+    return {'serial': serial_file, 'dag': dag_file}
+
+
+def run_engine(engine, sql_list_file, workers, **params):
+    begin = time.perf_counter()
+    if engine == 'async':
+        from launcher import async_executor
+        results = async_executor.call_sql_files(sql_list_file, workers=workers, **params)
+    else:
+        pool = pg_pool.create_pool(workers, **params)
+        try:
+            results = executor.call_sql_files(sql_list_file, pool=pool, workers=workers, **params)
+        finally:
+            pool.closeall()
+    seconds = time.perf_counter() - begin
+    failed = [name for name, status in results.items() if status not in executor.SUCCESS_STATUSES]
+    if failed:
+        logger.warning(f"benchmark: {engine} {len(failed)} steps not succeeded: {failed[:5]}")
+    return seconds
+
+
+def main():
+    parser = create_parser()
+    options, _ = parser.parse_args()
+    workers = args.get_run_params(parser)['workers']
+    pg_params = etl_main.get_pg_params(args.get_nacos_params(parser))
+    params = dict(pg_params, begin_date='1970-01-01 00:00:00', end_date='1970-01-01 01:00:00',
+                  parameter_values='benchmark', sql_file=None, mapping_name=None)
+    work_dir = tempfile.mkdtemp(prefix='etl_bench_')
+    try:
+        sql_lists = write_sql_lists(work_dir, options.steps, workers, options.step_sql)
+        print(f"{'list':<8}{'engine':<8}{'best(s)':>10}{'avg(s)':>10}{'ms/step':>10}")
+        for list_name, sql_list_file in sql_lists.items():
+            for engine in ('sync', 'async'):
+                # 第一轮预热(建立连接、检查日志函数)，不计入
+                run_engine(engine, sql_list_file, workers, **params)
+                times = [run_engine(engine, sql_list_file, workers, run_id=common.new_run_id(), **params)
+                         for _ in range(options.rounds)]
+                best, avg = min(times), sum(times) / len(times)
+                print(f"{list_name:<8}{engine:<8}{best:>10.3f}{avg:>10.3f}{best * 1000 / options.steps:>10.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
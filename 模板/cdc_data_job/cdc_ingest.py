@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*-coding:utf-8*-
+# CDC 采集：从源库逻辑复制槽读取变更，按批写入 public.etl_cdc_changelog(建表见 etl/ddl/etl_cdc.sql)
+# nohup python3 cdc_ingest.py --cdc_config resource/cdc.yml > /dev/null 2>&1 &
+import signal
+
+from config import cmd_args as args
+from launcher import cdc
+from service import alert
+from utils import common, pg_pool
+import main as etl_main
+
+
+logger = common.get_logger(__name__)
+
+
+def main():
+    logger.info("=======================cdc begin=======================")
+    parser = args.create_parser()
+    nacos_params = args.get_nacos_params(parser)
+    run_params = args.get_run_params(parser)
+    config = cdc.load_config(run_params['cdc_config'])
+    pg_params = etl_main.get_pg_params(nacos_params)
+    try:
+        pool = pg_pool.create_pool(1, **pg_params)
+    except Exception as e:
+        logger.error(f"数据库连接池创建失败: {e}.")
+        alert.warn('database:connection', f"数据库连接异常：{e}")
+        return
+    reader = cdc.ChangeReader(config, pool, **pg_params)
+    signal.signal(signal.SIGTERM, lambda signum, frame: reader.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: reader.stop())
+    try:
+        reader.run_forever()
+    finally:
+        pool.closeall()
+    logger.info("========================cdc end========================\n\n")
+
+
+if __name__ == '__main__':
+    main()
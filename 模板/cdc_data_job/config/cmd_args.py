@@ -29,6 +29,52 @@ def create_parser():
     parser.add_option('--sql_list_file', dest='sql_list_file')
     # 短名-sp 长名--sql_params, 对应sql参数值
     parser.add_option('--sql_params', dest='sql_params')
+    # 长名--pool_size，对应数据库连接池大小
+    parser.add_option('--pool_size', dest='pool_size', type='int')
+    # 长名--workers，对应sql_list按依赖并行执行时的并发数
+    parser.add_option('--workers', dest='workers', type='int')
+    # 长名--resume，断点续跑，跳过本周期etl_log中已成功的步骤
+    parser.add_option('--resume', dest='resume', action='store_true', default=False)
+    # 长名--force，断点续跑时仍强制执行的步骤，逗号分隔
+    parser.add_option('--force', dest='force')
+    # 长名--grain，补数的周期粒度 hour/day
+    parser.add_option('--grain', dest='grain', choices=['hour', 'day'])
+    # 长名--window_workers，补数时同时执行的周期数
+    parser.add_option('--window_workers', dest='window_workers', type='int')
+    # 长名--instrument，逐条语句记录耗时、影响行数到 etl_log_statement
+    parser.add_option('--instrument', dest='instrument', action='store_true', default=False)
+    # 长名--slow_seconds，慢语句阈值(秒)，超过则记录执行计划
+    parser.add_option('--slow_seconds', dest='slow_seconds', type='float')
+    # 长名--explain，慢语句执行计划方式 plain/analyze
+    parser.add_option('--explain', dest='explain', choices=['plain', 'analyze'])
+    # 长名--timeout，步骤超时秒数，sql_list 中的 timeout 选项优先
+    parser.add_option('--timeout', dest='timeout', type='float')
+    # 长名--schedule，常驻调度(daemon.py)的调度配置文件
+    parser.add_option('--schedule', dest='schedule')
+    # 长名--cdc_config，CDC 采集(cdc_ingest.py)的配置文件
+    parser.add_option('--cdc_config', dest='cdc_config')
+    # 长名--monitor_config，常驻监控(etl_monitor.py)的配置文件
+    parser.add_option('--monitor_config', dest='monitor_config')
+    # 长名--metrics_port，常驻进程(daemon.py、etl_monitor.py)提供 Prometheus 指标的 http 端口
+    parser.add_option('--metrics_port', dest='metrics_port', type='int')
+    # 长名--metrics_file，运行结束时写入指标的 node_exporter textfile，{sql_list} 替换为 sql_list 文件名
+    parser.add_option('--metrics_file', dest='metrics_file')
+    # 长名--lock，同一步骤同一周期的互斥策略 none/skip/wait/fail
+    parser.add_option('--lock', dest='lock', choices=['none', 'skip', 'wait', 'fail'])
+    # 长名--lock_wait_minutes，wait 策略的最长等待分钟数
+    parser.add_option('--lock_wait_minutes', dest='lock_wait_minutes', type='float')
+    # 长名--micro_batch，微批：按 etl_watermark 中的高水位计算周期，成功后推进高水位
+    parser.add_option('--micro_batch', dest='micro_batch', action='store_true', default=False)
+    # 长名--batch_minutes，微批周期分钟数
+    parser.add_option('--batch_minutes', dest='batch_minutes', type='int')
+    # 长名--lateness_minutes，微批的延迟容忍分钟数，只处理到 当前时间-lateness_minutes
+    parser.add_option('--lateness_minutes', dest='lateness_minutes', type='int')
+    # 长名--max_batch_minutes，落后时合并多个周期，一批最长的分钟数
+    parser.add_option('--max_batch_minutes', dest='max_batch_minutes', type='int')
+    # 长名--engine，sql_list 执行引擎 sync(psycopg2 线程池)/async(psycopg 3 asyncio + pipeline)
+    parser.add_option('--engine', dest='engine', choices=['sync', 'async'])
+    # 长名--rerun_downstream_of，只执行 sql_list 中该表(schema.table)或步骤下游的步骤，按血缘的拓扑序
+    parser.add_option('--rerun_downstream_of', '--rerun-downstream-of', dest='rerun_downstream_of')
 
     return parser
 
@@ -102,10 +148,75 @@ def get_sql_params(parser):
     return param_items
 
 
+def get_run_params(parser):
+    # 获取执行器参数(连接池等)，不传入sql
+    (options, args) = parser.parse_args()
+    if options.pool_size:
+        pool_size = options.pool_size
+    else:
+        pool_size = default_args.pool_size
+    if options.workers:
+        workers = options.workers
+    else:
+        workers = default_args.workers
+    if options.force:
+        force = [item for item in options.force.split(',') if item]
+    else:
+        force = []
+    if options.grain:
+        grain = options.grain
+    else:
+        grain = default_args.grain
+    if options.window_workers:
+        window_workers = options.window_workers
+    else:
+        window_workers = default_args.window_workers
+
+    if options.schedule:
+        schedule = options.schedule
+    else:
+        schedule = default_args.schedule
+    if options.cdc_config:
+        cdc_config = options.cdc_config
+    else:
+        cdc_config = default_args.cdc_config
+    if options.monitor_config:
+        monitor_config = options.monitor_config
+    else:
+        monitor_config = default_args.monitor_config
+    micro_batch = {'batch_minutes': options.batch_minutes or default_args.batch_minutes,
+                   'lateness_minutes': options.lateness_minutes if options.lateness_minutes is not None
+                   else default_args.lateness_minutes,
+                   'max_batch_minutes': options.max_batch_minutes or default_args.max_batch_minutes}
+    if options.engine:
+        engine = options.engine
+    else:
+        engine = default_args.engine
+    if options.micro_batch and engine == 'async':
+        # 微批按高水位切分窗口并推进，只在同步引擎上实现
+        parser.error('--micro_batch is not supported by --engine async, use --engine sync')
+    # 步骤选项的默认值，sql_list 中每行的 key=value 优先
+    step_options = {'instrument': options.instrument,
+                    'slow_seconds': options.slow_seconds if options.slow_seconds else default_args.slow_seconds,
+                    'explain': options.explain if options.explain else default_args.explain,
+                    'timeout': options.timeout if options.timeout else default_args.timeout,
+                    'lock': options.lock if options.lock else default_args.lock,
+                    'lock_wait_minutes': options.lock_wait_minutes if options.lock_wait_minutes else default_args.lock_wait_minutes}
+
+    return {'pool_size': pool_size, 'workers': workers, 'resume': options.resume, 'force': force,
+            'grain': grain, 'window_workers': window_workers, 'schedule': schedule, 'cdc_config': cdc_config,
+            'monitor_config': monitor_config, 'engine': engine, 'micro_batch': options.micro_batch,
+            'micro_batch_params': micro_batch, 'downstream_of': options.rerun_downstream_of,
+            'metrics_port': options.metrics_port or default_args.metrics_port,
+            'metrics_file': options.metrics_file or default_args.metrics_file, 'options': step_options}
+
+
 if __name__ == '__main__':
     print(default_args.group)
     test_parser = create_parser()
     nacos_params = get_nacos_params(test_parser)
     sql_params1 = get_sql_params(test_parser)
+    run_params1 = get_run_params(test_parser)
     print(nacos_params)
     print(sql_params1)
+    print(run_params1)
@@ -4,3 +4,46 @@ username = 'devUser'
 password = 'devUser'
 data_id = 'cdc-data-service.yml'
 group = 'DEFAULT_GROUP'
+
+# 数据库连接池大小
+pool_size = 4
+
+# 按依赖关系并行执行sql_list时的并发数
+workers = 4
+
+# sql_list 执行引擎：sync 为 psycopg2 线程池，async 为 psycopg 3 asyncio + pipeline 模式(需安装 psycopg>=3.2)
+engine = 'sync'
+
+# 补数(backfill.py)的周期粒度(hour/day)、同时执行的周期数
+grain = 'hour'
+window_workers = 4
+
+# 逐条语句记录耗时时，超过该秒数的语句记录执行计划；执行计划方式 plain(EXPLAIN)/analyze(EXPLAIN ANALYZE)
+slow_seconds = 10
+explain = 'plain'
+
+# 步骤超时秒数，None 为不限制
+timeout = None
+
+# 微批(--micro_batch)：周期分钟数、延迟容忍分钟数、落后时合并为一批的最长分钟数
+batch_minutes = 5
+lateness_minutes = 2
+max_batch_minutes = 60
+
+# 常驻调度(daemon.py)的调度配置文件
+schedule = 'resource/schedule.yml'
+
+# CDC 采集(cdc_ingest.py)的配置文件
+cdc_config = 'resource/cdc.yml'
+
+# 常驻监控(etl_monitor.py)的配置文件
+monitor_config = 'resource/monitor.yml'
+
+# Prometheus 指标：常驻进程的 http 端口、cron 运行结束时写入的 node_exporter textfile，None 为不输出
+metrics_port = None
+metrics_file = None
+
+# 同一周期的同一步骤在多个进程中同时执行时的处理：none 不控制，skip 跳过，wait 等待(最长 lock_wait_minutes 分钟)，fail 失败；
+# 跳过的步骤不影响依赖它的步骤，但不算完成，微批高水位不推进
+lock = 'skip'
+lock_wait_minutes = 10
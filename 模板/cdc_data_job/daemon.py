@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*-coding:utf-8*-
+# 常驻调度：按 resource/schedule.yml 中的 cron 运行 sql_list，共用连接池和配置，代替每个周期启动一次 main.py
+# nohup python3 daemon.py --schedule resource/schedule.yml > /dev/null 2>&1 &
+import signal
+
+from config import cmd_args as args
+from launcher import scheduler
+from service import alert
+from utils import common, metrics, pg_pool
+import main as etl_main
+
+
+logger = common.get_logger(__name__)
+
+
+def main():
+    logger.info("=======================daemon begin=======================")
+    parser = args.create_parser()
+    nacos_params = args.get_nacos_params(parser)
+    run_params = args.get_run_params(parser)
+    jobs = scheduler.load_schedule(run_params['schedule'])
+    pg_params = etl_main.get_pg_params(nacos_params)
+    # 每个 job 可能同时运行，各自占用 workers 个连接
+    workers = max([job['workers'] or run_params['workers'] for job in jobs] or [1])
+    pool_size = max(run_params['pool_size'], workers * len(jobs))
+    try:
+        pool = pg_pool.create_pool(pool_size, **pg_params)
+    except Exception as e:
+        logger.error(f"数据库连接池创建失败: {e}.")
+        alert.warn('database:connection', f"数据库连接异常：{e}")
+        return
+    if run_params['metrics_port']:
+        metrics.start_http_server(run_params['metrics_port'])
+    # 每次运行前重新读取配置，nacos 缓存过期时刷新，常驻进程也能用上新配置
+    daemon = scheduler.Scheduler(jobs, pool, run_params, load_config=lambda: etl_main.get_pg_params(nacos_params),
+                                 **pg_params)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run_forever()
+    finally:
+        daemon.pool.closeall()
+        daemon.close_retired()
+    logger.info("========================daemon end========================\n\n")
+
+
+if __name__ == '__main__':
+    main()
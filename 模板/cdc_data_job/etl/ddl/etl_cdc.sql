@@ -0,0 +1,32 @@
+-- /******************************************************************************
+--    Name   : CDC 变更日志表、位点表
+--    Purpose  : public.etl_cdc_changelog、public.etl_cdc_offset
+--    Revisions or Comments
+--    VER        DATE        AUTHOR           DESCRIPTION
+--  ---------  ----------  ---------------  ------------------------------------
+--    1.0      2026-10-18                    1、cdc_ingest.py 从逻辑复制槽读取的变更按批写入变更日志表，
+--                                            同一事务内更新位点表，重启后从位点继续
+-- ******************************************************************************/
+create table if not exists public.etl_cdc_changelog
+(
+ id bigserial primary key
+,slot_name varchar(64)  -- 复制槽
+,lsn pg_lsn  -- 源事务提交 lsn
+,xid bigint  -- 源事务号
+,commit_datetime timestamp  -- 源事务提交时间
+,schema_name varchar(64)  -- 源表模式
+,table_name varchar(64)  -- 源表名
+,op char(1)  -- 操作类型：I 插入，U 更新，D 删除，T 清空
+,key_data jsonb  -- 主键(replica identity)列的值
+,row_data jsonb  -- 插入、更新后的行，删除前的行(replica identity full 时为整行，否则只有主键列)；未变化的 toast 列不包含
+,create_datetime timestamp default localtimestamp  -- 写入时间，下游按该时间取增量
+);
+
+create index if not exists idx_etl_cdc_changelog_table on public.etl_cdc_changelog (table_name, create_datetime);
+
+create table if not exists public.etl_cdc_offset
+(
+ slot_name varchar(64) primary key  -- 复制槽
+,lsn pg_lsn  -- 已写入变更日志表的最后一个事务的结束 lsn
+,update_datetime timestamp  -- 更新时间
+);
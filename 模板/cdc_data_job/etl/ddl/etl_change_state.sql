@@ -0,0 +1,30 @@
+-- /******************************************************************************
+--    Name   : 源表变更状态表
+--    Purpose  : public.etl_change_state
+--    Revisions or Comments
+--    VER        DATE        AUTHOR           DESCRIPTION
+--  ---------  ----------  ---------------  ------------------------------------
+--    1.0      2026-10-18                    1、声明了 sources 的步骤上次成功执行前的源表变更指标，未变化时跳过步骤
+--    1.1      2026-10-18                    1、增加周期列 etl_window(步骤选项 change_window=1 时按周期保存，默认为空只按步骤)；已建的表原地升级
+-- ******************************************************************************/
+create table if not exists public.etl_change_state
+(
+ etl_name varchar(200)  -- 步骤名
+,etl_window varchar(100) not null default ''  -- 周期：begin_date ~ end_date，未按周期保存时为空
+,signature text  -- 各源表的变更指标：源表=指标;源表=指标
+,run_id varchar(64)  -- 最后成功执行的运行标识
+,update_datetime timestamp  -- 更新时间
+,primary key (etl_name, etl_window)
+);
+
+-- 1.0 的表(主键只有 etl_name)升级
+alter table public.etl_change_state add column if not exists etl_window varchar(100) not null default '';
+do $$
+begin
+    if (select count(*) from pg_index i join pg_attribute a on a.attrelid = i.indrelid and a.attnum = any(i.indkey)
+        where i.indrelid = 'public.etl_change_state'::regclass and i.indisprimary) = 1 then
+        alter table public.etl_change_state drop constraint etl_change_state_pkey;
+        alter table public.etl_change_state add primary key (etl_name, etl_window);
+    end if;
+end
+$$;
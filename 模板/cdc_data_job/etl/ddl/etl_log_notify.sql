@@ -0,0 +1,38 @@
+-- /******************************************************************************
+--    Name   : 日志通知
+--    Purpose  : public.etl_log 状态变化时 NOTIFY etl_log_status，供常驻监控(etl_monitor.py)使用
+--    Revisions or Comments
+--    VER        DATE        AUTHOR           DESCRIPTION
+--  ---------  ----------  ---------------  ------------------------------------
+--    1.0      2026-10-18                    1、插入、状态或开始时间变化时通知，事务提交后送达；
+--                                            2、监控重启时按 start_datetime 索引读取最近开始的步骤
+-- ******************************************************************************/
+create or replace function public.etl_log_notify()
+returns trigger
+language plpgsql
+as
+$$
+BEGIN
+    if TG_OP = 'UPDATE' and new.status is not distinct from old.status
+       and new.start_datetime is not distinct from old.start_datetime then
+        return null;
+    end if;
+    -- 通知内容上限 8000 字节，异常信息截断
+    perform pg_notify('etl_log_status', json_build_object(
+         'id', new.id
+        ,'etl_name', new.etl_name
+        ,'status', new.status
+        ,'start_datetime', to_char(new.start_datetime, 'YYYY-MM-DD HH24:MI:SS')
+        ,'error_info', left(new.error_info, 500)
+    )::text);
+    return null;
+END;
+$$
+;
+
+drop trigger if exists trg_etl_log_notify on public.etl_log;
+create trigger trg_etl_log_notify
+after insert or update on public.etl_log
+for each row execute function public.etl_log_notify();
+
+create index if not exists idx_etl_log_start_datetime on public.etl_log (start_datetime);
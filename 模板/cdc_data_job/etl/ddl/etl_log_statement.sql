@@ -0,0 +1,25 @@
+-- /******************************************************************************
+--    Name   : 日志明细表(语句级)
+--    Purpose  : public.etl_log_statement
+--    Revisions or Comments
+--    VER        DATE        AUTHOR           DESCRIPTION
+--  ---------  ----------  ---------------  ------------------------------------
+--    1.0      2026-10-18                    1、--instrument 模式下每条语句的耗时、影响行数、慢语句执行计划
+-- ******************************************************************************/
+create table if not exists public.etl_log_statement
+(
+ id bigserial primary key
+,run_id varchar(64)  -- 运行标识
+,etl_log_id varchar(200)  -- 对应 etl_log.id
+,etl_name varchar(100)  -- etl名称
+,statement_no int  -- 语句序号
+,statement_text text  -- 语句
+,start_datetime timestamp  -- 开始时间
+,duration_ms numeric(18,3)  -- 耗时(毫秒)
+,row_count bigint  -- 影响行数
+,plan_text text  -- 慢语句执行计划
+,error_info text  -- 异常信息
+,create_datetime timestamp default localtimestamp  -- 创建时间
+);
+
+create index if not exists idx_etl_log_statement_log_id on public.etl_log_statement (etl_log_id, run_id);
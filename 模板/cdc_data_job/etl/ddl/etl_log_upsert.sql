@@ -0,0 +1,70 @@
+-- /******************************************************************************
+--    Name   : 日志函数
+--    Purpose  : public.etl_log_upsert，写入 public.etl_log，与 etl/etl_log.sql 的 DO 块逻辑一致
+--    Revisions or Comments
+--    VER        DATE        AUTHOR           DESCRIPTION
+--  ---------  ----------  ---------------  ------------------------------------
+--    1.0      2026-10-18                    1、执行器检测到该函数时调用函数写日志，DO 块每次都要重新解析；
+--                                            修改日志逻辑时两处需同步修改
+-- ******************************************************************************/
+create or replace function public.etl_log_upsert
+(
+ p_mapping_name varchar  -- etl名称
+,p_begin_date varchar  -- etl执行时间
+,p_end_date varchar  -- etl结束时间
+,p_status int  -- etl状态
+,p_error_info varchar  -- etl异常信息
+,p_parameter_values varchar  -- etl入参
+,p_parameter_begin_date varchar  -- etl入参开始时间
+,p_parameter_end_date varchar  -- etl入参结束时间
+)
+returns void
+language plpgsql
+as
+$$
+BEGIN
+insert into public.etl_log
+(
+ id
+,etl_name
+,etl_type
+,etl_params
+,etl_params_start_date
+,etl_params_end_date
+,start_datetime
+,end_datetime
+,status
+,error_info
+,create_datetime
+,update_datetime
+,delete_flag
+)
+select
+     concat(p_parameter_begin_date,'_', p_mapping_name) id  -- 唯一主键
+    ,p_mapping_name etl_name  -- etl名称
+    ,null etl_type  -- etl类型
+    ,p_parameter_values etl_params  -- etl入参
+    ,p_parameter_begin_date::timestamp etl_params_start_date  -- etl入参开始时间
+    ,p_parameter_end_date::timestamp etl_params_end_date  -- etl入参结束时间
+    ,p_begin_date::timestamp start_datetime  -- etl执行时间
+    ,case when p_end_date = '' then null else p_end_date::timestamp end end_datetime  -- etl结束时间
+    ,p_status status  -- etl状态
+    ,p_error_info error_info  -- etl异常信息
+    ,localtimestamp create_datetime  -- 创建时间
+    ,localtimestamp update_datetime  -- 更新时间
+    ,'0' delete_flag  -- 删除标识
+on conflict (id)
+do update set
+     etl_params = excluded.etl_params
+    ,etl_params_start_date = excluded.etl_params_start_date
+    ,etl_params_end_date = excluded.etl_params_end_date
+    ,start_datetime = excluded.start_datetime
+    ,end_datetime = excluded.end_datetime
+    ,status = excluded.status
+    ,error_info = excluded.error_info
+    ,update_datetime = excluded.update_datetime
+    ,delete_flag = excluded.delete_flag
+;
+END;
+$$
+;
@@ -0,0 +1,24 @@
+-- /******************************************************************************
+--    Name   : 步骤耗时基线表
+--    Purpose  : public.etl_step_baseline
+--    Revisions or Comments
+--    VER        DATE        AUTHOR           DESCRIPTION
+--  ---------  ----------  ---------------  ------------------------------------
+--    1.0      2026-10-18                    1、每个步骤成功后增量更新最近 N 次耗时、p50/p95、EWMA、增长趋势，
+--                                            耗时超过 k 倍 p95 或持续增长时记录 regression_reason，见 launcher/baseline.py
+-- ******************************************************************************/
+create table if not exists public.etl_step_baseline
+(
+ etl_name varchar(100) primary key  -- etl名称
+,sample_count int  -- 累计成功次数
+,recent_seconds numeric(18,3)[]  -- 最近 N 次成功的耗时(秒)，按时间顺序
+,last_seconds numeric(18,3)  -- 最近一次耗时(秒)
+,ewma_seconds numeric(18,3)  -- 耗时的指数加权移动平均(秒)
+,p50_seconds numeric(18,3)  -- 最近 N 次耗时的中位数(秒)
+,p95_seconds numeric(18,3)  -- 最近 N 次耗时的 p95(秒)
+,trend numeric(10,4)  -- 最近 N 次耗时的增长趋势(Theil-Sen 斜率 × (N-1) / p50)，0.5 为增长了 p50 的 50%
+,regression_reason varchar(500)  -- 最近一次执行变慢的原因，未变慢时为空
+,last_etl_log_id varchar(200)  -- 最近一次对应的 etl_log.id
+,last_run_id varchar(64)  -- 最近一次的运行标识
+,update_datetime timestamp  -- 更新时间
+);
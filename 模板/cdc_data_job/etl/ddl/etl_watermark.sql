@@ -0,0 +1,15 @@
+-- /******************************************************************************
+--    Name   : 高水位表
+--    Purpose  : public.etl_watermark
+--    Revisions or Comments
+--    VER        DATE        AUTHOR           DESCRIPTION
+--  ---------  ----------  ---------------  ------------------------------------
+--    1.0      2026-10-18                    1、微批(main.py --micro_batch)每个 sql_list 已处理到的时间，全部步骤成功后推进
+-- ******************************************************************************/
+create table if not exists public.etl_watermark
+(
+ name varchar(200) primary key  -- sql_list 文件
+,high_water timestamp  -- 已处理到的时间(下一批的 begin_date)
+,run_id varchar(64)  -- 最后推进高水位的运行标识
+,update_datetime timestamp  -- 更新时间
+);
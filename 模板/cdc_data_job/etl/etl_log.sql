@@ -34,37 +34,8 @@ BEGIN
     v_parameter_begin_date := %(begin_date)s;
     v_parameter_end_date := %(end_date)s;    
 
-    -- 此处的等待、超时预警等功能，放在任务编排中以及单独的监控中实现
-    -- --当传入的status值为-1时，默认为需判断过程是否已在执行中
-    -- IF v_status = -1 THEN
-    --     LOOP
-    --         --获取过程最后一次执行时的执行状态和执行时间
-    --         SELECT COALESCE(MAX(a.status), 0), COALESCE(MAX(a.begin_date), CURRENT_DATE)
-    --             INTO v_run_flg, v_last_runtime
-    --             FROM (SELECT t.status,
-    --                         t.begin_date,
-    --                         ROW_NUMBER()
-    --                         OVER (PARTITION BY t.mapping_name ORDER BY t.begin_date DESC, t.status DESC) rn
-    --                     FROM dw.etl_log t
-    --                     WHERE t.mapping_name = v_mapping_name
-    --                     AND t.begin_date > CURRENT_DATE - 7) a
-    --             WHERE rn = 1;
-    --         --若执行状态为成功(0)或者失败(1)，
-    --         --或者最后一次任务持续执行时间超过限制(last_run_minutes)
-    --         --则退出循环
-    --         EXIT WHEN v_run_flg >= 0 OR NOW() - v_last_runtime > (v_max_run_minutes || ' minutes')::INTERVAL;
-
-    --         --若任务检测循环持续执行时间超过限制（timeout_minutes），则直接结束执行。
-    --         IF NOW() > v_begin_date::TIMESTAMP + (v_timeout_minutes || ' minutes')::INTERVAL THEN
-    --             v_status := -9999;
-    --             RAISE EXCEPTION 'ERROR';
-    --         END IF;
-
-    --         --若有任务正在执行中，则60秒之后重新检测。
-    --         PERFORM PG_SLEEP(60);
-
-    --     END LOOP;
-    -- END IF;
+    -- 同一步骤是否已在执行中，由执行器在执行前取 postgres 咨询锁(pg_try_advisory_lock)判断，见 launcher/run_lock.py；
+    -- 超时预警在任务编排(步骤 timeout)以及单独的监控中实现
 
 
     -- --插入日志表
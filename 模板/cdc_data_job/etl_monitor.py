@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*-coding:utf-8*-
+# 常驻监控：LISTEN etl_log 的状态通知，秒级发现未运行、失败、超时(需先执行 etl/ddl/etl_log_notify.sql)，
+# 代替每小时运行一次的 monitor/monitor_hour.py
+# nohup python3 etl_monitor.py --monitor_config resource/monitor.yml > /dev/null 2>&1 &
+import signal
+
+from config import cmd_args as args
+from launcher import monitor
+from utils import common, metrics
+import main as etl_main
+
+
+logger = common.get_logger(__name__)
+
+
+def main():
+    logger.info("=======================monitor begin=======================")
+    parser = args.create_parser()
+    nacos_params = args.get_nacos_params(parser)
+    run_params = args.get_run_params(parser)
+    config = monitor.load_config(run_params['monitor_config'])
+    pg_params = etl_main.get_pg_params(nacos_params)
+    if run_params['metrics_port']:
+        metrics.start_http_server(run_params['metrics_port'])
+    etl_monitor = monitor.EtlMonitor(config, **pg_params)
+    signal.signal(signal.SIGTERM, lambda signum, frame: etl_monitor.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: etl_monitor.stop())
+    etl_monitor.run_forever()
+    logger.info("========================monitor end========================\n\n")
+
+
+if __name__ == '__main__':
+    main()
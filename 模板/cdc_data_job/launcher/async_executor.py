@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import asyncio
+import datetime
+import time
+
+import psycopg
+
+from launcher import baseline, change_check, etl_log, executor, lineage, load, run_lock, sql_list, statements, watchdog
+from service import alert
+from utils import common, log_format, pg_pool
+
+logger = common.get_logger(__name__)
+
+# 乐观写入的结束日志：与步骤 sql 同一批发送，结束时间取数据库时间；步骤失败时随步骤一起回滚
+LOG_FUNCTION_END_CALL = etl_log.LOG_FUNCTION_CALL.replace(
+    '%(log_end_time)s', "to_char(clock_timestamp(), 'YYYY-MM-DD HH24:MI:SS')")
+
+
+# --------------------------------
+# 异步执行引擎(--engine async)
+# --------------------------------
+# 与 executor.call_sql_files 接口相同，基于 psycopg 3 的 asyncio 连接和 libpq pipeline 模式：
+# 无依赖的步骤在一个事件循环内各用一个连接并发执行；每个步骤分两批发送，
+# 第一批为开始日志(单独提交，执行中可被监控看到)，第二批为步骤的全部语句和结束日志(同一个隐式事务)；
+# 依赖失败的步骤日志合并为一批写入。
+# 不支持 instrument(逐条语句记录)和补数的周期顺序控制，需要时使用默认的同步引擎
+def call_sql_files(sql_list_file_name, pool=None, workers=1, resume=False, force=None, gate=None, options=None,
+                   downstream_of=None, **pg_params):
+    """pool 不使用(异步引擎自建连接)，gate 不支持"""
+    if gate is not None:
+        raise ValueError("async engine: window gate (backfill) is not supported")
+    pg_params.setdefault('run_id', common.new_run_id())
+    # 事件循环的 task 复制当前的日志上下文，各步骤在自己的 task 中设置 step
+    with log_format.log_context(run_id=pg_params['run_id'], list=sql_list_file_name,
+                                window=log_format.window(**pg_params)):
+        return asyncio.run(run_sql_files(sql_list_file_name, workers, resume, force, options, downstream_of, **pg_params))
+
+
+async def run_sql_files(sql_list_file_name, workers=1, resume=False, force=None, options=None, downstream_of=None,
+                        **pg_params):
+    pg_params.setdefault('run_id', common.new_run_id())
+    list_begin = time.perf_counter()
+    try:
+        steps = sql_list.parse_sql_list(sql_list_file_name)
+        if downstream_of:
+            steps = lineage.select_downstream(steps, downstream_of)
+            logger.info(f"lineage: downstream of {downstream_of}: {','.join(step['mapping_name'] for step in steps)}")
+        if sql_list.has_dependencies(steps):
+            sql_list.check_steps(steps)
+        executor.check_options(steps, options)
+    except Exception as e:
+        logger.error(f"sql_list: {sql_list_file_name} parse failed: {e}")
+        alert.warn(f"{sql_list_file_name}:parse", f"ETL执行异常，sql_list：{sql_list_file_name}，{e}")
+        return {}
+
+    pool = AsyncPgPool(max(workers, 1), **pg_params)
+    try:
+        try:
+            await pool.open()
+        except Exception as e:
+            alert.warn('database:connection', f"数据库连接异常：{e}")
+            return {}
+        results = {}
+        if resume:
+            names = [step['mapping_name'] for step in steps]
+            force = [sql_list.get_mapping_name(name) for name in (force or [])]
+            try:
+                success_steps = await get_success_steps(pool, names, **pg_params)
+            except Exception as e:
+                logger.error(f"resume: query etl_log failed, all steps will run: {e}")
+                success_steps = []
+            for name in success_steps:
+                if name not in force:
+                    logger.info(f"sql: {name} skipped, already succeeded in this period.")
+                    results[name] = executor.STATUS_SUCCESS
+        if sql_list.has_dependencies(steps):
+            results = await run_steps(steps, pool, results, options=options, **pg_params)
+        else:
+            for step in steps:
+                if step['mapping_name'] not in results:
+                    results[step['mapping_name']] = await run_step(step, pool, options=options, **pg_params)
+        regressions = await get_regressions(
+            pool, [name for name, value in results.items() if value == executor.STATUS_SUCCESS], **pg_params)
+    finally:
+        await pool.close()
+
+    summary = {status: [name for name, value in results.items() if value == status] for status in set(results.values())}
+    logger.info(f"sql_list: {sql_list_file_name} finished, {summary}",
+                extra={'duration': time.perf_counter() - list_begin})
+    baseline.report(sql_list_file_name, regressions)
+    executor.observe_list(sql_list_file_name, results)
+    return results
+
+
+# --------------------------------
+# 异步连接池
+# --------------------------------
+# 最多 pool_size 个连接，按需建立；连接为自动提交，使用客户端参数绑定(AsyncClientCursor)，
+# 与 psycopg2 一样支持 %(name)s 参数、DO 块和多条语句
+class AsyncPgPool(object):
+
+    def __init__(self, pool_size=1, **pg_params):
+        self.pool_size = max(int(pool_size), 1)
+        self.pg_params = pg_params
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(self.pool_size)
+
+    async def connect(self):
+        return await psycopg.AsyncConnection.connect(host=self.pg_params['pg_host'],
+                                                     port=self.pg_params['pg_port'],
+                                                     dbname=self.pg_params['pg_dbname'],
+                                                     user=self.pg_params['pg_user'],
+                                                     password=self.pg_params['pg_password'],
+                                                     autocommit=True,
+                                                     cursor_factory=psycopg.AsyncClientCursor)
+
+    async def open(self):
+        """先建立一个连接，连接失败时尽早返回"""
+        self._idle.append(await self.connect())
+
+    async def getconn(self):
+        begin = time.perf_counter()
+        await self._semaphore.acquire()
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.closed:
+                    pg_pool.ACQUIRE_SECONDS.observe(time.perf_counter() - begin)
+                    return conn
+            conn = await self.connect()
+            pg_pool.ACQUIRE_SECONDS.observe(time.perf_counter() - begin)
+            return conn
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    async def putconn(self, conn):
+        try:
+            if not conn.closed:
+                if conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE:
+                    self._idle.append(conn)
+                else:
+                    await conn.close()
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+async def get_success_steps(pool, mapping_names, **pg_params):
+    if not pg_params.get('begin_date') or not mapping_names:
+        logger.warning("resume: begin_date is not set, all steps will run.")
+        return []
+    ids = [f"{pg_params['begin_date']}_{name}" for name in mapping_names]
+    sql = """
+        select a.etl_name
+        from public.etl_log a
+        where a.id = any(%(ids)s)
+        and a.status in (0, 6)
+        and a.etl_params_end_date is not distinct from %(end_date)s::timestamp
+        """
+    conn = await pool.getconn()
+    try:
+        cur = await conn.execute(sql, {'ids': ids, 'end_date': pg_params.get('end_date')})
+        rows = await cur.fetchall()
+    finally:
+        await pool.putconn(conn)
+    return [row[0] for row in rows]
+
+
+async def get_regressions(pool, names, **pg_params):
+    """同 baseline.get_regressions"""
+    if not baseline.table_exists() or not names:
+        return {}
+    conn = await pool.getconn()
+    try:
+        cur = await conn.execute(baseline.REGRESSIONS_SQL, baseline.regressions_params(names, **pg_params))
+        return dict(await cur.fetchall())
+    except Exception as e:
+        logger.warning(f"baseline: query regressions failed: {e}")
+        return {}
+    finally:
+        await pool.putconn(conn)
+
+
+async def run_steps(steps, pool, results=None, options=None, **pg_params):
+    """与 executor.run_steps 相同的调度规则，并发数由连接池大小限制"""
+    results = dict(results or {})
+    pending = {step['mapping_name']: step for step in steps if step['mapping_name'] not in results}
+    running = {}
+    while pending or running:
+        changed = True
+        while changed:
+            changed = False
+            skipped = []
+            for name, step in list(pending.items()):
+                failed = [dep for dep in step['after'] if dep in results and results[dep] not in executor.DEPENDENCY_OK_STATUSES]
+                if failed:
+                    del pending[name]
+                    error_info = f"upstream failed: {','.join(failed)}"
+                    logger.info(f"sql: {step['sql_file']} skipped, {error_info}.")
+                    skipped.append((step['sql_file'], error_info))
+                    results[name] = executor.STATUS_UPSTREAM_FAILED
+                    changed = True
+                elif all(dep in results for dep in step['after']):
+                    del pending[name]
+                    task = asyncio.create_task(run_step(step, pool, options=options, **pg_params))
+                    running[task] = name
+            if skipped:
+                await log_sql_files(skipped, executor.STATUS_UPSTREAM_FAILED, pool, **pg_params)
+        if not running:
+            break
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            name = running.pop(task)
+            try:
+                results[name] = task.result()
+            except Exception as e:
+                logger.error(f"etl执行失败: {name}, {e}.")
+                results[name] = executor.STATUS_FAILED
+    return results
+
+
+async def run_step(step, pool, options=None, **pg_params):
+    step_options = dict(options or {})
+    step_options.update(step['options'])
+    return await call_sql_file(step['sql_file'], pool, options=step_options, **pg_params)
+
+
+async def get_log_sql(conn):
+    """同 etl_log.get_log_sql：有日志函数时调用函数，否则使用 etl/etl_log.sql 的 DO 块"""
+    if etl_log.log_function_exists() is None:
+        cur = await conn.execute(etl_log.CHECK_LOG_FUNCTION_SQL, (etl_log.LOG_FUNCTION,))
+        etl_log.set_log_function_exists((await cur.fetchone())[0])
+    return etl_log.current_log_sql()
+
+
+async def log_sql_files(items, log_status, pool, **pg_params):
+    """只写日志不执行sql，多个步骤的日志一批发送；items 为 (sql文件, 异常信息) 列表"""
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        conn = await pool.getconn()
+    except Exception as e:
+        logger.error(f"log execution failed: {e}")
+        return
+    try:
+        log_sql = await get_log_sql(conn)
+        async with conn.pipeline():
+            cur = conn.cursor()
+            for file_name, error_info in items:
+                params = dict(pg_params, mapping_name=sql_list.get_mapping_name(file_name), log_start_time=now,
+                              log_end_time=now, status=log_status, error_info=error_info)
+                await cur.execute(log_sql, params)
+    except Exception as e:
+        logger.error(f"log execution failed: {e}")
+    finally:
+        await pool.putconn(conn)
+
+
+async def check_sources(conn, mapping_name, options, window=''):
+    """同 change_check.check"""
+    try:
+        sql, params, sources = change_check.check_query(mapping_name, options, window)
+        cur = await conn.execute(sql, params)
+        return change_check.compare(await cur.fetchone(), sources)
+    except Exception as e:
+        logger.warning(f"change check: {mapping_name} failed, step will run: {e}")
+        return None, False
+
+
+async def update_baseline(conn, duration_seconds, **pg_params):
+    """同 baseline.update"""
+    try:
+        if baseline.table_exists() is None:
+            cur = await conn.execute(baseline.CHECK_TABLE_SQL)
+            baseline.set_table_exists((await cur.fetchone())[0])
+        if not baseline.table_exists():
+            return None
+        cur = await conn.execute(baseline.UPDATE_SQL, baseline.update_params(duration_seconds, **pg_params))
+        reason = (await cur.fetchone())[0]
+    except Exception as e:
+        logger.warning(f"baseline: {pg_params['mapping_name']} update failed: {e}")
+        return None
+    if reason:
+        logger.warning(f"baseline: {pg_params['mapping_name']} slower than baseline, {reason}.")
+    return reason
+
+
+async def acquire_lock(conn, key, policy='skip', wait_minutes=10):
+    """同 run_lock.acquire"""
+    async def try_lock():
+        cur = await conn.execute('select pg_try_advisory_lock(%s)', (key,))
+        return (await cur.fetchone())[0]
+
+    if await try_lock():
+        return True
+    if policy != 'wait':
+        return False
+    deadline = time.time() + wait_minutes * 60
+    interval = 1
+    while time.time() < deadline:
+        await asyncio.sleep(min(interval, max(deadline - time.time(), 0)))
+        if await try_lock():
+            return True
+        interval = min(interval * 2, 60)
+    return False
+
+
+async def release_lock(conn, key):
+    try:
+        await conn.execute('select pg_advisory_unlock(%s)', (key,))
+    except Exception as e:
+        logger.warning(f"advisory unlock failed, close connection: {e}")
+        await conn.close()
+
+
+async def watch_step(conn, timeout, fired, grace_seconds=30, **pg_params):
+    """同 watchdog.StepWatchdog：到期取消正在执行的语句，宽限期后终止后端"""
+    await asyncio.sleep(timeout)
+    fired.append(True)
+    pid = conn.info.backend_pid
+    logger.warning(f"step timeout after {timeout}s, cancel backend {pid}.")
+    try:
+        await conn.cancel_safe()
+    except Exception as e:
+        logger.error(f"cancel backend {pid} failed: {e}")
+    await asyncio.sleep(grace_seconds)
+    logger.warning(f"backend {pid} still running after cancel, terminate it.")
+    await asyncio.to_thread(watchdog.terminate_backend, pid, **pg_params)
+
+
+async def call_sql_file(file_name, pool, options=None, **pg_params):
+    """执行单个sql文件并记录etl_log，返回执行状态；options 同 executor.call_sql_file(instrument 除外)"""
+    with log_format.log_context(run_id=pg_params.get('run_id'), step=sql_list.get_mapping_name(file_name),
+                                window=log_format.window(**pg_params)):
+        return await execute_sql_file(file_name, pool, options, **pg_params)
+
+
+async def execute_sql_file(file_name, pool, options=None, **pg_params):
+    options = options or {}
+    lock_policy = run_lock.check_policy(options.get('lock'))
+
+    mapping_name = sql_list.get_mapping_name(file_name)
+    pg_params['mapping_name'] = mapping_name
+    pg_params['status'] = executor.STATUS_FAILED
+    if executor.is_true(options.get('instrument')):
+        logger.warning(f"sql: {file_name} instrument is not supported by async engine, ignored.")
+    if options.get('export') or load.is_load_step(file_name):
+        error_info = 'export/load step is not supported by async engine'
+        logger.error(f"sql: {file_name} {error_info}.")
+        await log_sql_files([(file_name, error_info)], executor.STATUS_FAILED, pool, **pg_params)
+        executor.observe_step(mapping_name, executor.STATUS_FAILED, error_class='NotSupported')
+        return executor.STATUS_FAILED
+    if executor.get_float(options, 'chunks', 1) > 1:
+        logger.warning(f"sql: {file_name} chunks is not supported by async engine, run as one transaction.")
+
+    try:
+        conn = await pool.getconn()
+    except Exception as e:
+        alert.warn('database:connection', f"数据库连接异常：{e}")
+        return executor.STATUS_FAILED
+
+    lock_key = None
+    if lock_policy != 'none':
+        lock_key = run_lock.lock_key(**pg_params)
+        lock_begin = time.perf_counter()
+        try:
+            locked = await acquire_lock(conn, lock_key, lock_policy,
+                                        executor.get_float(options, 'lock_wait_minutes', 10))
+        except Exception as e:
+            logger.error(f"sql: {file_name} lock failed: {e}")
+            locked = False
+        executor.LOCK_WAIT_SECONDS.labels(lock_policy).observe(time.perf_counter() - lock_begin)
+        if not locked:
+            await pool.putconn(conn)
+            status = executor.STATUS_LOCK_SKIPPED if lock_policy == 'skip' else executor.STATUS_LOCK_FAILED
+            error_info = f"step is running in another process, lock policy: {lock_policy}"
+            logger.info(f"sql: {file_name} not executed, {error_info}.")
+            await log_sql_files([(file_name, error_info)], status, pool, **pg_params)
+            if status == executor.STATUS_LOCK_FAILED:
+                alert.warn(f"{mapping_name}:lock", f"ETL执行异常，sql：{file_name}，{error_info}")
+            executor.observe_step(mapping_name, status)
+            return status
+    lock_conn = conn
+    lock_released = False
+
+    pg_params['change_signature'] = None
+    pg_params['change_window'] = change_check.window_key(options, **pg_params)
+    if options.get('sources'):
+        pg_params['change_signature'], unchanged = await check_sources(conn, mapping_name, options,
+                                                                       pg_params['change_window'])
+        if unchanged:
+            if lock_key is not None:
+                await release_lock(conn, lock_key)
+            await pool.putconn(conn)
+            error_info = 'sources unchanged since last success'
+            logger.info(f"sql: {file_name} skipped, {error_info}.")
+            await log_sql_files([(file_name, error_info)], executor.STATUS_UNCHANGED, pool, **pg_params)
+            return executor.STATUS_UNCHANGED
+
+    log_success = False
+    watch_task = None
+    step_begin = None
+    error_class = None
+    try:
+        log_sql = await get_log_sql(conn)
+        # 没有日志函数时 DO 块的结束时间只能由客户端传入，结束日志在步骤完成后单独写入
+        end_log_sql = LOG_FUNCTION_END_CALL if log_sql == etl_log.LOG_FUNCTION_CALL else None
+        pg_params['log_start_time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        pg_params['log_end_time'] = None
+        pg_params['status'] = executor.STATUS_RUNNING
+        pg_params['error_info'] = ''
+        log_success = True
+        logger.info(f"sql: {file_name} execution start.")
+        step_begin = time.perf_counter()
+        timeout = executor.get_float(options, 'timeout')
+        fired = []
+        try:
+            sql = etl_log.read_sql_file(file_name)
+            if timeout:
+                watch_task = asyncio.create_task(watch_step(conn, timeout, fired, **pg_params))
+            step_error = None
+            async with conn.pipeline() as pipeline:
+                cur = conn.cursor()
+                await cur.execute(log_sql, pg_params)
+                await pipeline.sync()
+                # 第二批：sync 之前的语句在同一个隐式事务中，任一语句失败全部回滚；
+                # 异常在块内捕获，退出 pipeline 时不再处理已中止的批次
+                try:
+                    if timeout:
+                        await cur.execute(watchdog.statement_timeout_sql(timeout))
+                    for statement in statements.split_statements(sql):
+                        await cur.execute(statement, pg_params)
+                    if pg_params['change_signature']:
+                        await cur.execute(change_check.SAVE_SIGNATURE_SQL, pg_params)
+                    if end_log_sql:
+                        await cur.execute(end_log_sql, dict(pg_params, status=executor.STATUS_SUCCESS))
+                        if lock_key is not None:
+                            await cur.execute('select pg_advisory_unlock(%s)', (lock_key,))
+                            lock_released = True
+                    await pipeline.sync()
+                except psycopg.Error as e:
+                    step_error = e
+            if step_error is not None:
+                raise step_error
+            pg_params['status'] = executor.STATUS_SUCCESS
+            step_seconds = time.perf_counter() - step_begin
+            logger.info(f"sql: {file_name} executed successfully.", extra={'duration': step_seconds})
+        except Exception as e:
+            lock_released = False
+            log_success = False
+            error_class = type(e).__name__
+            pg_params['error_info'] = str(e)
+            if fired or isinstance(e, psycopg.errors.QueryCanceled):
+                pg_params['status'] = executor.STATUS_TIMEOUT
+                # 外部或服务端取消(未设置超时)时不加超时前缀
+                if timeout:
+                    pg_params['error_info'] = f"timeout after {timeout}s: {pg_params['error_info']}"
+                logger.info(f"sql: {file_name} execution timeout, cancelled.",
+                            extra={'duration': time.perf_counter() - step_begin})
+            else:
+                pg_params['status'] = executor.STATUS_FAILED
+                logger.info("sql: %s execution failed." % file_name,
+                            extra={'duration': time.perf_counter() - step_begin})
+            # 被终止的连接不能再写日志，换一个连接
+            if conn.closed or conn.broken:
+                await pool.putconn(conn)
+                conn = None
+                conn = await pool.getconn()
+            end_log_sql = None
+        finally:
+            if watch_task is not None:
+                watch_task.cancel()
+
+        # 记录ETL的结束日志(成功且有日志函数时已随步骤写入)
+        if end_log_sql is None:
+            pg_params['log_end_time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            await conn.execute(log_sql, pg_params)
+        if pg_params['status'] == executor.STATUS_SUCCESS:
+            await update_baseline(conn, step_seconds, **pg_params)
+    except Exception as e:
+        log_success = False
+        error_class = error_class or type(e).__name__
+        if pg_params['status'] == executor.STATUS_RUNNING:
+            pg_params['status'] = executor.STATUS_FAILED
+        logger.error(f"etl执行失败: {e}.")
+    finally:
+        if conn is not None:
+            # 连接被终止时锁已由数据库释放
+            if lock_key is not None and not lock_released and lock_conn is conn and not conn.closed:
+                await release_lock(conn, lock_key)
+            await pool.putconn(conn)
+        if pg_params['status'] == executor.STATUS_TIMEOUT:
+            alert.warn(f"{mapping_name}:timeout", f"ETL执行超时，sql：{file_name}")
+        elif not log_success:
+            alert.warn(f"{mapping_name}:{error_class or 'failed'}", f"ETL执行异常，sql：{file_name}")
+        executor.observe_step(mapping_name, pg_params['status'],
+                              None if step_begin is None else time.perf_counter() - step_begin, error_class)
+    return pg_params['status']
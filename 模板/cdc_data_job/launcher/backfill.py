@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from launcher import executor
+from utils import common
+
+logger = common.get_logger(__name__)
+
+# 周期粒度：(步长, 日期格式)，日期格式与 start_etl.sh 中的 begin_date/end_date 一致
+GRAINS = {
+    'hour': (datetime.timedelta(hours=1), '%Y-%m-%d %H:00:00'),
+    'day': (datetime.timedelta(days=1), '%Y-%m-%d'),
+}
+
+
+def parse_date(value):
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"backfill: invalid date: {value}")
+
+
+def split_windows(begin_date, end_date, grain='hour'):
+    """将 [begin_date, end_date) 按粒度拆分为周期列表 [(begin_date, end_date), ...]"""
+    if grain not in GRAINS:
+        raise ValueError(f"backfill: invalid grain: {grain}, expected one of {','.join(GRAINS)}")
+    step, fmt = GRAINS[grain]
+    begin, end = parse_date(begin_date), parse_date(end_date)
+    # 周期按日期格式输出，未对齐到粒度的时间会被截断
+    for value in (begin, end):
+        if datetime.datetime.strptime(value.strftime(fmt), fmt) != value:
+            raise ValueError(f"backfill: {value} is not aligned to grain {grain}")
+    windows = []
+    while begin < end:
+        window_end = min(begin + step, end)
+        windows.append((begin.strftime(fmt), window_end.strftime(fmt)))
+        begin = window_end
+    return windows
+
+
+# --------------------------------
+# 跨周期串行控制
+# --------------------------------
+# sql_list 中带 window_sequential=1 选项的步骤，须等上一个周期的同一步骤结束后才能执行，
+# 上一个周期该步骤未成功时，本周期该步骤跳过
+class WindowGate(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self._results = {}
+        # 已结束的周期：结束后没有结果的步骤(如 call_sql_files 抛出异常)不会再有人放行
+        self._finished = set()
+
+    def _event(self, index, name):
+        with self._lock:
+            return self._events.setdefault((index, name), threading.Event())
+
+    def for_window(self, index):
+        return _WindowGateView(self, index)
+
+    def finish_window(self, index, results):
+        """周期结束时放行未经过 run_step 的步骤(断点续跑跳过、依赖失败等)"""
+        for name, status in results.items():
+            self.leave(index, name, status)
+        with self._lock:
+            self._finished.add(index)
+            names = [key[1] for key in self._events if key[0] == index]
+        for name in names:
+            self.leave(index, name, executor.STATUS_FAILED)
+
+    def enter(self, index, step):
+        if index == 0 or not is_window_sequential(step):
+            return True
+        key = (index - 1, step['mapping_name'])
+        with self._lock:
+            if index - 1 in self._finished and key not in self._results:
+                return False
+            event = self._events.setdefault(key, threading.Event())
+        event.wait()
+        return self._results.get(key) in executor.SUCCESS_STATUSES
+
+    def leave(self, index, name, status):
+        event = self._event(index, name)
+        with self._lock:
+            if event.is_set():
+                return
+            self._results[(index, name)] = status
+        event.set()
+
+
+class _WindowGateView(object):
+    """某一个周期使用的 gate，传给 executor.call_sql_files"""
+
+    def __init__(self, gate, index):
+        self.gate = gate
+        self.index = index
+
+    def enter(self, step):
+        return self.gate.enter(self.index, step)
+
+    def leave(self, step, status):
+        self.gate.leave(self.index, step['mapping_name'], status)
+
+
+def is_window_sequential(step):
+    return executor.is_true(step['options'].get('window_sequential'))
+
+
+def run_backfill(sql_list_file_name, pool, grain='hour', window_workers=1, workers=1, resume=False, force=None,
+                 options=None, downstream_of=None, **pg_params):
+    windows = split_windows(pg_params['begin_date'], pg_params['end_date'], grain)
+    logger.info(f"backfill: {sql_list_file_name} {pg_params['begin_date']} ~ {pg_params['end_date']}, "
+                f"{len(windows)} {grain} windows, {window_workers} in flight.")
+    gate = WindowGate()
+
+    def run_window(index, window):
+        window_params = dict(pg_params)
+        window_params['begin_date'], window_params['end_date'] = window
+        window_params['parameter_values'] = f"begin_date={window[0]},end_date={window[1]}"
+        results = {}
+        try:
+            results = executor.call_sql_files(sql_list_file_name, pool=pool, workers=workers, resume=resume,
+                                              force=force, gate=gate.for_window(index), options=options,
+                                              downstream_of=downstream_of, **window_params)
+        finally:
+            gate.finish_window(index, results)
+        return results
+
+    start = time.time()
+    # 按周期顺序提交，保证前一个周期总是先开始执行
+    with ThreadPoolExecutor(max_workers=max(window_workers, 1), thread_name_prefix='backfill') as thread_pool:
+        futures = [thread_pool.submit(run_window, index, window) for index, window in enumerate(windows)]
+        window_results = []
+        for window, future in zip(windows, futures):
+            try:
+                window_results.append((window, future.result()))
+            except Exception as e:
+                logger.error(f"backfill: window {window[0]} failed: {e}")
+                window_results.append((window, {}))
+    elapsed = time.time() - start
+
+    summary = summarize(window_results, elapsed)
+    logger.info(f"backfill summary: {summary}")
+    return summary
+
+
+def summarize(window_results, elapsed):
+    steps = [status for _, results in window_results for status in results.values()]
+    failed_windows = [window[0] for window, results in window_results
+                      if not results or any(status not in executor.SUCCESS_STATUSES for status in results.values())]
+    success = sum(1 for status in steps if status in executor.SUCCESS_STATUSES)
+    return {
+        'windows': len(window_results),
+        'failed_windows': failed_windows,
+        'steps': len(steps),
+        'steps_success': success,
+        'steps_failed': len(steps) - success,
+        'elapsed_seconds': round(elapsed, 1),
+        'windows_per_minute': round(len(window_results) / elapsed * 60, 1) if elapsed > 0 else None,
+    }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from service import alert
+from utils import common
+
+logger = common.get_logger(__name__)
+
+# 基线配置
+config = {
+    'window': 30,  # 计算 p50/p95、趋势的最近成功次数
+    'alpha': 0.2,  # EWMA 的权重，越大越偏向最近的耗时
+    'k': 2.0,  # 耗时超过 k 倍 p95(不含本次)视为变慢
+    'trend': 0.5,  # 最近 window 次耗时的增长趋势超过 p50 的该比例视为持续变慢
+    'min_samples': 10,  # 成功次数达到该值后才判断
+}
+
+CHECK_TABLE_SQL = "select to_regclass('public.etl_step_baseline') is not null"
+
+# 一条语句完成：读取上一次的统计(行锁)，追加本次耗时，重新计算 p50/p95、EWMA、趋势，判断是否变慢
+UPDATE_SQL = """
+with old as (
+    select b.sample_count, b.recent_seconds, b.ewma_seconds, b.p95_seconds
+    from public.etl_step_baseline b
+    where b.etl_name = %(mapping_name)s
+    for update
+), new as (
+    select
+         coalesce(o.sample_count, 0) old_sample_count
+        ,o.p95_seconds old_p95_seconds
+        ,coalesce(o.sample_count, 0) + 1 sample_count
+        ,(coalesce(o.recent_seconds, '{}') || %(duration_seconds)s::numeric)
+            [greatest(coalesce(cardinality(o.recent_seconds), 0) + 2 - %(baseline_window)s, 1):] recent_seconds
+        ,coalesce(o.ewma_seconds + %(baseline_alpha)s * (%(duration_seconds)s - o.ewma_seconds),
+                  %(duration_seconds)s) ewma_seconds
+    from (select 1) x
+    left join old o on true
+), stats as (
+    select
+         n.*
+        ,(select percentile_cont(0.5) within group (order by s) from unnest(n.recent_seconds) s) p50_seconds
+        ,(select percentile_cont(0.95) within group (order by s) from unnest(n.recent_seconds) s) p95_seconds
+    from new n
+), trend as (
+    -- Theil-Sen 斜率(两两耗时斜率的中位数，个别异常的耗时不影响)在窗口内的增长量，相对 p50
+    select
+         t.*
+        ,(select percentile_cont(0.5) within group (order by (b.v - a.v) / (b.i - a.i))
+          from unnest(t.recent_seconds) with ordinality a(v, i)
+          join unnest(t.recent_seconds) with ordinality b(v, i) on b.i > a.i)
+         * (cardinality(t.recent_seconds) - 1) / nullif(t.p50_seconds, 0) trend
+    from stats t
+)
+insert into public.etl_step_baseline
+(etl_name, sample_count, recent_seconds, last_seconds, ewma_seconds, p50_seconds, p95_seconds, trend,
+ regression_reason, last_etl_log_id, last_run_id, update_datetime)
+select
+     %(mapping_name)s
+    ,sample_count
+    ,recent_seconds
+    ,%(duration_seconds)s
+    ,ewma_seconds
+    ,p50_seconds
+    ,p95_seconds
+    ,round(trend::numeric, 4)
+    ,case when old_sample_count >= %(baseline_min_samples)s
+               and %(duration_seconds)s > %(baseline_k)s * old_p95_seconds
+          then format('耗时 %%s 秒，超过 %%s 倍 p95(%%s 秒)', %(duration_seconds)s, %(baseline_k)s, old_p95_seconds)
+          when sample_count >= %(baseline_min_samples)s and trend >= %(baseline_trend)s
+          then format('最近 %%s 次耗时持续增长 %%s%%%%，p50 %%s 秒', cardinality(recent_seconds),
+                      round(trend::numeric * 100), round(p50_seconds::numeric, 3))
+     end
+    ,%(etl_log_id)s
+    ,%(run_id)s
+    ,localtimestamp
+from trend
+on conflict (etl_name)
+do update set
+     sample_count = excluded.sample_count
+    ,recent_seconds = excluded.recent_seconds
+    ,last_seconds = excluded.last_seconds
+    ,ewma_seconds = excluded.ewma_seconds
+    ,p50_seconds = excluded.p50_seconds
+    ,p95_seconds = excluded.p95_seconds
+    ,trend = excluded.trend
+    ,regression_reason = excluded.regression_reason
+    ,last_etl_log_id = excluded.last_etl_log_id
+    ,last_run_id = excluded.last_run_id
+    ,update_datetime = excluded.update_datetime
+returning regression_reason
+"""
+
+# 本次运行中变慢的步骤
+REGRESSIONS_SQL = """
+select etl_name, regression_reason
+from public.etl_step_baseline
+where last_run_id = %(run_id)s
+and last_etl_log_id = any(%(ids)s)
+and regression_reason is not null
+order by etl_name
+"""
+
+# 监控使用的基线(成功次数足够的步骤)
+BASELINES_SQL = """
+select etl_name, p95_seconds
+from public.etl_step_baseline
+where sample_count >= %(baseline_min_samples)s
+and p95_seconds > 0
+"""
+
+_table = {}  # 'exists' -> 基线表是否存在，每个进程只检查一次
+
+
+# --------------------------------
+# 步骤耗时基线
+# --------------------------------
+# 库中已创建 public.etl_step_baseline(etl/ddl/etl_step_baseline.sql)时启用：步骤成功后(跳过的步骤除外)
+# 增量更新该步骤最近 window 次的耗时统计；本次耗时超过 k 倍 p95，或最近 window 次耗时持续增长时记录原因，
+# sql_list 结束时汇总本次变慢的步骤写日志并告警，常驻监控对执行中超过 k 倍 p95 的步骤告警
+def table_exists():
+    """基线表是否存在，未检查时返回 None"""
+    return _table.get('exists')
+
+
+def set_table_exists(exists):
+    _table['exists'] = exists
+    if not exists:
+        logger.info("baseline: table public.etl_step_baseline not found, disabled.")
+
+
+def etl_log_id(**pg_params):
+    return f"{pg_params.get('begin_date') or ''}_{pg_params['mapping_name']}"
+
+
+def update_params(duration_seconds, **pg_params):
+    params = {'baseline_' + key: value for key, value in config.items()}
+    params.update(mapping_name=pg_params['mapping_name'], run_id=pg_params.get('run_id'),
+                  duration_seconds=round(duration_seconds, 3), etl_log_id=etl_log_id(**pg_params))
+    return params
+
+
+def regressions_params(names, **pg_params):
+    return {'run_id': pg_params.get('run_id'),
+            'ids': [etl_log_id(**dict(pg_params, mapping_name=name)) for name in names]}
+
+
+def update(conn, duration_seconds, **pg_params):
+    """conn 为自动提交的连接；返回变慢的原因，没有变慢或未启用时返回 None，失败只记录日志"""
+    try:
+        with conn.cursor() as cur:
+            if table_exists() is None:
+                cur.execute(CHECK_TABLE_SQL)
+                set_table_exists(cur.fetchone()[0])
+            if not table_exists():
+                return None
+            cur.execute(UPDATE_SQL, update_params(duration_seconds, **pg_params))
+            reason = cur.fetchone()[0]
+    except Exception as e:
+        logger.warning(f"baseline: {pg_params['mapping_name']} update failed: {e}")
+        return None
+    if reason:
+        logger.warning(f"baseline: {pg_params['mapping_name']} slower than baseline, {reason}.")
+    return reason
+
+
+def get_regressions(pool, names, **pg_params):
+    """返回 {步骤名: 原因}，本次运行中成功但比基线慢的步骤"""
+    if not table_exists() or not names:
+        return {}
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(REGRESSIONS_SQL, regressions_params(names, **pg_params))
+            rows = cur.fetchall()
+        conn.commit()
+        return dict(rows)
+    except Exception as e:
+        logger.warning(f"baseline: query regressions failed: {e}")
+        if not conn.closed:
+            conn.rollback()
+        return {}
+    finally:
+        pool.putconn(conn)
+
+
+def report(sql_list_file_name, regressions):
+    if not regressions:
+        return
+    lines = [f"{name}：{reason}" for name, reason in regressions.items()]
+    logger.warning(f"sql_list: {sql_list_file_name} slow steps: {'; '.join(lines)}")
+    alert.warn(f"{sql_list_file_name}:slow", f"ETL步骤变慢，sql_list：{sql_list_file_name}\n" + '\n'.join(lines))
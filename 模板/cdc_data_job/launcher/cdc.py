@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import select
+import threading
+import time
+
+import psycopg2
+import yaml
+from psycopg2 import errors
+from psycopg2.extras import Json, LogicalReplicationConnection, execute_values
+
+from service import alert
+from utils import common, pgoutput
+
+logger = common.get_logger(__name__)
+
+# 变更操作类型
+OPS = {'insert': 'I', 'update': 'U', 'delete': 'D', 'truncate': 'T'}
+
+
+def load_config(config_file):
+    """读取 CDC 配置，见 resource/cdc.yml"""
+    with open(config_file, encoding='utf-8', mode='r') as f:
+        conf = yaml.safe_load(f) or {}
+    return {'slot_name': conf.get('slot_name', 'etl_cdc'), 'publication': conf.get('publication', 'etl_cdc'),
+            'tables': conf.get('tables') or [], 'batch_rows': int(conf.get('batch_rows', 1000)),
+            'flush_seconds': float(conf.get('flush_seconds', 5)), 'status_interval': float(conf.get('status_interval', 10))}
+
+
+def ensure_publication(conn, publication, tables):
+    with conn.cursor() as cur:
+        cur.execute('select 1 from pg_publication where pubname = %s', (publication,))
+        exists = cur.fetchone() is not None
+        if not exists:
+            if not tables:
+                raise ValueError(f"cdc: publication {publication} does not exist and no tables configured")
+            logger.info(f"cdc: create publication {publication} for {','.join(tables)}.")
+            cur.execute(f"create publication {publication} for table {','.join(tables)}")
+    conn.commit()
+
+
+def get_offset(conn, slot_name):
+    """已写入变更日志表的最后 lsn，没有时为 0(从复制槽已确认的位置开始)"""
+    with conn.cursor() as cur:
+        cur.execute('select lsn::text from public.etl_cdc_offset where slot_name = %s', (slot_name,))
+        row = cur.fetchone()
+    conn.commit()
+    return pgoutput.parse_lsn(row[0]) if row and row[0] else 0
+
+
+# --------------------------------
+# 逻辑复制采集
+# --------------------------------
+# 从逻辑复制槽(pgoutput)读取已提交事务的插入、更新、删除、清空，按批写入 public.etl_cdc_changelog，
+# 同一事务内更新 public.etl_cdc_offset，提交后再向复制槽确认 lsn；
+# 重启或断线重连时从复制槽已确认的位置重新读取，位点表中已写入的事务跳过，不会重复写入
+class ChangeReader(object):
+
+    def __init__(self, config, pool, **pg_params):
+        self.config = config
+        self.pool = pool
+        self.pg_params = pg_params
+        self._stop = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.relations = {}
+        self.current = None  # 未提交的事务：{'xid', 'commit_time', 'rows'}
+        self.ready = []  # 已提交、待写入的变更
+        self.ready_lsn = None  # 待写入的最后一个事务的结束 lsn
+        self.idle_lsn = 0  # 没有待写入的变更时可以直接确认的 lsn(无变更的事务、服务端 wal 位置)
+        self.confirmed_lsn = 0
+        self.first_ready_time = None
+        self.retry_time = 0
+        self.failures = 0
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        interval = 1
+        while not self._stop.is_set():
+            try:
+                self.run()
+                interval = 1
+            except Exception as e:
+                logger.error(f"cdc: replication failed, reconnect in {interval}s: {e}")
+                alert.warn('cdc:replication', f"CDC采集异常，复制槽：{self.config['slot_name']}，{e}")
+                self._stop.wait(interval)
+                interval = min(interval * 2, 60)
+
+    def connect_replication(self):
+        return psycopg2.connect(host=self.pg_params['pg_host'],
+                                port=self.pg_params['pg_port'],
+                                dbname=self.pg_params['pg_dbname'],
+                                user=self.pg_params['pg_user'],
+                                password=self.pg_params['pg_password'],
+                                connection_factory=LogicalReplicationConnection)
+
+    def run(self):
+        self._reset()
+        slot_name = self.config['slot_name']
+        conn = self.pool.getconn()
+        try:
+            ensure_publication(conn, self.config['publication'], self.config['tables'])
+            self.offset = get_offset(conn, slot_name)
+        finally:
+            self.pool.putconn(conn)
+
+        repl_conn = self.connect_replication()
+        try:
+            cur = repl_conn.cursor()
+            try:
+                cur.create_replication_slot(slot_name, output_plugin='pgoutput')
+                logger.info(f"cdc: replication slot {slot_name} created.")
+            except errors.DuplicateObject:
+                pass
+            cur.start_replication(slot_name=slot_name, decode=False, start_lsn=self.offset,
+                                  status_interval=self.config['status_interval'],
+                                  options={'proto_version': '1', 'publication_names': self.config['publication']})
+            logger.info(f"cdc: replication from slot {slot_name} started, offset {pgoutput.format_lsn(self.offset)}.")
+            while not self._stop.is_set():
+                msg = cur.read_message()
+                if msg is not None:
+                    self.handle(pgoutput.parse_message(msg.payload))
+                else:
+                    select.select([cur], [], [], self._wait_seconds())
+                    # 空闲时服务端 keepalive 的 wal 位置也可确认(未发布表、本进程写变更日志表产生的 wal)
+                    if self.current is None and self.ready_lsn is None:
+                        self.idle_lsn = max(self.idle_lsn, cur.wal_end or 0)
+                if self._flush_due():
+                    self.flush(cur)
+                self._confirm_idle(cur)
+            # 停止前写入已提交的变更
+            if self.ready_lsn is not None:
+                self.flush(cur)
+        finally:
+            repl_conn.close()
+
+    def _wait_seconds(self):
+        if self.first_ready_time is None:
+            return 1
+        due = max(self.first_ready_time + self.config['flush_seconds'], self.retry_time)
+        return min(max(due - time.time(), 0), 1)
+
+    def _flush_due(self):
+        if self.ready_lsn is None or time.time() < self.retry_time:
+            return False
+        return (len(self.ready) >= self.config['batch_rows']
+                or time.time() - self.first_ready_time >= self.config['flush_seconds'])
+
+    def handle(self, message):
+        kind = message['type']
+        if kind == 'begin':
+            self.current = {'xid': message['xid'], 'commit_time': message['commit_time'], 'rows': []}
+        elif kind == 'relation':
+            self.relations[message['relation_id']] = message
+        elif kind in ('insert', 'update', 'delete'):
+            relation = self.relations[message['relation_id']]
+            key_values = message['old'] if message['old'] is not None else message['new']
+            if kind == 'delete':
+                row_data = row_dict(relation, message['old'], key_only=message['old_key_only'])
+            else:
+                row_data = row_dict(relation, message['new'])
+            self.current['rows'].append((relation, OPS[kind], row_dict(relation, key_values, key_only=True), row_data))
+        elif kind == 'truncate':
+            for relation_id in message['relation_ids']:
+                self.current['rows'].append((self.relations[relation_id], 'T', None, None))
+        elif kind == 'commit':
+            current, self.current = self.current, None
+            # 位点表中已写入的事务(重启后复制槽重发)跳过
+            if message['end_lsn'] <= self.offset:
+                return
+            # 没有变更的事务(PG15 以前未发布表的事务、本进程写位点表的事务)不写入；没有待写入的变更时直接确认
+            if not current['rows']:
+                if self.ready_lsn is None:
+                    self.idle_lsn = max(self.idle_lsn, message['end_lsn'])
+                return
+            lsn = pgoutput.format_lsn(message['commit_lsn'])
+            for relation, op, key_data, row_data in current['rows']:
+                self.ready.append((self.config['slot_name'], lsn, current['xid'], current['commit_time'],
+                                   relation['schema'], relation['table'], op, key_data, row_data))
+            self.ready_lsn = message['end_lsn']
+            if self.first_ready_time is None:
+                self.first_ready_time = time.time()
+
+    def _confirm_idle(self, cur):
+        """没有待写入、未提交的变更时确认 idle_lsn，复制槽不再保留之后的 wal；由 status_interval 控制发送频率"""
+        if self.current is not None or self.ready_lsn is not None or self.idle_lsn <= self.confirmed_lsn:
+            return
+        cur.send_feedback(flush_lsn=self.idle_lsn)
+        self.confirmed_lsn = self.idle_lsn
+
+    def flush(self, cur):
+        """写入一批变更并更新位点，提交后确认 lsn；失败时保留本批，退避后重试"""
+        sql = """
+            insert into public.etl_cdc_changelog
+            (slot_name, lsn, xid, commit_datetime, schema_name, table_name, op, key_data, row_data)
+            values %s
+            """
+        offset_sql = """
+            insert into public.etl_cdc_offset (slot_name, lsn, update_datetime)
+            values (%(slot_name)s, %(lsn)s, localtimestamp)
+            on conflict (slot_name)
+            do update set lsn = excluded.lsn, update_datetime = excluded.update_datetime
+            """
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as write_cur:
+                if self.ready:
+                    rows = [row[:7] + tuple(None if value is None else Json(value) for value in row[7:]) for row in self.ready]
+                    execute_values(write_cur, sql, rows, page_size=1000)
+                write_cur.execute(offset_sql, {'slot_name': self.config['slot_name'],
+                                               'lsn': pgoutput.format_lsn(self.ready_lsn)})
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.failures += 1
+            self.retry_time = time.time() + min(2 ** self.failures, 60)
+            logger.error(f"cdc: write {len(self.ready)} changes failed: {e}")
+            alert.warn('cdc:apply', f"CDC变更写入异常，复制槽：{self.config['slot_name']}，{e}")
+            return
+        finally:
+            self.pool.putconn(conn)
+        logger.info(f"cdc: {len(self.ready)} changes written, lsn {pgoutput.format_lsn(self.ready_lsn)}.")
+        cur.send_feedback(flush_lsn=self.ready_lsn, force=True)
+        self.confirmed_lsn = max(self.confirmed_lsn, self.ready_lsn)
+        self.offset = self.ready_lsn
+        self.ready = []
+        self.ready_lsn = None
+        self.first_ready_time = None
+        self.failures = 0
+
+
+def row_dict(relation, values, key_only=False):
+    if values is None:
+        return None
+    row = {}
+    for column, value in zip(relation['columns'], values):
+        if key_only and not column['key']:
+            continue
+        if value is pgoutput.UNCHANGED_TOAST:
+            continue
+        row[column['name']] = value.hex() if isinstance(value, bytes) else value
+    return row
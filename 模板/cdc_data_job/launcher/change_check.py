@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import re
+
+from utils import common
+
+logger = common.get_logger(__name__)
+
+# 源表变更的判断方式
+CHANGE_CHECKS = ('stats', 'max', 'checksum')
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+# 步骤成功时与步骤 sql 在同一事务内保存本次执行前取到的指标
+SAVE_SIGNATURE_SQL = """
+insert into public.etl_change_state (etl_name, etl_window, signature, run_id, update_datetime)
+values (%(mapping_name)s, %(change_window)s, %(change_signature)s, %(run_id)s, localtimestamp)
+on conflict (etl_name, etl_window)
+do update set signature = excluded.signature, run_id = excluded.run_id, update_datetime = excluded.update_datetime
+"""
+
+
+# --------------------------------
+# 源表变更检查
+# --------------------------------
+# 步骤选项 sources=dw.a,dw.b 声明源表，执行前一次查询取各源表的变更指标，与上次成功时保存在
+# public.etl_change_state 的值相同则跳过步骤(etl_log.status=6)。保存的值默认只按步骤区分，每小时(或每个微批)
+# 的新周期与上一周期比较；结果只随周期参数变化的步骤加 change_window=1，按步骤 + 周期保存：
+#   stats    pg_stat_user_tables 的插入/更新/删除行数 + relfilenode(truncate、重写表时变化)，不扫描表(默认)；
+#            统计信息不随事务可见，上游刚提交的写入可能延迟数秒才计入，源表由同一 sql_list 中前面的步骤写入时
+#            应改用 max 或 checksum
+#   max      max(change_column)，如 update_time，有索引时只读索引一端；不能发现删除(写了 change_column 时默认)
+#   checksum 行数 + 各行文本哈希之和，全表扫描，与行顺序无关，只能显式指定，用于小表
+# 取不到指标(表不存在、分区父表、统计信息被重置前没有记录等)时视为有变化，步骤照常执行
+def parse_sources(value):
+    sources = [source.strip() for source in value.split(',') if source.strip()]
+    for source in sources:
+        if not all(IDENTIFIER.match(part) for part in source.split('.')) or source.count('.') > 1:
+            raise ValueError(f"change check: invalid source table '{source}'")
+    return sources
+
+
+def indicator_sql(source, method, column=None):
+    """一个源表的变更指标子查询，结果为 text"""
+    if method == 'stats':
+        # 分区父表没有 relfilenode，结果为 null
+        return ("(select n_tup_ins || '/' || n_tup_upd || '/' || n_tup_del || '/' || pg_relation_filenode(relid) "
+                "from pg_stat_user_tables where relid = to_regclass(%s))"), [source]
+    if method == 'max':
+        if not column or not IDENTIFIER.match(column):
+            raise ValueError(f"change check: invalid change_column '{column}'")
+        return f"(select max({column})::text from {source})", []
+    if method == 'checksum':
+        return f"(select count(*) || '/' || coalesce(sum(hashtext(t::text)::bigint), 0) from {source} t)", []
+    raise ValueError(f"change check: unknown method '{method}', expected one of {','.join(CHANGE_CHECKS)}")
+
+
+def window_key(options, begin_date=None, end_date=None, **kwargs):
+    """保存签名的周期：默认为空(只按步骤)，步骤选项 change_window=1 时为 begin_date ~ end_date"""
+    if str(options.get('change_window')).lower() not in ('1', 'true', 'yes'):
+        return ''
+    return f"{begin_date or ''} ~ {end_date or ''}"
+
+
+def check_query(mapping_name, options, window=''):
+    """返回 (sql, params, sources)：一次查询各源表的指标数组和上次成功时保存的签名"""
+    sources = parse_sources(options['sources'])
+    column = options.get('change_column')
+    method = options.get('change_check') or ('max' if column else 'stats')
+    items, params = [], []
+    for source in sources:
+        item_sql, item_params = indicator_sql(source, method, column)
+        items.append(item_sql)
+        params.extend(item_params)
+    sql = (f"select array[{', '.join(items)}]::text[], "
+           "(select signature from public.etl_change_state where etl_name = %s and etl_window = %s)")
+    return sql, params + [mapping_name, window], sources
+
+
+def compare(row, sources):
+    """返回 (本次签名, 是否未变化)；有取不到的指标时签名为 None"""
+    values, saved = row
+    if any(value is None for value in values):
+        return None, False
+    signature = ';'.join(f"{source}={value}" for source, value in zip(sources, values))
+    return signature, signature == saved
+
+
+def check(conn, mapping_name, options, window=''):
+    """检查源表在上次成功后是否变化，返回 (本次签名, 是否未变化)；检查失败时返回 (None, False)，步骤照常执行"""
+    try:
+        sql, params, sources = check_query(mapping_name, options, window)
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            row = cur.fetchone()
+        if not conn.autocommit:
+            conn.commit()
+        return compare(row, sources)
+    except Exception as e:
+        if not conn.closed and not conn.autocommit:
+            conn.rollback()
+        logger.warning(f"change check: {mapping_name} failed, step will run: {e}")
+        return None, False
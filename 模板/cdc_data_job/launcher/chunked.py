@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+import hashlib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+from psycopg2 import errors
+
+from launcher import backfill, lineage
+from utils import common, log_format, pg_pool
+
+logger = common.get_logger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+TABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*\.[A-Za-z_][A-Za-z0-9_$]*$')
+COLUMN_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+
+# --------------------------------
+# 步骤内分块并行
+# --------------------------------
+# 步骤选项 chunks=N chunk_table=schema.table：把周期拆成 N 块，在 N 个连接上同时执行同一个 sql 文件，
+#   chunk_by=time(默认) 每块的 begin_date/end_date 为周期均分后的子区间；
+#   chunk_by=key 每块使用完整周期，sql 中用 %(chunk_no)s(从 0 开始)、%(chunk_count)s 按键取模分块；
+# sql 中对 chunk_table 的 insert/delete/update/truncate 改写到本周期的 unlogged 中间表，不能写入其他表(临时表除外)；
+# 全部块成功后在一个事务内：删除目标表中本周期的数据(chunk_column 为目标表的时间列，必须配置)、
+# 插入中间表的数据、删除中间表；任一块失败则取消其他块，目标表不变。
+# sql 自身的 delete/truncate 只作用于空的中间表，只追加合并时重跑会重复插入，所以不提供只追加的方式
+def check_options(options):
+    """校验分块选项，返回 (chunk_table, chunk_column)"""
+    table = options.get('chunk_table') or ''
+    column = options.get('chunk_column') or ''
+    if not TABLE_NAME.match(table):
+        raise ValueError(f"chunk: chunk_table must be schema.table, got '{table}'")
+    if not column:
+        raise ValueError(f"chunk: chunk_column is required, the time column of {table} "
+                         f"used to replace the window's rows")
+    if not COLUMN_NAME.match(column):
+        raise ValueError(f"chunk: invalid chunk_column '{column}'")
+    return table, column
+
+
+def staging_table(table, **pg_params):
+    """本步骤本周期的中间表名(同一周期重跑时相同，残留的中间表会被先删除)"""
+    schema, name = table.split('.')
+    key = '|'.join(str(pg_params.get(item) or '') for item in ('mapping_name', 'begin_date', 'end_date'))
+    return f"{schema}.{name[:44]}_chunk_{hashlib.md5(key.encode('utf-8')).hexdigest()[:8]}"
+
+
+def redirect_writes(sql, table, staging):
+    """sql 中对 table 的写入改为写 staging，读取不变；没有 insert into table 时抛出异常。
+    写入其他表时也抛出异常：每一块都会执行一次，且在块提交后不随其他块失败回滚，应拆为单独的步骤"""
+    pattern = re.compile(rf'\b(insert\s+into|delete\s+from|update|truncate(?:\s+table)?)\s+{re.escape(table)}\b',
+                         flags=re.I)
+    sql, count = pattern.subn(lambda m: f"{m.group(1)} {staging}", sql)
+    if not re.search(rf'\binsert\s+into\s+{re.escape(staging)}\b', sql, flags=re.I):
+        raise ValueError(f"chunk: sql does not insert into chunk_table {table}")
+    others = [name for name in lineage.parse_sql(sql)[1] if name != staging.lower()]
+    if others:
+        raise ValueError(f"chunk: sql writes tables other than chunk_table {table}: {','.join(others)}, "
+                         f"move them to a separate step")
+    return sql
+
+
+def split_window(begin_date, end_date, chunks):
+    """把 [begin_date, end_date) 均分为 chunks 个子区间(按秒对齐)"""
+    begin, end = backfill.parse_date(begin_date), backfill.parse_date(end_date)
+    seconds = int((end - begin).total_seconds())
+    if seconds <= 0:
+        raise ValueError(f"chunk: invalid window {begin_date} ~ {end_date}")
+    chunks = min(chunks, seconds)
+    bounds = [begin + datetime.timedelta(seconds=seconds * i // chunks) for i in range(chunks)] + [end]
+    return [(bounds[i].strftime(DATE_FORMAT), bounds[i + 1].strftime(DATE_FORMAT)) for i in range(chunks)]
+
+
+def chunk_params(options, **pg_params):
+    """返回每一块的 sql 参数"""
+    chunks = int(options['chunks'])
+    chunk_by = options.get('chunk_by') or 'time'
+    if chunk_by == 'time':
+        if not pg_params.get('begin_date') or not pg_params.get('end_date'):
+            raise ValueError("chunk: chunk_by=time requires begin_date and end_date")
+        windows = split_window(pg_params['begin_date'], pg_params['end_date'], chunks)
+        return [dict(pg_params, begin_date=begin, end_date=end, chunk_no=no, chunk_count=len(windows))
+                for no, (begin, end) in enumerate(windows)]
+    if chunk_by == 'key':
+        return [dict(pg_params, chunk_no=no, chunk_count=chunks) for no in range(chunks)]
+    raise ValueError(f"chunk: unknown chunk_by '{chunk_by}', expected time/key")
+
+
+def execute_chunked(conn, sql, options, pg_params, timeout=None, timeout_sql='', save_sql='', stats=None):
+    """分块执行 sql 并合并到目标表；conn 为步骤的连接(自动提交)，每块的耗时、影响行数追加到 stats"""
+    table, column = check_options(options)
+    staging = staging_table(table, **pg_params)
+    chunk_sql = redirect_writes(sql, table, staging)
+    params_list = chunk_params(options, **pg_params)
+    stats = stats if stats is not None else []
+
+    with conn.cursor() as cur:
+        cur.execute(f"drop table if exists {staging}; create unlogged table {staging} (like {table} including defaults)")
+    try:
+        run_chunks(chunk_sql, params_list, timeout, timeout_sql, stats,
+                   int(options.get('chunk_workers') or len(params_list)), **pg_params)
+        # 全部块成功：一个事务内替换目标表本周期的数据
+        delete_sql = (f"delete from {table} where {column} >= %(begin_date)s::timestamp "
+                      f"and {column} < %(end_date)s::timestamp;")
+        with conn.cursor() as cur:
+            cur.execute(f"BEGIN;\n{timeout_sql}\n{delete_sql}\ninsert into {table} select * from {staging};\n"
+                        f"drop table {staging};\n{save_sql}\nCOMMIT;", pg_params)
+    except Exception:
+        if not conn.closed:
+            pg_pool.rollback(conn)
+            with conn.cursor() as cur:
+                cur.execute(f"drop table if exists {staging}")
+        raise
+
+
+def run_chunks(sql, params_list, timeout, timeout_sql, stats, workers, **pg_params):
+    """在单独的连接池上并行执行各块(不占用 sql_list 的连接池，避免步骤之间互相等待连接)；
+    任一块失败或超过步骤超时时取消其他块，抛出第一个异常"""
+    workers = max(min(workers, len(params_list)), 1)
+    chunk_pool = pg_pool.create_pool(workers, **pg_params)
+    active = set()
+    items = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='etl-chunk') as thread_pool:
+            futures = []
+            for params in params_list:
+                item = {'statement_no': params['chunk_no'] + 1,
+                        'statement_text': (f"chunk {params['chunk_no'] + 1}/{params['chunk_count']}: "
+                                           f"{params.get('begin_date')} ~ {params.get('end_date')}"),
+                        'start_datetime': None, 'duration_ms': None, 'row_count': None, 'plan_text': None,
+                        'error_info': None}
+                items.append(item)
+                futures.append(log_format.submit(thread_pool, run_chunk, chunk_pool, sql, params, timeout_sql, item,
+                                                  active))
+            done, not_done = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+            error = next((future.exception() for future in done if future.exception() is not None), None)
+            if error is None and not_done:
+                error = errors.QueryCanceled(f"chunk: step timeout after {timeout}s")
+            if error is not None:
+                for future in not_done:
+                    future.cancel()
+                for chunk_conn in list(active):
+                    try:
+                        chunk_conn.cancel()
+                    except Exception as e:
+                        logger.warning(f"chunk: cancel failed: {e}")
+                wait(futures)
+                raise error
+    finally:
+        chunk_pool.closeall()
+        stats.extend(item for item in items if item['start_datetime'] is not None)
+
+
+def run_chunk(chunk_pool, sql, params, timeout_sql, item, active):
+    conn = chunk_pool.getconn()
+    active.add(conn)
+    item['start_datetime'] = datetime.datetime.now()
+    begin = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"{timeout_sql}\n{sql}", params)
+            item['row_count'] = cur.rowcount
+        conn.commit()
+        logger.info(f"sql: {item['statement_text']} done, {item['row_count']} rows.")
+    except Exception as e:
+        if not conn.closed:
+            conn.rollback()
+        item['error_info'] = str(e)
+        raise
+    finally:
+        item['duration_ms'] = round((time.perf_counter() - begin) * 1000, 3)
+        active.discard(conn)
+        chunk_pool.putconn(conn)
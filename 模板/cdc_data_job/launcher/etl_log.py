@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import os
+import threading
+import time
+
+from utils import common
+
+logger = common.get_logger(__name__)
+
+LOG_SQL_FILE = 'etl/etl_log.sql'
+# 日志函数，见 etl/ddl/etl_log_upsert.sql；函数不存在时使用 etl/etl_log.sql 的 DO 块
+LOG_FUNCTION = 'public.etl_log_upsert(varchar,varchar,varchar,integer,varchar,varchar,varchar,varchar)'
+LOG_FUNCTION_CALL = ("select public.etl_log_upsert(%(mapping_name)s, %(log_start_time)s, %(log_end_time)s, "
+                     "%(status)s, %(error_info)s, %(parameter_values)s, %(begin_date)s, %(end_date)s)")
+CHECK_LOG_FUNCTION_SQL = 'select to_regprocedure(%s) is not null'
+# 日志函数是否存在的检查结果缓存秒数，过期后重新检查，常驻进程不需重启即可用上新建(或不再使用已删除)的函数
+LOG_FUNCTION_CHECK_SECONDS = 600
+
+_sql_cache = {}  # 文件路径 -> (mtime_ns, size, 文件内容)
+_sql_cache_lock = threading.Lock()
+_log_function = {}  # 'exists' -> 日志函数是否存在，'checked' -> 检查时间(time.monotonic)
+
+
+# --------------------------------
+# sql 文件内容缓存
+# --------------------------------
+# 按文件路径缓存在内存中，每次只 stat 文件，修改时间或大小变化时重新读取
+def read_sql_file(file_name):
+    stat = os.stat(file_name)
+    with _sql_cache_lock:
+        cached = _sql_cache.get(file_name)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+    with open(file_name, encoding='utf-8', mode='r') as f:
+        sql = f.read()
+    with _sql_cache_lock:
+        _sql_cache[file_name] = (stat.st_mtime_ns, stat.st_size, sql)
+    return sql
+
+
+# --------------------------------
+# 日志 sql
+# --------------------------------
+# 库中已创建日志函数时调用函数(plpgsql 在会话内缓存执行计划，连接池复用连接时不再重复解析)，
+# 否则每次执行 etl/etl_log.sql 的 DO 块
+def get_log_sql(cur):
+    if log_function_exists() is None:
+        try:
+            cur.execute(CHECK_LOG_FUNCTION_SQL, (LOG_FUNCTION,))
+            set_log_function_exists(cur.fetchone()[0])
+        except Exception as e:
+            logger.warning(f"check log function failed, use {LOG_SQL_FILE}: {e}")
+            return read_sql_file(LOG_SQL_FILE)
+    return current_log_sql()
+
+
+def log_function_exists():
+    """日志函数是否存在，未检查或检查结果已过期时返回 None"""
+    checked = _log_function.get('checked')
+    if checked is None or time.monotonic() - checked >= LOG_FUNCTION_CHECK_SECONDS:
+        return None
+    return _log_function['exists']
+
+
+def set_log_function_exists(exists):
+    changed = _log_function.get('exists') != exists
+    _log_function.update(exists=exists, checked=time.monotonic())
+    if changed:
+        if exists:
+            logger.info(f"log function {LOG_FUNCTION} found.")
+        else:
+            logger.info(f"log function {LOG_FUNCTION} not found, use {LOG_SQL_FILE}.")
+
+
+def current_log_sql():
+    if _log_function.get('exists'):
+        return LOG_FUNCTION_CALL
+    return read_sql_file(LOG_SQL_FILE)
@@ -1,82 +1,445 @@
 #!/usr/bin/env python3
 # coding: utf-8
 import datetime
-import psycopg2
-from service import wechat
-from utils import common
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from psycopg2 import errors
+
+from launcher import baseline, change_check, chunked, etl_log, export, lineage, load, run_lock, sql_list, statements, watchdog
+from service import alert
+from utils import common, log_format, metrics, pg_pool
 
 logger = common.get_logger(__name__)
 
+# etl_log.status 取值
+STATUS_RUNNING = -1  # 执行中
+STATUS_SUCCESS = 0  # 成功
+STATUS_FAILED = 1  # 失败
+STATUS_UPSTREAM_FAILED = 2  # 依赖的步骤失败，未执行
+STATUS_TIMEOUT = 3  # 超时被取消
+STATUS_LOCK_SKIPPED = 4  # 同一周期的同一步骤正在其他进程中执行，跳过
+STATUS_LOCK_FAILED = 5  # 等待其他进程中的同一步骤超时或不等待，失败
+STATUS_UNCHANGED = 6  # 源表自上次成功后没有变化，跳过
 
-def call_sql_files(sql_list_file_name, **pg_params):  # pg_params只能定义一个，代表字典参数
-    with open(sql_list_file_name, encoding='utf-8', mode='r') as list_f:
-        for sql_file in list_f:
-            sql_file_strip = "".join(sql_file.split())
-            if sql_file_strip.startswith('#') or len(sql_file_strip) == 0:
-                continue
-            sql_file = sql_file.strip('\n')           
-            call_sql_file(sql_file, **pg_params)  # pg_params字典拆包后传入
-   
+# 视为成功的状态：依赖它的步骤照常执行
+SUCCESS_STATUSES = (STATUS_SUCCESS, STATUS_UNCHANGED)
+# 依赖它的步骤可以执行的状态：跳过(其他进程正在执行同一步骤)不算失败；微批高水位仍只按 SUCCESS_STATUSES 推进
+DEPENDENCY_OK_STATUSES = SUCCESS_STATUSES + (STATUS_LOCK_SKIPPED,)
+# 计入失败次数的状态
+FAILURE_STATUSES = (STATUS_FAILED, STATUS_TIMEOUT, STATUS_LOCK_FAILED)
+STATUS_NAMES = {STATUS_RUNNING: 'running', STATUS_SUCCESS: 'success', STATUS_FAILED: 'failed',
+                STATUS_UPSTREAM_FAILED: 'upstream_failed', STATUS_TIMEOUT: 'timeout', STATUS_LOCK_SKIPPED: 'lock_skipped',
+                STATUS_LOCK_FAILED: 'lock_failed', STATUS_UNCHANGED: 'unchanged'}
 
-def call_sql_file(file_name, **pg_params):
+# 指标，见 utils/metrics.py
+STEP_SECONDS = metrics.histogram('etl_step_duration_seconds', '步骤耗时(秒)', ('step', 'status'))
+STEP_ROWS = metrics.counter('etl_step_rows_total', '步骤影响的行数(逐条语句记录、分块、导出、装载步骤)', ('step',))
+STEP_FAILURES = metrics.counter('etl_step_failures_total', '步骤失败次数，按异常类型', ('step', 'error_class'))
+LOCK_WAIT_SECONDS = metrics.histogram('etl_lock_wait_seconds', '取步骤互斥锁的耗时(秒)', ('policy',))
+LIST_LAST_SUCCESS = metrics.gauge('etl_sql_list_last_success_timestamp_seconds', 'sql_list 最近一次全部步骤成功的时间',
+                                  ('sql_list',))
+
+
+def call_sql_files(sql_list_file_name, pool=None, workers=1, resume=False, force=None, gate=None, options=None,
+                   downstream_of=None, **pg_params):  # pg_params只能定义一个，代表字典参数
+    """执行 sql_list，options 为步骤选项的默认值，sql_list 中每行的 key=value 优先；
+    downstream_of 为表名或步骤名时只执行它下游的步骤(见 launcher/lineage.py)"""
+    pg_params.setdefault('run_id', common.new_run_id())
+    with log_format.log_context(run_id=pg_params['run_id'], list=sql_list_file_name,
+                                window=log_format.window(**pg_params)):
+        return run_sql_list(sql_list_file_name, pool, workers, resume, force, gate, options, downstream_of, **pg_params)
+
+
+def run_sql_list(sql_list_file_name, pool=None, workers=1, resume=False, force=None, gate=None, options=None,
+                 downstream_of=None, **pg_params):
+    list_begin = time.perf_counter()
+    try:
+        steps = sql_list.parse_sql_list(sql_list_file_name)
+        if downstream_of:
+            steps = lineage.select_downstream(steps, downstream_of)
+            logger.info(f"lineage: downstream of {downstream_of}: {','.join(step['mapping_name'] for step in steps)}")
+        if sql_list.has_dependencies(steps):
+            sql_list.check_steps(steps)
+        check_options(steps, options)
+    except Exception as e:
+        logger.error(f"sql_list: {sql_list_file_name} parse failed: {e}")
+        alert.warn(f"{sql_list_file_name}:parse", f"ETL执行异常，sql_list：{sql_list_file_name}，{e}")
+        return {}
+
+    # 未传入连接池时，本次sql_list内的所有步骤共用连接
+    own_pool = pool is None
+    if own_pool:
+        try:
+            pool = pg_pool.create_pool(max(workers, 1), **pg_params)
+        except Exception as e:
+            alert.warn('database:connection', f"数据库连接异常：{e}")
+            return {}
+    try:
+        # 断点续跑：本周期已成功的步骤不再执行，视为成功
+        results = {}
+        if resume:
+            names = [step['mapping_name'] for step in steps]
+            force = [sql_list.get_mapping_name(name) for name in (force or [])]
+            try:
+                success_steps = get_success_steps(pool, names, **pg_params)
+            except Exception as e:
+                logger.error(f"resume: query etl_log failed, all steps will run: {e}")
+                success_steps = []
+            for name in success_steps:
+                if name not in force:
+                    logger.info(f"sql: {name} skipped, already succeeded in this period.")
+                    results[name] = STATUS_SUCCESS
+        if sql_list.has_dependencies(steps):
+            results = run_steps(steps, pool, workers, results, gate=gate, options=options, **pg_params)
+        else:
+            # 没有依赖标注时按行顺序执行，某个步骤失败不影响后续步骤
+            for step in steps:
+                if step['mapping_name'] not in results:
+                    results[step['mapping_name']] = run_step(step, pool, gate=gate, options=options, **pg_params)  # pg_params字典拆包后传入
+        regressions = baseline.get_regressions(pool, [name for name, value in results.items() if value == STATUS_SUCCESS],
+                                               **pg_params)
+    finally:
+        if own_pool:
+            pool.closeall()
+
+    summary = {status: [name for name, value in results.items() if value == status] for status in set(results.values())}
+    logger.info(f"sql_list: {sql_list_file_name} finished, {summary}",
+                extra={'duration': time.perf_counter() - list_begin})
+    baseline.report(sql_list_file_name, regressions)
+    observe_list(sql_list_file_name, results)
+    return results
 
-    mapping_name = file_name.split('/')[-1].split('.')[0].lower()
-    pg_params['mapping_name'] = mapping_name
 
+def observe_list(sql_list_file_name, results):
+    if results and all(status in SUCCESS_STATUSES for status in results.values()):
+        LIST_LAST_SUCCESS.labels(sql_list_file_name).set(time.time())
+
+
+def observe_step(mapping_name, status, seconds=None, error_class=None, stats=None):
+    """记录步骤的耗时、影响行数、失败次数；超时、加锁失败的异常类型记为 timeout、lock"""
+    if seconds is not None:
+        STEP_SECONDS.labels(mapping_name, STATUS_NAMES.get(status, str(status))).observe(seconds)
+    rows = sum(item['row_count'] for item in stats or [] if item.get('row_count') and item['row_count'] > 0)
+    if rows:
+        STEP_ROWS.labels(mapping_name).inc(rows)
+    if status in FAILURE_STATUSES:
+        if status == STATUS_TIMEOUT:
+            error_class = 'timeout'
+        elif status == STATUS_LOCK_FAILED:
+            error_class = 'lock'
+        STEP_FAILURES.labels(mapping_name, error_class or 'unknown').inc()
+
+
+def get_success_steps(pool, mapping_names, **pg_params):
+    """一次查询 etl_log，返回本周期(begin_date、end_date相同)已成功的步骤名"""
+    if not pg_params.get('begin_date') or not mapping_names:
+        logger.warning("resume: begin_date is not set, all steps will run.")
+        return []
+    ids = [f"{pg_params['begin_date']}_{name}" for name in mapping_names]
+    sql = """
+        select a.etl_name
+        from public.etl_log a
+        where a.id = any(%(ids)s)
+        and a.status in (0, 6)
+        and a.etl_params_end_date is not distinct from %(end_date)s::timestamp
+        """
+    conn = pool.getconn()
     try:
-        conn = psycopg2.connect(host=pg_params['pg_host'],
-                                port=pg_params['pg_port'],
-                                dbname=pg_params['pg_dbname'],                      
-                                user=pg_params['pg_user'],
-                                password=pg_params['pg_password']
-                               )
-
-        
-        try:                        
-            with conn.cursor() as cur:
-                log_sql_path = 'etl/etl_log.sql'
-                with open(log_sql_path, encoding='utf-8', mode='r') as log_f:
-                    log_sql = log_f.read()
+        with conn.cursor() as cur:
+            cur.execute(sql, {'ids': ids, 'end_date': pg_params.get('end_date')})
+            rows = cur.fetchall()
+        conn.commit()
+    finally:
+        pool.putconn(conn)
+    return [row[0] for row in rows]
+
+
+def run_steps(steps, pool, workers, results=None, gate=None, options=None, **pg_params):
+    """按依赖关系执行步骤：依赖都成功的步骤提交到线程池，依赖失败的步骤记为 STATUS_UPSTREAM_FAILED
+    results 中已有的步骤(如断点续跑跳过的步骤)不再执行"""
+    results = dict(results or {})
+    pending = {step['mapping_name']: step for step in steps if step['mapping_name'] not in results}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='etl') as thread_pool:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for name, step in list(pending.items()):
+                    failed = [dep for dep in step['after'] if dep in results and results[dep] not in DEPENDENCY_OK_STATUSES]
+                    if failed:
+                        del pending[name]
+                        error_info = f"upstream failed: {','.join(failed)}"
+                        logger.info(f"sql: {step['sql_file']} skipped, {error_info}.")
+                        log_sql_file(step['sql_file'], STATUS_UPSTREAM_FAILED, error_info, pool=pool, **pg_params)
+                        results[name] = STATUS_UPSTREAM_FAILED
+                        changed = True
+                    elif all(dep in results for dep in step['after']):
+                        del pending[name]
+                        future = log_format.submit(thread_pool, run_step, step, pool, gate=gate, options=options,
+                                                   **pg_params)
+                        running[future] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
                 try:
-                    pg_params['log_start_time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    pg_params['log_end_time'] = None
-                    pg_params['status'] = -1
-                    pg_params['error_info'] = ''
-                    cur.execute(log_sql, pg_params)  # psycopg2 支持字典参数
-                    conn.commit()
-                    log_success = True
-                except Exception as e:             
-                    conn.rollback()         
-                    log_success = False                       
-                    logger.error(f"log execution failed: {e}")
-
-                if log_success:
-                    logger.info(f"sql: {file_name} execution start.")
-                    with open(file_name, encoding='utf-8', mode='r') as f:
-                        sql = f.read()
-                    try:
-                        cur.execute(sql, pg_params)
-                        conn.commit()                    
-                        pg_params['status'] = 0                    
-                        logger.info(f"sql: {file_name} executed successfully.")
-                    except Exception as e:
-                        conn.rollback()                          
-                        log_success = False
-                        pg_params['status'] = 1
-                        pg_params['error_info'] = e.args[0]
-                        logger.info("sql: %s execution failed." % file_name)
-
-                    # 记录ETL的结束日志
-                    pg_params['log_end_time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    cur.execute(log_sql, pg_params)
-                    conn.commit()
+                    results[name] = future.result()
+                except Exception as e:
+                    logger.error(f"etl执行失败: {name}, {e}.")
+                    results[name] = STATUS_FAILED
+    return results
+
+
+def run_step(step, pool, gate=None, options=None, **pg_params):
+    """执行一个步骤；gate 用于补数时控制同一步骤在各周期之间的先后顺序"""
+    if gate is not None and not gate.enter(step):
+        error_info = 'previous window failed'
+        logger.info(f"sql: {step['sql_file']} skipped, {error_info}.")
+        log_sql_file(step['sql_file'], STATUS_UPSTREAM_FAILED, error_info, pool=pool, **pg_params)
+        status = STATUS_UPSTREAM_FAILED
+    else:
+        step_options = dict(options or {})
+        step_options.update(step['options'])
+        status = call_sql_file(step['sql_file'], pool=pool, options=step_options, **pg_params)
+    if gate is not None:
+        gate.leave(step, status)
+    return status
+
+
+def check_options(steps, options=None):
+    """执行前校验各步骤的选项(默认值 + sql_list 中的选项)，有错误时整个 sql_list 不执行"""
+    for step in steps:
+        step_options = dict(options or {}, **step['options'])
+        try:
+            run_lock.check_policy(step_options.get('lock'))
+            if get_float(step_options, 'chunks', 1) > 1:
+                chunked.check_options(step_options)
+        except ValueError as e:
+            raise ValueError(f"step {step['mapping_name']}: {e}")
+
+
+def is_true(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def get_float(options, key, default=None):
+    value = options.get(key)
+    return default if value in (None, '') else float(value)
+
+
+def log_sql_file(file_name, log_status, log_error_info, pool, **pg_params):
+    """只写日志不执行sql，用于未执行的步骤"""
+    pg_params['mapping_name'] = sql_list.get_mapping_name(file_name)
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    pg_params['log_start_time'] = now
+    pg_params['log_end_time'] = now
+    pg_params['status'] = log_status
+    pg_params['error_info'] = log_error_info
+    try:
+        conn = pool.getconn()
+    except Exception as e:
+        logger.error(f"log execution failed: {e}")
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute(etl_log.get_log_sql(cur), pg_params)
+        conn.commit()
+    except Exception as e:
+        if not conn.closed:
+            conn.rollback()
+        logger.error(f"log execution failed: {e}")
+    finally:
+        pool.putconn(conn)
+
+
+def call_sql_file(file_name, pool=None, options=None, **pg_params):
+    """执行单个sql文件(或 .yml 的 csv 装载配置，见 launcher/load.py)并记录etl_log，返回执行状态
+    options: instrument 逐条语句记录耗时(etl_log_statement)，slow_seconds 慢语句阈值，explain 执行计划方式 plain/analyze，
+             timeout 步骤超时秒数(statement_timeout + 看门狗取消)，
+             lock 同一步骤同一周期的互斥策略 none/skip/wait/fail，lock_wait_minutes wait 策略的最长等待分钟数，
+             sources 源表(逗号分隔)，未变化时跳过，change_check 判断方式 stats/max/checksum，change_column max 方式的列，
+             change_window 按周期分别保存源表指标，
+             chunks 分块并行的块数，chunk_table 写入的目标表，chunk_by time/key，chunk_column 目标表的时间列，
+             chunk_workers 同时执行的块数(见 launcher/chunked.py)，
+             export 导出格式 csv/parquet，export_file 文件名模板，export_rows、export_compression、export_max_mb、
+             export_encoding(见 launcher/export.py)"""
+    with log_format.log_context(run_id=pg_params.get('run_id'), step=sql_list.get_mapping_name(file_name),
+                                window=log_format.window(**pg_params)):
+        return execute_sql_file(file_name, pool, options, **pg_params)
+
+
+def execute_sql_file(file_name, pool=None, options=None, **pg_params):
+    options = options or {}
+    lock_policy = run_lock.check_policy(options.get('lock'))
+
+    mapping_name = sql_list.get_mapping_name(file_name)
+    pg_params['mapping_name'] = mapping_name
+    pg_params['status'] = STATUS_FAILED
+
+    own_pool = pool is None
+    try:
+        if own_pool:
+            pool = pg_pool.create_pool(1, **pg_params)
+        conn = pool.getconn()
+    except Exception as e:
+        if own_pool and pool is not None:
+            pool.closeall()
+        alert.warn('database:connection', f"数据库连接异常：{e}")
+        return STATUS_FAILED
+
+    # 取步骤互斥锁，取不到时只记录日志
+    lock_key = None
+    # 自动提交模式下由 sql 显式 BEGIN/COMMIT：取锁、日志不再单独往返 BEGIN、COMMIT，
+    # 开始日志与步骤 sql 拼成一次请求发送；连接归还连接池时恢复
+    conn.autocommit = True
+    if lock_policy != 'none':
+        lock_key = run_lock.lock_key(**pg_params)
+        lock_begin = time.perf_counter()
+        try:
+            locked = run_lock.acquire(conn, lock_key, lock_policy, get_float(options, 'lock_wait_minutes', 10))
         except Exception as e:
-            conn.rollback()        
-            logger.error(f"etl执行失败: {e}.")
-        finally:
-            conn.close()
-            if not log_success:
-                wechat.send_warning(f"ETL执行异常，sql：{file_name}")
+            logger.error(f"sql: {file_name} lock failed: {e}")
+            locked = False
+        LOCK_WAIT_SECONDS.labels(lock_policy).observe(time.perf_counter() - lock_begin)
+        if not locked:
+            pool.putconn(conn)
+            status = STATUS_LOCK_SKIPPED if lock_policy == 'skip' else STATUS_LOCK_FAILED
+            error_info = f"step is running in another process, lock policy: {lock_policy}"
+            logger.info(f"sql: {file_name} not executed, {error_info}.")
+            log_sql_file(file_name, status, error_info, pool=pool, **pg_params)
+            if own_pool:
+                pool.closeall()
+            if status == STATUS_LOCK_FAILED:
+                alert.warn(f"{mapping_name}:lock", f"ETL执行异常，sql：{file_name}，{error_info}")
+            observe_step(mapping_name, status)
+            return status
+    lock_conn = conn
+
+    # 源表自上次成功后没有变化时跳过，只记录日志
+    pg_params['change_signature'] = None
+    pg_params['change_window'] = change_check.window_key(options, **pg_params)
+    if options.get('sources'):
+        pg_params['change_signature'], unchanged = change_check.check(conn, mapping_name, options,
+                                                                      pg_params['change_window'])
+        if unchanged:
+            if lock_key is not None:
+                run_lock.release(conn, lock_key)
+            pool.putconn(conn)
+            error_info = 'sources unchanged since last success'
+            logger.info(f"sql: {file_name} skipped, {error_info}.")
+            log_sql_file(file_name, STATUS_UNCHANGED, error_info, pool=pool, **pg_params)
+            if own_pool:
+                pool.closeall()
+            return STATUS_UNCHANGED
+    save_sql = change_check.SAVE_SIGNATURE_SQL + ';' if pg_params['change_signature'] else ''
+
+    log_success = False
+    statement_stats = []
+    step_begin = None
+    error_class = None
+    try:
+        with conn.cursor() as cur:
+            log_sql = etl_log.get_log_sql(cur)
+            pg_params['log_start_time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            pg_params['log_end_time'] = None
+            pg_params['status'] = STATUS_RUNNING
+            pg_params['error_info'] = ''
+            log_success = True
+            logger.info(f"sql: {file_name} execution start.")
+            step_begin = time.perf_counter()
+            timeout = get_float(options, 'timeout')
+            step_watchdog = watchdog.StepWatchdog(conn, timeout, **pg_params)
+            try:
+                sql = etl_log.read_sql_file(file_name)
+                # 事务内的 statement_timeout，提交或回滚后自动恢复
+                timeout_sql = watchdog.statement_timeout_sql(timeout) if timeout else ''
+                if timeout:
+                    step_watchdog.start()
+                if load.is_load_step(file_name):
+                    cur.execute(log_sql, pg_params)
+                    load.load_csv(conn, load.read_spec(file_name), pg_params, timeout_sql, save_sql, statement_stats)
+                elif options.get('export'):
+                    cur.execute(log_sql, pg_params)
+                    export.export_query(conn, sql, options, pg_params, timeout_sql, statement_stats)
+                    if save_sql:
+                        cur.execute(save_sql, pg_params)
+                elif get_float(options, 'chunks', 1) > 1:
+                    if is_true(options.get('instrument')):
+                        logger.warning(f"sql: {file_name} instrument is ignored for chunked step.")
+                    cur.execute(log_sql, pg_params)
+                    chunked.execute_chunked(conn, sql, options, pg_params, timeout, timeout_sql, save_sql,
+                                            statement_stats)
+                elif is_true(options.get('instrument')):
+                    cur.execute(log_sql, pg_params)  # psycopg2 支持字典参数
+                    cur.execute('BEGIN;' + timeout_sql)
+                    statements.execute_instrumented(cur, sql, pg_params, statement_stats,
+                                                    slow_seconds=get_float(options, 'slow_seconds'),
+                                                    explain=options.get('explain', 'plain'))
+                    cur.execute(save_sql + 'COMMIT', pg_params)
+                else:
+                    # 开始日志单独提交，步骤失败时仍保留执行中的日志；sql 文件末尾可能是注释，先换行再结束语句
+                    cur.execute(f"BEGIN;\n{log_sql};\nCOMMIT;\nBEGIN;\n{timeout_sql}\n{sql}\n;\n{save_sql}\nCOMMIT;", pg_params)
+                pg_params['status'] = STATUS_SUCCESS
+                step_seconds = time.perf_counter() - step_begin
+                logger.info(f"sql: {file_name} executed successfully.", extra={'duration': step_seconds})
+            except Exception as e:
+                step_watchdog.stop()
+                if not conn.closed:
+                    pg_pool.rollback(conn)
+                log_success = False
+                error_class = type(e).__name__
+                pg_params['error_info'] = str(e.args[0]) if e.args else str(e)
+                if step_watchdog.fired or isinstance(e, errors.QueryCanceled):
+                    pg_params['status'] = STATUS_TIMEOUT
+                    # 外部或服务端取消(未设置超时)时不加超时前缀
+                    if timeout:
+                        pg_params['error_info'] = f"timeout after {timeout}s: {pg_params['error_info']}"
+                    logger.info(f"sql: {file_name} execution timeout, cancelled.",
+                                extra={'duration': time.perf_counter() - step_begin})
+                else:
+                    pg_params['status'] = STATUS_FAILED
+                    logger.info("sql: %s execution failed." % file_name,
+                                extra={'duration': time.perf_counter() - step_begin})
+                # 被终止的连接不能再写日志，换一个连接
+                if conn.closed:
+                    pool.putconn(conn)
+                    conn = None
+                    conn = pool.getconn()
+                    conn.autocommit = True
+            finally:
+                step_watchdog.stop()
 
+            # 记录ETL的结束日志，自动提交，一次往返(连接可能已更换，使用当前连接的游标)
+            pg_params['log_end_time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with conn.cursor() as log_cur:
+                log_cur.execute(log_sql, pg_params)
+        statements.save_stats(conn, statement_stats, **pg_params)
+        if pg_params['status'] == STATUS_SUCCESS:
+            baseline.update(conn, step_seconds, **pg_params)
     except Exception as e:
-        wechat.send_warning(f"数据库连接异常：{e}")
\ No newline at end of file
+        if conn is not None and not conn.closed:
+            pg_pool.rollback(conn)
+        log_success = False
+        error_class = error_class or type(e).__name__
+        # sql已提交、只是结束日志失败时仍算成功，不影响依赖它的步骤
+        if pg_params['status'] == STATUS_RUNNING:
+            pg_params['status'] = STATUS_FAILED
+        logger.error(f"etl执行失败: {e}.")
+    finally:
+        # 释放互斥锁(连接被终止时锁已由数据库释放)，连接归还连接池，由连接池决定复用还是关闭
+        if lock_key is not None and lock_conn is conn:
+            run_lock.release(conn, lock_key)
+        if conn is not None:
+            pool.putconn(conn)
+        if own_pool:
+            pool.closeall()
+        if pg_params['status'] == STATUS_TIMEOUT:
+            alert.warn(f"{mapping_name}:timeout", f"ETL执行超时，sql：{file_name}")
+        elif not log_success:
+            alert.warn(f"{mapping_name}:{error_class or 'failed'}", f"ETL执行异常，sql：{file_name}")
+        observe_step(mapping_name, pg_params['status'],
+                     None if step_begin is None else time.perf_counter() - step_begin, error_class, statement_stats)
+    return pg_params['status']
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+import gzip
+import json
+import os
+import re
+
+from psycopg2 import extensions
+
+from launcher import statements
+from utils import common
+
+logger = common.get_logger(__name__)
+
+EXPORT_FORMATS = ('csv', 'parquet')
+DEFAULT_FILE = 'export/{mapping_name}_{begin}_{part}.{format}'
+
+# postgres 类型 oid -> parquet 列类型，其他类型按文本导出
+ARROW_TYPES = {16: 'bool_', 20: 'int64', 21: 'int16', 23: 'int32', 26: 'int64', 700: 'float32', 701: 'float64',
+               1082: 'date32', 17: 'binary'}
+NUMERIC_OID = 1700
+TIMESTAMP_OID = 1114
+TIMESTAMPTZ_OID = 1184
+
+
+# --------------------------------
+# 导出步骤
+# --------------------------------
+# 步骤选项 export=csv/parquet：sql 文件为一条查询，结果流式写入文件，内存占用与结果大小无关：
+#   csv     COPY (查询) TO STDOUT，每行直接写入文件(可 gzip)，export_encoding 为文件编码
+#   parquet 命名游标(服务端游标)每次取 export_rows 行，写为一个 row group(压缩默认 snappy，需 pip install pyarrow)
+# export_file 为文件名模板，可用 {mapping_name} {begin} {end}(周期，只保留数字) {part}(分卷序号) {format}；
+# export_max_mb 超过后换下一个文件(按整行切分，csv 每个文件都有表头)。文件先写为 .tmp，全部成功后改名，
+# 失败时删除本次写入的全部文件
+def file_template(options, **pg_params):
+    fmt = options['export']
+    compression = options.get('export_compression')
+    suffix = f"{fmt}.gz" if fmt == 'csv' and compression == 'gzip' else fmt
+    template = options.get('export_file') or DEFAULT_FILE
+    values = {'mapping_name': pg_params.get('mapping_name') or '', 'format': suffix,
+              'begin': re.sub(r'\D', '', str(pg_params.get('begin_date') or '')),
+              'end': re.sub(r'\D', '', str(pg_params.get('end_date') or ''))}
+    return lambda part: template.format(part=f"{part:03d}", **values)
+
+
+def export_query(conn, sql, options, pg_params, timeout_sql='', stats=None):
+    """执行导出，conn 为步骤的连接(自动提交)；每个文件的路径、行数、耗时追加到 stats，返回文件列表"""
+    fmt = options.get('export')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"export: unknown format '{fmt}', expected one of {','.join(EXPORT_FORMATS)}")
+    queries = statements.split_statements(sql)
+    if len(queries) != 1:
+        raise ValueError(f"export: sql file must contain exactly one query, got {len(queries)}")
+    max_bytes = float(options.get('export_max_mb') or 0) * 1024 * 1024
+    files = RotatingFiles(file_template(options, **pg_params), max_bytes)
+    try:
+        if fmt == 'csv':
+            export_csv(conn, queries[0], pg_params, files, timeout_sql, options.get('export_compression'),
+                       options.get('export_encoding'))
+        else:
+            export_parquet(conn, queries[0], pg_params, files, timeout_sql, int(options.get('export_rows') or 100000),
+                           options.get('export_compression') or 'snappy')
+        files.commit()
+    except Exception:
+        files.discard()
+        raise
+    finally:
+        if stats is not None:
+            stats.extend(files.stats)
+    logger.info(f"export: {sum(item['row_count'] or 0 for item in files.stats)} rows to {len(files.stats)} files.")
+    return [item['statement_text'] for item in files.stats]
+
+
+class RotatingFiles(object):
+    """按序号生成文件，先写 .tmp，commit 时改名"""
+
+    def __init__(self, template, max_bytes=0):
+        self.template = template
+        self.max_bytes = max_bytes
+        self.stats = []
+        self.paths = []
+
+    def next_path(self):
+        path = self.template(len(self.paths) + 1)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.paths.append(path)
+        self.stats.append({'statement_no': len(self.paths), 'statement_text': path,
+                           'start_datetime': datetime.datetime.now(), 'duration_ms': None, 'row_count': 0,
+                           'plan_text': None, 'error_info': None})
+        return path + '.tmp'
+
+    def close_current(self):
+        item = self.stats[-1]
+        item['duration_ms'] = round((datetime.datetime.now() - item['start_datetime']).total_seconds() * 1000, 3)
+
+    def full(self, size):
+        return self.max_bytes > 0 and size >= self.max_bytes
+
+    def commit(self):
+        for path in self.paths:
+            os.replace(path + '.tmp', path)
+
+    def discard(self):
+        for path in self.paths:
+            for name in (path + '.tmp', path):
+                if os.path.exists(name):
+                    os.remove(name)
+
+
+class CsvSink(object):
+    """copy_expert 的输出：psycopg2 每次 write 一行(第一行为表头)，文件超过大小时换文件并重写表头"""
+
+    def __init__(self, files, compression=None):
+        self.files = files
+        self.compression = compression
+        self.header = None
+        self.raw = None
+        self.out = None
+
+    def open(self):
+        self.close()
+        self.raw = open(self.files.next_path(), mode='wb')
+        self.out = gzip.GzipFile(fileobj=self.raw, mode='wb') if self.compression == 'gzip' else self.raw
+        if self.header is not None:
+            self.out.write(self.header)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.header is None:
+            self.header = data
+            self.open()
+            return
+        if self.files.stats[-1]['row_count'] and self.files.full(self.raw.tell()):
+            self.open()
+        self.out.write(data)
+        self.files.stats[-1]['row_count'] += 1
+
+    def close(self):
+        if self.out is not None:
+            if self.out is not self.raw:
+                self.out.close()
+            self.raw.close()
+            self.files.close_current()
+            self.out = self.raw = None
+
+
+def export_csv(conn, query, pg_params, files, timeout_sql='', compression=None, encoding=None):
+    sink = CsvSink(files, compression)
+    with conn.cursor() as cur:
+        query = cur.mogrify(query, pg_params).decode(extensions.encodings[conn.encoding])
+        copy_options = 'format csv, header true' + (f", encoding '{encoding}'" if encoding else '')
+        cur.execute('BEGIN;' + timeout_sql)
+        try:
+            cur.copy_expert(f"copy ({query}) to stdout with ({copy_options})", sink)
+            cur.execute('COMMIT')
+        finally:
+            sink.close()
+
+
+def arrow_schema(pa, description):
+    fields = []
+    for column in description:
+        if column.type_code in ARROW_TYPES:
+            field_type = getattr(pa, ARROW_TYPES[column.type_code])()
+        elif column.type_code == NUMERIC_OID and column.precision and column.precision <= 38:
+            # 未指定精度的 numeric 按文本导出
+            field_type = pa.decimal128(column.precision, column.scale or 0)
+        elif column.type_code == TIMESTAMP_OID:
+            field_type = pa.timestamp('us')
+        elif column.type_code == TIMESTAMPTZ_OID:
+            field_type = pa.timestamp('us', tz='UTC')
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(column.name, field_type))
+    return pa.schema(fields)
+
+
+def to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+def arrow_table(pa, schema, rows):
+    columns = list(zip(*rows)) if rows else [() for _ in schema]
+    arrays = []
+    for field, values in zip(schema, columns):
+        if field.type == pa.string():
+            values = [to_text(value) for value in values]
+        elif field.type == pa.binary():
+            values = [None if value is None else bytes(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def export_parquet(conn, query, pg_params, files, timeout_sql='', rows=100000, compression='snappy'):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # 命名游标需要在事务内使用，导出期间关闭自动提交
+    conn.autocommit = False
+    writer = None
+    try:
+        with conn.cursor() as cur:
+            if timeout_sql:
+                cur.execute(timeout_sql)
+        with conn.cursor(name='etl_export') as cur:
+            cur.execute(query, pg_params)
+            batch = cur.fetchmany(rows)
+            schema = arrow_schema(pa, cur.description)
+            while True:
+                if writer is None or (files.stats[-1]['row_count'] and files.full(os.path.getsize(files.paths[-1] + '.tmp'))):
+                    if writer is not None:
+                        writer.close()
+                        files.close_current()
+                    writer = pq.ParquetWriter(files.next_path(), schema,
+                                              compression=None if compression == 'none' else compression)
+                writer.write_table(arrow_table(pa, schema, batch), row_group_size=max(len(batch), 1))
+                files.stats[-1]['row_count'] += len(batch)
+                if len(batch) < rows:
+                    break
+                batch = cur.fetchmany(rows)
+                if not batch:
+                    break
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+            files.close_current()
+        conn.autocommit = True
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import json
+import os
+import re
+import threading
+
+from launcher import etl_log, load, sql_list
+from utils import common
+
+logger = common.get_logger(__name__)
+
+CACHE_FILE = os.path.join('cache', 'lineage.json')
+# 解析规则变化时加 1，缓存中其他版本的结果重新解析
+PARSER_VERSION = 2
+# 不带 schema 的表名按默认的 search_path 补全
+DEFAULT_SCHEMA = 'public'
+
+NAME = r'"?[a-z_][a-z0-9_$]*"?(?:\."?[a-z_][a-z0-9_$]*"?)?'
+# 表名之后不是函数调用的括号(回溯时也不能截短表名)
+NOT_CALL = r'(?![a-z0-9_$".]| ?\()'
+# 写入的表：insert/merge into、update(不含 on conflict do update、for update)、delete from、truncate、create table、copy from
+TARGET_PATTERNS = [
+    re.compile(rf'\binsert into ({NAME})'),
+    re.compile(rf'\bmerge into ({NAME})'),
+    re.compile(rf'(?<!do )(?<!for )(?<!key )(?<!on )\bupdate (?:only )?({NAME}){NOT_CALL}'),
+    re.compile(rf'\bdelete from (?:only )?({NAME})'),
+    re.compile(rf'\bcreate (?:unlogged )?table (?:if not exists )?({NAME})'),
+    re.compile(rf'\bcopy ({NAME}) ?(?:\([^)]*\) ?)?from\b'),
+]
+TRUNCATE_PATTERN = re.compile(rf'\btruncate (?:table )?(?:only )?({NAME}(?: ?, ?{NAME})*)')
+# 读取的表：from/join/using 后的表名，函数调用(后跟括号)、delete from、is distinct from 除外；
+# from、using 后逗号分隔的多个表(from dw.a a, dw.b b)见 source_tables
+SOURCE_PATTERN = re.compile(rf'(?<!delete )(?<!distinct )\b(?:from|join|using) (?:only )?({NAME}){NOT_CALL}')
+LIST_START_PATTERN = re.compile(r'(?<!delete )(?<!distinct )\b(?:from|using) ')
+LIST_ITEM_PATTERN = re.compile(rf'(?:only )?({NAME})')
+IDENTIFIER_PATTERN = re.compile(r'"?[a-z_][a-z0-9_$]*"?')
+# 表名后不是别名的关键字
+CLAUSE_KEYWORDS = {'where', 'join', 'left', 'right', 'full', 'inner', 'cross', 'natural', 'on', 'using', 'group',
+                   'order', 'limit', 'offset', 'union', 'except', 'intersect', 'having', 'window', 'for', 'returning',
+                   'set', 'lateral', 'tablesample', 'fetch', 'into', 'when', 'then', 'else', 'end', 'do', 'loop'}
+CTE_PATTERN = re.compile(r'(?:\bwith (?:recursive )?|, ?)([a-z_][a-z0-9_$]*) as (?:not )?(?:materialized )?\(')
+TEMP_PATTERN = re.compile(rf'\bcreate (?:temp|temporary) table (?:if not exists )?({NAME})')
+# 参数中带 from 的函数(extract(year from x) 等)，整体去掉
+FROM_FUNCTIONS = re.compile(r'\b(?:extract|substring|trim|overlay|position) ?\(')
+KEYWORDS = {'select', 'lateral', 'values', 'set', 'where', 'on', 'as', 'stdin', 'stdout'}
+
+
+# --------------------------------
+# 表级血缘
+# --------------------------------
+# 用正则从 sql 文件中提取读、写的表(去掉注释和字符串常量，DO 块内的语句照常分析，CTE 名和临时表除外)，
+# 不带 schema 的表名按 search_path 补全为 public.表名，按解析版本、文件修改时间、大小缓存在 cache/lineage.json；
+# sql_list 中后面的步骤读取前面步骤写入的表即为其下游。
+# csv 装载配置(.yml)写入其 table；动态拼接的 sql(EXECUTE format(...))无法识别
+def normalize(sql):
+    sql = re.sub(r'/\*.*?\*/', ' ', sql, flags=re.S)
+    sql = re.sub(r'--[^\n]*', ' ', sql)
+    sql = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    sql = re.sub(r'\s+', ' ', sql.lower())
+    return strip_from_functions(sql)
+
+
+def strip_from_functions(sql):
+    while True:
+        match = FROM_FUNCTIONS.search(sql)
+        if match is None:
+            return sql
+        depth, pos = 1, match.end()
+        while pos < len(sql) and depth:
+            depth += {'(': 1, ')': -1}.get(sql[pos], 0)
+            pos += 1
+        sql = sql[:match.start()] + ' ' + sql[pos:]
+
+
+def table_name(name):
+    return name.replace('"', '')
+
+
+def qualify(name):
+    """不带 schema 的表名补全为 public.表名(pg_ 开头的系统表为 pg_catalog)"""
+    if '.' in name:
+        return name
+    return f"pg_catalog.{name}" if name.startswith('pg_') else f"{DEFAULT_SCHEMA}.{name}"
+
+
+def skip_parens(sql, pos):
+    """pos 处为左括号时返回匹配的右括号之后的位置"""
+    depth = 0
+    while pos < len(sql):
+        depth += {'(': 1, ')': -1}.get(sql[pos], 0)
+        pos += 1
+        if depth == 0:
+            break
+    return pos
+
+
+def skip_space(sql, pos):
+    return pos + 1 if pos < len(sql) and sql[pos] == ' ' else pos
+
+
+def source_tables(sql):
+    """from/using 后逗号分隔的各项中的表名(第一项由 SOURCE_PATTERN 提取)，子查询、函数调用跳过"""
+    tables = []
+    for match in LIST_START_PATTERN.finditer(sql):
+        pos, first = match.end(), True
+        while pos < len(sql):
+            if sql.startswith('lateral ', pos):
+                pos += len('lateral ')
+            if sql[pos] == '(':
+                pos = skip_parens(sql, pos)
+            else:
+                item = LIST_ITEM_PATTERN.match(sql, pos)
+                if item is None:
+                    break
+                pos = skip_space(sql, item.end())
+                if pos < len(sql) and sql[pos] == '(':
+                    pos = skip_parens(sql, pos)  # 函数调用
+                elif not first:
+                    tables.append(item.group(1))
+            # 别名及列名列表
+            pos = skip_space(sql, pos)
+            if sql.startswith('as ', pos):
+                pos += len('as ')
+            alias = IDENTIFIER_PATTERN.match(sql, pos)
+            if alias is not None and alias.group(0) not in CLAUSE_KEYWORDS:
+                pos = skip_space(sql, alias.end())
+                if pos < len(sql) and sql[pos] == '(':
+                    pos = skip_space(sql, skip_parens(sql, pos))
+            if pos >= len(sql) or sql[pos] != ',':
+                break
+            pos, first = skip_space(sql, pos + 1), False
+    return tables
+
+
+def parse_sql(sql):
+    """返回 (读取的表, 写入的表)，均为排序后的列表"""
+    sql = normalize(sql)
+    excluded = {table_name(name) for name in CTE_PATTERN.findall(sql) + TEMP_PATTERN.findall(sql)}
+    writes = set()
+    for pattern in TARGET_PATTERNS:
+        writes.update(table_name(name) for name in pattern.findall(sql))
+    for names in TRUNCATE_PATTERN.findall(sql):
+        writes.update(table_name(name.strip()) for name in names.split(','))
+    reads = {table_name(name) for name in SOURCE_PATTERN.findall(sql) + source_tables(sql)}
+    writes = {qualify(name) for name in writes - excluded - KEYWORDS}
+    reads = {qualify(name) for name in reads - excluded - KEYWORDS}
+    return sorted(reads), sorted(writes)
+
+
+_cache = None
+_cache_changed = False
+_cache_lock = threading.Lock()
+
+
+def load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_FILE, encoding='utf-8', mode='r') as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def save_cache():
+    """写入缓存文件，先写临时文件再替换，多个进程同时写入时不会读到半个文件"""
+    global _cache_changed
+    with _cache_lock:
+        if not _cache_changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+            tmp_file = f"{CACHE_FILE}.{os.getpid()}"
+            with open(tmp_file, encoding='utf-8', mode='w') as f:
+                json.dump(_cache, f, ensure_ascii=False)
+            os.replace(tmp_file, CACHE_FILE)
+            _cache_changed = False
+        except OSError as e:
+            logger.warning(f"lineage: write cache failed: {e}")
+
+
+def analyze_file(file_name):
+    """返回 {'reads': [...], 'writes': [...]}，文件未修改时使用缓存"""
+    global _cache_changed
+    stat = os.stat(file_name)
+    with _cache_lock:
+        cache = load_cache()
+        item = cache.get(file_name)
+        if (item and item.get('version') == PARSER_VERSION and item['mtime_ns'] == stat.st_mtime_ns
+                and item['size'] == stat.st_size):
+            return {'reads': item['reads'], 'writes': item['writes']}
+    if load.is_load_step(file_name):
+        reads, writes = [], [qualify(table_name(load.read_spec(file_name)['table'].lower()))]
+    else:
+        reads, writes = parse_sql(etl_log.read_sql_file(file_name))
+    with _cache_lock:
+        cache[file_name] = {'version': PARSER_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                            'reads': reads, 'writes': writes}
+        _cache_changed = True
+    return {'reads': reads, 'writes': writes}
+
+
+def analyze_dir(sql_dir):
+    """分析目录下(含子目录)的全部 sql 文件，返回 {sql文件: {'reads', 'writes'}}"""
+    result = {}
+    for root, _, files in sorted(os.walk(sql_dir)):
+        for file in sorted(files):
+            if file.endswith('.sql') or load.is_load_step(file):
+                file_name = os.path.join(root, file)
+                result[file_name] = analyze_file(file_name)
+    save_cache()
+    return result
+
+
+def analyze_steps(steps):
+    """返回 {步骤名: {'reads', 'writes'}}；sql 文件不存在时读写为空"""
+    result = {}
+    for step in steps:
+        try:
+            result[step['mapping_name']] = analyze_file(step['sql_file'])
+        except OSError as e:
+            logger.warning(f"lineage: {step['sql_file']} skipped: {e}")
+            result[step['mapping_name']] = {'reads': [], 'writes': []}
+    save_cache()
+    return result
+
+
+def step_upstreams(steps, tables):
+    """返回 {步骤名: 上游步骤名集合}：after 声明的依赖，以及 sql_list 中排在前面、写入了本步骤所读表的步骤"""
+    upstreams = {}
+    for i, step in enumerate(steps):
+        name = step['mapping_name']
+        reads = set(tables[name]['reads'])
+        upstreams[name] = set(step['after'])
+        for before in steps[:i]:
+            if reads & set(tables[before['mapping_name']]['writes']):
+                upstreams[name].add(before['mapping_name'])
+        upstreams[name].discard(name)
+    return upstreams
+
+
+def downstream_steps(tables, upstreams, target):
+    """返回 target(表名或步骤名)下游的步骤名集合：target 为步骤时包含它本身，为表时从读取该表的步骤开始"""
+    target = target.lower()
+    if target in tables:
+        selected = {target}
+    else:
+        target = qualify(table_name(target))
+        selected = {name for name, item in tables.items() if target in item['reads']}
+        if not selected:
+            raise ValueError(f"lineage: '{target}' is neither a step nor a table read by any step")
+    changed = True
+    while changed:
+        changed = False
+        for name, names in upstreams.items():
+            if name not in selected and names & selected:
+                selected.add(name)
+                changed = True
+    return selected
+
+
+def select_downstream(steps, target):
+    """只保留 target 下游的步骤；有依赖标注的 sql_list 把血缘上的上游补充到 after，按拓扑序并行执行，
+    没有依赖标注时保持按行顺序串行(行顺序即拓扑序)"""
+    tables = analyze_steps(steps)
+    upstreams = step_upstreams(steps, tables)
+    selected = downstream_steps(tables, upstreams, target)
+    if not sql_list.has_dependencies(steps):
+        return [step for step in steps if step['mapping_name'] in selected]
+    return [dict(step, after=sorted(upstreams[step['mapping_name']] & selected))
+            for step in steps if step['mapping_name'] in selected]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import codecs
+import csv
+import datetime
+import re
+
+import yaml
+
+from utils import common
+
+logger = common.get_logger(__name__)
+
+LOAD_MODES = ('replace', 'upsert', 'append')
+LOAD_SUFFIXES = ('.yml', '.yaml')
+
+TABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*(\.[A-Za-z_][A-Za-z0-9_$]*)?$')
+COLUMN_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+COLUMN_TYPES_SQL = """
+select a.attname, format_type(a.atttypid, a.atttypmod)
+from pg_attribute a
+where a.attrelid = %s::regclass and a.attnum > 0 and not a.attisdropped
+order by a.attnum
+"""
+
+
+# --------------------------------
+# CSV 装载步骤
+# --------------------------------
+# sql_list 中写 .yml 装载配置代替 sql 文件(示例 etl/load_dim_language.yml)：
+#   file 为 csv 文件，table 为目标表，columns 为 表头 -> 列 的映射(不写时表头即列名，未映射的表头忽略)，
+#   mode 为 replace(删除全表后插入)/upsert(按 key 插入或更新，需唯一约束)/append，encoding、delimiter 为文件格式
+# 文件不经过 python 逐行解析：COPY FROM STDIN 直接读文件(服务端按 encoding 转码)写入全部为 text 列的临时表，
+# 再按目标表的列类型转换后写入目标表；同一事务内完成，读目标表的查询看不到中间状态
+def is_load_step(file_name):
+    return file_name.lower().endswith(LOAD_SUFFIXES)
+
+
+def read_spec(file_name):
+    with open(file_name, encoding='utf-8', mode='r') as f:
+        spec = yaml.safe_load(f) or {}
+    spec = {'file': spec.get('file'), 'table': spec.get('table'), 'columns': spec.get('columns') or {},
+            'mode': spec.get('mode') or 'replace', 'key': spec.get('key') or [],
+            'encoding': spec.get('encoding') or 'utf-8', 'delimiter': spec.get('delimiter') or ','}
+    if not spec['file'] or not spec['table']:
+        raise ValueError(f"load: {file_name} requires file and table")
+    if not TABLE_NAME.match(spec['table']):
+        raise ValueError(f"load: invalid table '{spec['table']}'")
+    if spec['mode'] not in LOAD_MODES:
+        raise ValueError(f"load: unknown mode '{spec['mode']}', expected one of {','.join(LOAD_MODES)}")
+    if isinstance(spec['key'], str):
+        spec['key'] = [spec['key']]
+    if spec['mode'] == 'upsert' and not spec['key']:
+        raise ValueError("load: mode upsert requires key")
+    if len(spec['delimiter']) != 1:
+        raise ValueError(f"load: delimiter must be one character, got '{spec['delimiter']}'")
+    return spec
+
+
+def read_header(file_name, encoding='utf-8', delimiter=','):
+    # utf-8 文件可能带 BOM(Excel 导出)
+    if codecs.lookup(encoding).name == 'utf-8':
+        encoding = 'utf-8-sig'
+    with open(file_name, encoding=encoding, mode='r', newline='') as f:
+        header = next(csv.reader(f, delimiter=delimiter), None)
+    if not header:
+        raise ValueError(f"load: {file_name} is empty")
+    return [name.strip() for name in header]
+
+
+def column_mapping(header, columns, table_columns):
+    """返回 [(csv列序号, 目标列)]；没有 columns 映射时按表头同名匹配"""
+    if columns:
+        unknown = [name for name in columns if name not in header]
+        if unknown:
+            raise ValueError(f"load: columns not in csv header: {','.join(unknown)}")
+        mapping = [(header.index(name), column) for name, column in columns.items()]
+    else:
+        mapping = [(i, name) for i, name in enumerate(header) if name in table_columns]
+    missing = [column for _, column in mapping if column not in table_columns]
+    if missing:
+        raise ValueError(f"load: columns not in target table: {','.join(missing)}")
+    if not mapping:
+        raise ValueError("load: no csv column matches the target table")
+    return mapping
+
+
+def load_sql(spec, mapping, table_columns):
+    """临时表写入目标表的 sql"""
+    table = spec['table']
+    targets = [column for _, column in mapping]
+    select = ', '.join(f"c{i}::{table_columns[column]}" for i, column in mapping)
+    insert = f"insert into {table} ({', '.join(targets)}) select {select} from etl_load_stage"
+    if spec['mode'] == 'replace':
+        return f"delete from {table};\n{insert}"
+    if spec['mode'] == 'upsert':
+        for column in spec['key']:
+            if column not in targets:
+                raise ValueError(f"load: key column {column} is not loaded")
+        updates = [column for column in targets if column not in spec['key']]
+        action = (f"do update set {', '.join(f'{column} = excluded.{column}' for column in updates)}"
+                  if updates else 'do nothing')
+        return f"{insert}\non conflict ({', '.join(spec['key'])}) {action}"
+    return insert
+
+
+def load_csv(conn, spec, pg_params, timeout_sql='', save_sql='', stats=None):
+    """conn 为步骤的连接(自动提交)，返回写入的行数；文件路径、行数、耗时追加到 stats"""
+    file_name = spec['file']
+    header = read_header(file_name, spec['encoding'], spec['delimiter'])
+    start = datetime.datetime.now()
+    with conn.cursor() as cur:
+        cur.execute(COLUMN_TYPES_SQL, (spec['table'],))
+        table_columns = dict(cur.fetchall())
+        mapping = column_mapping(header, spec['columns'], table_columns)
+        for _, column in mapping:
+            if not COLUMN_NAME.match(column):
+                raise ValueError(f"load: invalid column '{column}'")
+        insert_sql = load_sql(spec, mapping, table_columns)
+        stage_columns = ', '.join(f"c{i} text" for i in range(len(header)))
+        encoding = codecs.lookup(spec['encoding']).name.replace('-', '')
+        delimiter = spec['delimiter'].replace("'", "''")
+        cur.execute(f"BEGIN;\n{timeout_sql}\ncreate temp table etl_load_stage ({stage_columns}) on commit drop;")
+        with open(file_name, mode='rb') as f:
+            cur.copy_expert(f"copy etl_load_stage from stdin with (format csv, header true, "
+                            f"delimiter '{delimiter}', encoding '{encoding}')", f, size=1024 * 1024)
+        cur.execute(insert_sql)
+        rows = cur.rowcount
+        cur.execute(f"{save_sql}\nCOMMIT;", pg_params)
+    logger.info(f"load: {file_name} -> {spec['table']} {spec['mode']}, {rows} rows.")
+    if stats is not None:
+        stats.append({'statement_no': 1, 'statement_text': f"{file_name} -> {spec['table']} ({spec['mode']})",
+                      'start_datetime': start,
+                      'duration_ms': round((datetime.datetime.now() - start).total_seconds() * 1000, 3),
+                      'row_count': rows, 'plan_text': None, 'error_info': None})
+    return rows
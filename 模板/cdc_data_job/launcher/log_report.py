@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import csv
+import datetime
+import glob
+import gzip
+import html
+import json
+import math
+import os
+import re
+import sys
+
+from launcher import sql_list
+
+# 文本日志：2023-03-20 20:47:51,392 INFO 10320-executor.py-54: sql: etl/etl_start.sql execution start.
+# 毫秒部分可能缺失或不是数字(早期的日志格式)
+LINE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?:[,.](\w+))? ([A-Z]+) (\d+)-.*?-\d+: (.*)$')
+STEP_PATTERN = re.compile(r'^sql: (\S+) (execution start|executed successfully|execution failed|'
+                          r'execution timeout, cancelled|skipped|not executed)\b')
+SQL_FILE_PATTERN = re.compile(r"([\w./-]+\.(?:sql|yml))")
+ERROR_LEVELS = ('ERROR', 'CRITICAL')
+# 步骤结束行 -> 结果
+END_EVENTS = {'executed successfully': 'success', 'execution failed': 'failed',
+              'execution timeout, cancelled': 'timeout'}
+
+# 耗时分桶：相邻桶相差 10%，分位数的误差在 5% 以内，每个步骤每天最多几百个桶
+BUCKET_BASE = 1.1
+MIN_SECONDS = 0.001
+# 最多保留的错误类型数，超过后计入 (other)
+MAX_ERRORS = 1000
+# 出现在 2 天以上或累计达到该次数的错误视为反复出现
+RECURRING_COUNT = 3
+
+STEP_COLUMNS = ['day', 'step', 'runs', 'success', 'failed', 'timeout', 'skipped', 'unfinished',
+                'avg_seconds', 'p50_seconds', 'p95_seconds', 'p99_seconds', 'max_seconds', 'p50_change']
+ERROR_COLUMNS = ['signature', 'count', 'days', 'first_seen', 'last_seen', 'recurring', 'steps', 'example']
+
+
+class LatencyStats(object):
+    """耗时分布：按对数分桶计数，内存与样本数无关"""
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = {}  # 桶号 -> 次数
+
+    def add(self, seconds):
+        seconds = max(seconds, 0.0)
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        index = int(math.floor(math.log(max(seconds, MIN_SECONDS) / MIN_SECONDS, BUCKET_BASE)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # 桶的几何中点，限制在实际的最小值、最大值之间
+                return max(min(MIN_SECONDS * BUCKET_BASE ** (index + 0.5), self.max), self.min)
+        return self.max
+
+
+# --------------------------------
+# 日志分析
+# --------------------------------
+# 一次顺序读取 logs/etl.log.*(含 .gz)，按进程号 + sql 文件配对步骤的开始、结束行，得到每天每个步骤的耗时分布；
+# json 格式的日志(resource/log_config.yml 的 json formatter)直接使用 duration，按 window 区分补数中同时执行的周期。
+# ERROR 日志按去掉引号内容、数字后的首行归类，统计次数、天数和涉及的步骤。
+# 只保留执行中步骤的开始时间和按天、步骤汇总的分桶计数，内存与日志大小无关
+class LogReport(object):
+
+    def __init__(self):
+        self.steps = {}  # (day, step) -> 统计
+        self.running = {}  # 进程号 -> {(sql文件, 周期): [开始时间]}
+        self.errors = {}  # 错误类型 -> 统计
+        self.files = 0
+        self.lines = 0
+
+    def step_stats(self, day, step):
+        stats = self.steps.get((day, step))
+        if stats is None:
+            stats = self.steps[(day, step)] = {'latency': LatencyStats(), 'success': 0, 'failed': 0, 'timeout': 0,
+                                               'skipped': 0, 'unfinished': 0}
+        return stats
+
+    def feed_files(self, paths):
+        for path in paths:
+            self.feed_file(path)
+        self.finish()
+
+    def feed_file(self, path):
+        self.files += 1
+        if path.endswith('.gz'):
+            f = gzip.open(path, mode='rt', encoding='utf-8', errors='replace')
+        else:
+            f = open(path, encoding='utf-8', mode='r', errors='replace')
+        with f:
+            for line in f:
+                self.feed_line(line)
+
+    def feed_line(self, line):
+        self.lines += 1
+        if line.startswith('{'):
+            try:
+                item = json.loads(line)
+            except ValueError:
+                return
+            self.feed_record(item.get('time', '').replace('T', ' '), item.get('level'), str(item.get('process')),
+                             item.get('message') or '', item.get('window'), item.get('duration'), item.get('step'))
+            return
+        match = LINE_PATTERN.match(line)
+        if match is None:
+            # 多行日志(sql 错误信息等)的后续行
+            return
+        timestamp, millis, level, process, message = match.groups()
+        if millis and millis.isdigit():
+            timestamp = f"{timestamp}.{millis[:6]}"
+        self.feed_record(timestamp, level, process, message)
+
+    def feed_record(self, timestamp, level, process, message, window=None, duration=None, step=None):
+        if message.startswith('sql: '):
+            match = STEP_PATTERN.match(message)
+            if match is not None:
+                self.feed_step(timestamp, process, match.group(1), match.group(2), window, duration)
+        elif 'etl begin' in message:
+            # 同一进程号重新开始(进程被杀后进程号复用)，之前未结束的步骤记为未结束
+            self.close_process(process)
+        if level in ERROR_LEVELS:
+            self.feed_error(timestamp, message, step)
+
+    def feed_step(self, timestamp, process, sql_file, event, window=None, duration=None):
+        day = timestamp[:10]
+        if event in ('skipped', 'not executed'):
+            self.step_stats(day, sql_list.get_mapping_name(sql_file))['skipped'] += 1
+            return
+        key = (sql_file, window)
+        starts = self.running.setdefault(process, {}).setdefault(key, [])
+        if event == 'execution start':
+            starts.append(timestamp)
+            return
+        # 同一进程同一步骤同时执行多个周期(文本日志中无法区分)时按先开始先结束配对
+        start = starts.pop(0) if starts else None
+        if not starts:
+            del self.running[process][key]
+            if not self.running[process]:
+                del self.running[process]
+        if start is not None:
+            day = start[:10]
+        stats = self.step_stats(day, sql_list.get_mapping_name(sql_file))
+        stats[END_EVENTS[event]] += 1
+        if duration is None and start is not None:
+            duration = (parse_time(timestamp) - parse_time(start)).total_seconds()
+        if duration is not None:
+            stats['latency'].add(float(duration))
+
+    def close_process(self, process):
+        for (sql_file, _), starts in self.running.pop(process, {}).items():
+            for start in starts:
+                self.step_stats(start[:10], sql_list.get_mapping_name(sql_file))['unfinished'] += 1
+
+    def feed_error(self, timestamp, message, step=None):
+        signature = error_signature(message)
+        item = self.errors.get(signature)
+        if item is None:
+            if len(self.errors) >= MAX_ERRORS:
+                signature = '(other)'
+                item = self.errors.get(signature)
+            if item is None:
+                item = self.errors[signature] = {'count': 0, 'days': set(), 'first_seen': timestamp[:19],
+                                                 'last_seen': timestamp[:19], 'steps': set(), 'example': message}
+        item['count'] += 1
+        item['days'].add(timestamp[:10])
+        item['last_seen'] = max(item['last_seen'], timestamp[:19])
+        item['first_seen'] = min(item['first_seen'], timestamp[:19])
+        # 涉及的步骤：json 日志取 step，文本日志取错误信息中的 sql 文件名，最多记录 20 个
+        if len(item['steps']) < 20:
+            item['steps'].update([step] if step else
+                                 (sql_list.get_mapping_name(name) for name in SQL_FILE_PATTERN.findall(message)))
+
+    def finish(self):
+        for process in list(self.running):
+            self.close_process(process)
+
+    def step_rows(self):
+        rows = []
+        previous = {}  # 步骤 -> 前一天的 p50
+        for day, step in sorted(self.steps, key=lambda key: (key[1], key[0])):
+            stats = self.steps[(day, step)]
+            latency = stats['latency']
+            p50 = latency.quantile(0.5)
+            change = None
+            if p50 is not None:
+                if previous.get(step):
+                    change = round(p50 / previous[step], 2)
+                previous[step] = p50
+            rows.append({'day': day, 'step': step,
+                         'runs': stats['success'] + stats['failed'] + stats['timeout'],
+                         'success': stats['success'], 'failed': stats['failed'], 'timeout': stats['timeout'],
+                         'skipped': stats['skipped'], 'unfinished': stats['unfinished'],
+                         'avg_seconds': round_seconds(latency.total / latency.count if latency.count else None),
+                         'p50_seconds': round_seconds(p50), 'p95_seconds': round_seconds(latency.quantile(0.95)),
+                         'p99_seconds': round_seconds(latency.quantile(0.99)),
+                         'max_seconds': round_seconds(latency.max if latency.count else None), 'p50_change': change})
+        return rows
+
+    def error_rows(self):
+        rows = []
+        for signature, item in sorted(self.errors.items(), key=lambda pair: -pair[1]['count']):
+            rows.append({'signature': signature, 'count': item['count'], 'days': len(item['days']),
+                         'first_seen': item['first_seen'], 'last_seen': item['last_seen'],
+                         'recurring': int(len(item['days']) > 1 or item['count'] >= RECURRING_COUNT),
+                         'steps': ','.join(sorted(item['steps'])), 'example': item['example'][:500]})
+        return rows
+
+
+def parse_time(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+def round_seconds(value):
+    return None if value is None else round(value, 3)
+
+
+def error_signature(message):
+    """去掉引号内的内容(文件名、对象名)和数字，同一类错误归为一个"""
+    message = message.strip()
+    message = re.sub(r"'[^']*'|\"[^\"]*\"", "'?'", message)
+    message = re.sub(r'\d+', 'N', message)
+    return message[:200]
+
+
+def list_files(patterns):
+    """按日期顺序列出日志文件：etl.log.YYYY-MM-DD(.gz) 在前，当前的 etl.log 最后"""
+    paths = set()
+    for pattern in patterns:
+        paths.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+    def sort_key(path):
+        match = re.search(r'(\d{4}-\d{2}-\d{2})', os.path.basename(path))
+        return (match.group(1) if match else '9999-99-99', path)
+
+    return sorted(paths, key=sort_key)
+
+
+# --------------------------------
+# 输出
+# --------------------------------
+def write_csv(report, output=None):
+    """output 为空时输出到标准输出；否则步骤耗时写 output，错误写同目录的 <output>_errors.csv"""
+    if output is None:
+        write_csv_rows(sys.stdout, STEP_COLUMNS, report.step_rows())
+        sys.stdout.write('\n')
+        write_csv_rows(sys.stdout, ERROR_COLUMNS, report.error_rows())
+        return [None]
+    root, ext = os.path.splitext(output)
+    error_output = f"{root}_errors{ext or '.csv'}"
+    for path, columns, rows in ((output, STEP_COLUMNS, report.step_rows()),
+                                (error_output, ERROR_COLUMNS, report.error_rows())):
+        with open(path, encoding='utf-8-sig', mode='w', newline='') as f:
+            write_csv_rows(f, columns, rows)
+    return [output, error_output]
+
+
+def write_csv_rows(f, columns, rows):
+    writer = csv.DictWriter(f, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def write_html(report, output=None):
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>ETL 日志分析</title>',
+             '<style>body{font-family:sans-serif;font-size:13px}table{border-collapse:collapse;margin-bottom:24px}'
+             'th,td{border:1px solid #ccc;padding:2px 6px;text-align:left}.slow{background:#fde2e2}</style>',
+             '</head><body>',
+             f"<p>{report.files} 个文件，{report.lines} 行</p>",
+             '<h3>步骤耗时(秒)</h3>', html_table(STEP_COLUMNS, report.step_rows(), slow_column='p50_change'),
+             '<h3>错误</h3>', html_table(ERROR_COLUMNS, report.error_rows()), '</body></html>']
+    content = '\n'.join(parts) + '\n'
+    if output is None:
+        sys.stdout.write(content)
+    else:
+        with open(output, encoding='utf-8', mode='w') as f:
+            f.write(content)
+    return [output]
+
+
+def html_table(columns, rows, slow_column=None):
+    lines = ['<table>', '<tr>' + ''.join(f"<th>{column}</th>" for column in columns) + '</tr>']
+    for row in rows:
+        # 中位数比前一天慢 50% 以上的行标红
+        slow = slow_column and row.get(slow_column) is not None and row[slow_column] >= 1.5
+        cells = ''.join(f"<td>{html.escape('' if row[column] is None else str(row[column]))}</td>"
+                        for column in columns)
+        lines.append(f"<tr class=\"slow\">{cells}</tr>" if slow else f"<tr>{cells}</tr>")
+    lines.append('</table>')
+    return '\n'.join(lines)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+
+from launcher import backfill, executor, run_lock
+from service import alert
+from utils import common
+
+logger = common.get_logger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# --------------------------------
+# 微批
+# --------------------------------
+# 每个 sql_list 在 public.etl_watermark 中保存已处理到的时间(高水位)，每次运行从高水位处理到
+# (当前时间 - 延迟容忍) 按 batch_minutes 对齐的时间；全部步骤成功才推进高水位，
+# 失败或落后时下一次运行把积压的周期合并为一批(最长 max_batch_minutes 分钟)补上
+def floor_time(moment, minutes):
+    day_start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    passed = int((moment - day_start).total_seconds() // 60)
+    return day_start + datetime.timedelta(minutes=passed - passed % minutes)
+
+
+def next_window(watermark, now, batch_minutes=5, lateness_minutes=0, max_batch_minutes=60):
+    """返回 (begin, end)，没有完整的新周期时返回 None；watermark 为空时从上一个周期开始"""
+    end = floor_time(now - datetime.timedelta(minutes=lateness_minutes), batch_minutes)
+    begin = watermark if watermark is not None else end - datetime.timedelta(minutes=batch_minutes)
+    if end <= begin:
+        return None
+    if max_batch_minutes and end - begin > datetime.timedelta(minutes=max_batch_minutes):
+        end = begin + datetime.timedelta(minutes=max_batch_minutes)
+    return begin, end
+
+
+def get_watermark(conn, name):
+    with conn.cursor() as cur:
+        cur.execute('select high_water from public.etl_watermark where name = %s', (name,))
+        row = cur.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+
+def set_watermark(conn, name, high_water, run_id=None):
+    sql = """
+        insert into public.etl_watermark (name, high_water, run_id, update_datetime)
+        values (%(name)s, %(high_water)s, %(run_id)s, localtimestamp)
+        on conflict (name)
+        do update set high_water = excluded.high_water, run_id = excluded.run_id, update_datetime = excluded.update_datetime
+        """
+    with conn.cursor() as cur:
+        cur.execute(sql, {'name': name, 'high_water': high_water, 'run_id': run_id})
+    conn.commit()
+
+
+def run_micro_batch(sql_list_file_name, pool, batch_minutes=5, lateness_minutes=0, max_batch_minutes=60,
+                    workers=1, options=None, **pg_params):
+    """运行一个微批，返回 sql_list 的执行结果；没有新周期或其他进程正在运行时返回 {}
+    pg_params 中的 begin_date 只在第一次运行(还没有高水位)时作为起点"""
+    try:
+        conn = pool.getconn()
+    except Exception as e:
+        alert.warn('database:connection', f"数据库连接异常：{e}")
+        return {}
+    # 同一个 sql_list 同时只有一个微批在计算周期、推进高水位
+    lock_key = run_lock.lock_key(sql_list_file=sql_list_file_name, mapping_name='micro_batch')
+    try:
+        if not run_lock.acquire(conn, lock_key, 'skip'):
+            logger.info(f"micro batch: {sql_list_file_name} is running in another process, skipped.")
+            return {}
+        try:
+            return run_window(conn, sql_list_file_name, pool, batch_minutes, lateness_minutes, max_batch_minutes,
+                              workers, options, **pg_params)
+        except Exception as e:
+            logger.error(f"micro batch: {sql_list_file_name} failed: {e}")
+            alert.warn(f"{sql_list_file_name}:micro_batch", f"ETL微批异常，sql_list：{sql_list_file_name}，{e}")
+            return {}
+        finally:
+            run_lock.release(conn, lock_key)
+    finally:
+        pool.putconn(conn)
+
+
+def run_window(conn, sql_list_file_name, pool, batch_minutes, lateness_minutes, max_batch_minutes, workers, options,
+               **pg_params):
+    watermark = get_watermark(conn, sql_list_file_name)
+    if watermark is None and pg_params.get('begin_date'):
+        watermark = backfill.parse_date(pg_params['begin_date'])
+    window = next_window(watermark, datetime.datetime.now(), batch_minutes, lateness_minutes, max_batch_minutes)
+    if window is None:
+        logger.info(f"micro batch: {sql_list_file_name} is up to date, high water {watermark}.")
+        return {}
+    begin_date, end_date = (moment.strftime(DATE_FORMAT) for moment in window)
+    merged = (window[1] - window[0]) // datetime.timedelta(minutes=batch_minutes)
+    logger.info(f"micro batch: {sql_list_file_name} {begin_date} ~ {end_date}"
+                + (f", {merged} windows merged." if merged > 1 else "."))
+    window_params = dict(pg_params, begin_date=begin_date, end_date=end_date,
+                         parameter_values=f"begin_date={begin_date},end_date={end_date}")
+    results = executor.call_sql_files(sql_list_file_name, pool=pool, workers=workers, options=options,
+                                      **window_params)
+    if results and all(status in executor.SUCCESS_STATUSES for status in results.values()):
+        set_watermark(conn, sql_list_file_name, window[1], pg_params.get('run_id'))
+        logger.info(f"micro batch: {sql_list_file_name} high water advanced to {end_date}.")
+    else:
+        # 失败的步骤已单独告警
+        logger.warning(f"micro batch: {sql_list_file_name} not all steps succeeded, high water stays at {begin_date}.")
+    return results
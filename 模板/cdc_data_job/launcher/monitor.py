@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+import json
+import math
+import select
+import threading
+import time
+
+import psycopg2
+import yaml
+
+from launcher import baseline, executor, scheduler
+from service import alert
+from utils import common, metrics
+
+logger = common.get_logger(__name__)
+
+# 与 etl/ddl/etl_log_notify.sql 中的通道一致
+CHANNEL = 'etl_log_status'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# 收到即告警的状态；依赖失败(2)由上游步骤的失败告警覆盖，跳过(4、6)不告警
+ALERT_STATUSES = {executor.STATUS_FAILED: '失败', executor.STATUS_TIMEOUT: '超时被取消',
+                  executor.STATUS_LOCK_FAILED: '加锁失败'}
+# 连接空闲时每隔该秒数重新读取步骤耗时基线，同时及时发现断开的连接
+CHECK_SECONDS = 60
+
+NOTIFICATIONS = metrics.counter('etl_monitor_notifications_total', '收到的 etl_log 状态通知数')
+ALERTS = metrics.counter('etl_monitor_alerts_total', '监控程序发出的告警数', ('kind',))
+RUNNING_STEPS = metrics.gauge('etl_monitor_running_steps', '执行中的步骤数')
+
+REBUILD_SQL = """
+select id, etl_name, status, to_char(start_datetime, 'YYYY-MM-DD HH24:MI:SS') start_datetime, error_info
+from public.etl_log
+where start_datetime >= %(since)s
+order by start_datetime
+"""
+
+
+def load_config(config_file):
+    """读取监控配置，见 resource/monitor.yml"""
+    with open(config_file, encoding='utf-8', mode='r') as f:
+        conf = yaml.safe_load(f) or {}
+    expects = []
+    for item in conf.get('expect') or []:
+        expects.append({'name': item['name'], 'step': item.get('step', 'etl_start').lower(),
+                        'cron': scheduler.parse_cron(item['cron']), 'cron_expr': item['cron'],
+                        'grace_minutes': float(item.get('grace_minutes', 10))})
+    return {'timeout_minutes': float(conf.get('timeout_minutes', 30)),
+            'step_timeout_minutes': {name.lower(): float(minutes)
+                                     for name, minutes in (conf.get('step_timeout_minutes') or {}).items()},
+            'lookback_hours': float(conf.get('lookback_hours', 24)), 'expect': expects}
+
+
+def parse_time(value):
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, DATE_FORMAT)
+
+
+# --------------------------------
+# 时间轮
+# --------------------------------
+# 哈希时间轮：按到期的 tick(秒)放入 tick % slots 号槽，添加、取消 O(1)，
+# 每个 tick 只检查当前槽中到期的项(超过一圈的项留在槽中等下一圈)，不随执行中的步骤数扫描
+class TimerWheel(object):
+
+    def __init__(self, slots=3600, tick_seconds=1.0, now=None):
+        self.tick_seconds = tick_seconds
+        self.slots = [{} for _ in range(slots)]
+        self.current_tick = int((now if now is not None else time.time()) / tick_seconds)
+        self._index = {}  # key -> 槽号
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, key, deadline, value=None):
+        """deadline 为时间戳(秒)，同一 key 再次添加时替换；已过期的在下一个 tick 到期"""
+        self.cancel(key)
+        tick = max(int(math.ceil(deadline / self.tick_seconds)), self.current_tick + 1)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = (tick, value)
+        self._index[key] = slot
+
+    def cancel(self, key):
+        slot = self._index.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def clear(self):
+        for bucket in self.slots:
+            bucket.clear()
+        self._index.clear()
+
+    def advance(self, now):
+        """推进到 now，返回到期的 [(key, value)]"""
+        target = int(now / self.tick_seconds)
+        # 停顿超过一圈(如进程挂起)时每个槽只需检查一次
+        first = max(self.current_tick + 1, target - len(self.slots) + 1)
+        due = []
+        for tick in range(first, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            for key, (deadline_tick, value) in list(bucket.items()):
+                if deadline_tick <= target:
+                    del bucket[key]
+                    del self._index[key]
+                    due.append((key, value))
+        self.current_tick = max(self.current_tick, target)
+        return due
+
+    def wait_seconds(self, now):
+        """距离下一个 tick 的秒数"""
+        return max((self.current_tick + 1) * self.tick_seconds - now, 0)
+
+
+# --------------------------------
+# 常驻监控
+# --------------------------------
+# LISTEN etl_log_status(etl_log 上的触发器在插入、状态变化时 NOTIFY)，内存中保存执行中的步骤及其超时时间：
+#   失败、超时被取消、加锁失败：收到通知即告警；
+#   执行中超过 timeout_minutes：时间轮到期时仍未结束则告警；
+#   执行中超过 k 倍 p95(步骤耗时基线，见 launcher/baseline.py)：比 timeout_minutes 早到期时告警变慢；
+#   未运行：expect 中的步骤在 cron 时间 + grace_minutes 时还没有开始则告警；
+# 启动或断线重连时先 LISTEN，再用一条按 start_datetime 索引的查询重建执行中的步骤(期间的通知在重建后处理)，
+# 重建时不补发已结束步骤的失败告警；监控启动前就已超时的执行中记录(多为已退出的进程留下的)不告警、不计入执行中，
+# 本进程已告警过的超时、变慢在断线重连后不重复告警
+class EtlMonitor(object):
+
+    def __init__(self, config, **pg_params):
+        self.config = config
+        self.pg_params = pg_params
+        self._stop = threading.Event()
+        self.wheel = TimerWheel()
+        self.running = {}  # etl_log.id -> 事件
+        self.last_start = {}  # 步骤名 -> 最近开始时间
+        self.baselines = {}  # 步骤名 -> p95 耗时(秒)
+        self.started_at = datetime.datetime.now()
+        self.alerted = set()  # 已告警的 (timeout/slow, etl_log.id)
+        self.stale = []  # 重建时跳过的、监控启动前已超时的 etl_log.id
+        RUNNING_STEPS.set_function(lambda: len(self.running))
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        interval = 1
+        while not self._stop.is_set():
+            try:
+                self.run()
+                interval = 1
+            except Exception as e:
+                logger.error(f"monitor: listen failed, reconnect in {interval}s: {e}")
+                alert.warn('monitor:listen', f"监控程序异常：{e}")
+                self._stop.wait(interval)
+                interval = min(interval * 2, 60)
+
+    def connect(self):
+        conn = psycopg2.connect(host=self.pg_params['pg_host'],
+                                port=self.pg_params['pg_port'],
+                                dbname=self.pg_params['pg_dbname'],
+                                user=self.pg_params['pg_user'],
+                                password=self.pg_params['pg_password'],
+                                keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        conn.autocommit = True
+        return conn
+
+    def run(self):
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"listen {CHANNEL}")
+                self.rebuild(cur)
+            logger.info(f"monitor: listening on {CHANNEL}, {len(self.running)} steps running.")
+            last_check = time.time()
+            while not self._stop.is_set():
+                ready, _, _ = select.select([conn], [], [], min(self.wheel.wait_seconds(time.time()), 1))
+                if ready:
+                    conn.poll()
+                    while conn.notifies:
+                        NOTIFICATIONS.inc()
+                        self.handle(json.loads(conn.notifies.pop(0).payload))
+                elif time.time() - last_check >= CHECK_SECONDS:
+                    with conn.cursor() as cur:
+                        self.load_baselines(cur)
+                    last_check = time.time()
+                for key, value in self.wheel.advance(time.time()):
+                    self.fire(value)
+        finally:
+            conn.close()
+
+    def rebuild(self, cur):
+        """重建执行中的步骤、各步骤最近开始时间和未运行检查"""
+        self.wheel.clear()
+        self.running.clear()
+        self.last_start.clear()
+        self.stale = []
+        self.load_baselines(cur)
+        since = datetime.datetime.now() - datetime.timedelta(hours=self.config['lookback_hours'])
+        cur.execute(REBUILD_SQL, {'since': since})
+        columns = [column.name for column in cur.description]
+        for row in cur.fetchall():
+            self.handle(dict(zip(columns, row)), replay=True)
+        self.alerted = {item for item in self.alerted if item[1] in self.running}
+        if self.stale:
+            logger.warning(f"monitor: {len(self.stale)} running steps timed out before the monitor started, "
+                           f"not alerted: {','.join(str(key) for key in self.stale[:20])}")
+        now = datetime.datetime.now()
+        for expect in self.config['expect']:
+            # 从宽限期还没过(或刚过 1 分钟内)的一次触发开始检查，重连期间错过的检查补做
+            after = now - datetime.timedelta(minutes=expect['grace_minutes'] + 1)
+            self.schedule_expect(expect, scheduler.next_fire_time(expect['cron'], after))
+
+    def load_baselines(self, cur):
+        cur.execute(baseline.CHECK_TABLE_SQL)
+        if not cur.fetchone()[0]:
+            self.baselines = {}
+            return
+        cur.execute(baseline.BASELINES_SQL, {'baseline_min_samples': baseline.config['min_samples']})
+        self.baselines = {name.lower(): float(p95_seconds) for name, p95_seconds in cur.fetchall()}
+
+    def timeout_minutes(self, etl_name):
+        return self.config['step_timeout_minutes'].get(etl_name, self.config['timeout_minutes'])
+
+    def handle(self, event, replay=False):
+        key = event['id']
+        name = (event['etl_name'] or '').lower()
+        start = parse_time(event['start_datetime'])
+        if start is not None and (name not in self.last_start or start > self.last_start[name]):
+            self.last_start[name] = start
+        if event['status'] == executor.STATUS_RUNNING:
+            deadline = None if start is None else start + datetime.timedelta(minutes=self.timeout_minutes(name))
+            if replay and deadline is not None and deadline < self.started_at:
+                self.stale.append(key)
+                return
+            self.running[key] = event
+            if start is not None:
+                self.schedule_alert('timeout', key, deadline)
+                if name in self.baselines:
+                    slow_deadline = start + datetime.timedelta(seconds=baseline.config['k'] * self.baselines[name])
+                    if slow_deadline < deadline:
+                        self.schedule_alert('slow', key, slow_deadline)
+            return
+        self.running.pop(key, None)
+        for kind in ('timeout', 'slow'):
+            self.wheel.cancel(f"{kind}:{key}")
+            self.alerted.discard((kind, key))
+        if not replay and event['status'] in ALERT_STATUSES:
+            content = f"监控程序：ETL任务{ALERT_STATUSES[event['status']]}:{key}"
+            if event.get('error_info'):
+                content += f"，{event['error_info']}"
+            logger.error(content)
+            alert.warn(f"{name}:monitor_status_{event['status']}", content)
+            ALERTS.labels(executor.STATUS_NAMES[event['status']]).inc()
+
+    def schedule_alert(self, kind, key, deadline):
+        if (kind, key) not in self.alerted:
+            self.wheel.add(f"{kind}:{key}", deadline.timestamp(), (kind, key))
+
+    def fire(self, value):
+        kind, item = value
+        if kind in ('timeout', 'slow'):
+            self.alerted.add(value)
+        if kind == 'timeout':
+            event = self.running.get(item)
+            if event is None:
+                return
+            name = event['etl_name'].lower()
+            content = (f"监控程序：ETL任务超时:{item}，开始于{event['start_datetime']}，"
+                       f"超过{self.timeout_minutes(name):g}分钟未结束")
+            logger.error(content)
+            alert.warn(f"{name}:monitor_timeout", content)
+            ALERTS.labels('running_timeout').inc()
+        elif kind == 'slow':
+            event = self.running.get(item)
+            if event is None:
+                return
+            name = event['etl_name'].lower()
+            content = (f"监控程序：ETL任务变慢:{item}，开始于{event['start_datetime']}，"
+                       f"已超过{baseline.config['k']:g}倍 p95({self.baselines.get(name, 0):g}秒)未结束")
+            logger.warning(content)
+            alert.warn(f"{name}:monitor_slow", content)
+            ALERTS.labels('slow').inc()
+        elif kind == 'expect':
+            expect, fire_time = item
+            started = self.last_start.get(expect['step'])
+            if started is None or started < fire_time:
+                content = f"监控程序：{expect['name']} {fire_time} 的ETL程序未运行({expect['step']}未开始)"
+                logger.error(content)
+                alert.warn(f"monitor:{expect['name']}:not_started", content)
+                ALERTS.labels('not_started').inc()
+            self.schedule_expect(expect, scheduler.next_fire_time(expect['cron'], fire_time))
+
+    def schedule_expect(self, expect, fire_time):
+        check_time = fire_time + datetime.timedelta(minutes=expect['grace_minutes'])
+        self.wheel.add(f"expect:{expect['name']}", check_time.timestamp(), ('expect', (expect, fire_time)))
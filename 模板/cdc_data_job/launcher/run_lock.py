@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import hashlib
+import struct
+import time
+
+from utils import common
+
+logger = common.get_logger(__name__)
+
+# 锁冲突时的处理方式
+LOCK_POLICIES = ('none', 'skip', 'wait', 'fail')
+
+
+def check_policy(policy):
+    """返回锁策略(未设置时为 none)，未知的策略抛出异常"""
+    policy = policy or 'none'
+    if policy not in LOCK_POLICIES:
+        raise ValueError(f"lock: unknown policy '{policy}', expected one of {','.join(LOCK_POLICIES)}")
+    return policy
+
+
+# --------------------------------
+# 步骤运行互斥
+# --------------------------------
+# 执行步骤前按 sql_list、步骤、周期取 postgres 会话级咨询锁(pg_try_advisory_lock)，不占用事务、不轮询表；
+# 步骤结束后释放，连接断开时数据库自动释放，不会残留
+def lock_key(**pg_params):
+    key = '|'.join(str(pg_params.get(name) or '') for name in ('sql_list_file', 'mapping_name', 'begin_date', 'end_date'))
+    # 取 md5 前 8 字节作为 bigint 锁键
+    return struct.unpack('>q', hashlib.md5(key.encode('utf-8')).digest()[:8])[0]
+
+
+def try_lock(conn, key):
+    with conn.cursor() as cur:
+        cur.execute('select pg_try_advisory_lock(%s)', (key,))
+        locked = cur.fetchone()[0]
+    conn.commit()
+    return locked
+
+
+def acquire(conn, key, policy='skip', wait_minutes=10):
+    """按策略取锁，返回是否取得：skip/fail 取不到立即返回，wait 按退避间隔重试到 wait_minutes 分钟"""
+    if try_lock(conn, key):
+        return True
+    if policy != 'wait':
+        return False
+    deadline = time.time() + wait_minutes * 60
+    interval = 1
+    while time.time() < deadline:
+        time.sleep(min(interval, max(deadline - time.time(), 0)))
+        if try_lock(conn, key):
+            return True
+        interval = min(interval * 2, 60)
+    return False
+
+
+def release(conn, key):
+    """释放锁；释放失败时关闭连接(由数据库释放锁)，避免带锁的连接回到连接池"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute('select pg_advisory_unlock(%s)', (key,))
+        conn.commit()
+    except Exception as e:
+        logger.warning(f"advisory unlock failed, close connection: {e}")
+        conn.close()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from launcher import executor
+from service import alert
+from utils import common, pg_pool
+
+logger = common.get_logger(__name__)
+
+# 数据库连接参数，重新读取的配置中这些参数变化时新建连接池
+CONNECTION_KEYS = ('pg_host', 'pg_port', 'pg_dbname', 'pg_user', 'pg_password')
+
+# cron 各字段的取值范围：分 时 日 月 周(0-6，0为周日，7也表示周日)
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+# --------------------------------
+# cron 表达式
+# --------------------------------
+# 支持 * 、*/n、a/n、a-b、a-b/n、a,b,c，如 "5 * * * *" 为每小时第5分钟
+def parse_field(expr, low, high):
+    values = set()
+    for part in expr.split(','):
+        step = None
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(item) for item in part.split('-', 1))
+        else:
+            # a/n 为从 a 到最大值每隔 n 个(与 crontab 一致)
+            start = int(part)
+            end = start if step is None else high
+        if start < low or end > high or start > end or (step is not None and step < 1):
+            raise ValueError(f"cron: invalid field '{expr}'")
+        values.update(range(start, end + 1, step or 1))
+    return values
+
+
+def parse_cron(expr):
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"cron: expected 5 fields: '{expr}'")
+    minutes, hours, days, months, weekdays = (parse_field(field, low, high)
+                                             for field, (low, high) in zip(fields, CRON_FIELDS))
+    if 7 in weekdays:
+        weekdays.add(0)
+    # 日、周都有限制时满足其一即可；以 * 开头(*、*/n)的字段视为不限制(与 crontab 一致)
+    return {'minutes': minutes, 'hours': hours, 'days': days, 'months': months, 'weekdays': weekdays,
+            'any_day': fields[2].startswith('*'), 'any_weekday': fields[4].startswith('*')}
+
+
+def day_match(cron, moment):
+    if moment.month not in cron['months']:
+        return False
+    day_ok = moment.day in cron['days']
+    weekday_ok = (moment.weekday() + 1) % 7 in cron['weekdays']
+    if cron['any_day'] or cron['any_weekday']:
+        return day_ok and weekday_ok
+    return day_ok or weekday_ok
+
+
+def cron_match(cron, moment):
+    return moment.minute in cron['minutes'] and moment.hour in cron['hours'] and day_match(cron, moment)
+
+
+def next_fire_time(cron, after):
+    """after 之后(不含)下一个满足 cron 的整分钟；日期、小时不满足时直接跳到下一天、下一小时"""
+    moment = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    # 最多查找 8 年(2月29日 最长间隔 8 年)，避免 2月30日 之类永远不触发的表达式死循环
+    limit = moment + datetime.timedelta(days=366 * 8)
+    while moment < limit:
+        if not day_match(cron, moment):
+            moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+        elif moment.hour not in cron['hours']:
+            moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+        elif moment.minute not in cron['minutes']:
+            moment += datetime.timedelta(minutes=1)
+        else:
+            return moment
+    raise ValueError("cron: expression never fires")
+
+
+# --------------------------------
+# 计算周期
+# --------------------------------
+# previous_hour：上一个整点小时，与 start_etl.sh 的小时任务一致
+# previous_day：前一天，与 start_etl.sh 的天任务一致
+def get_window(rule, fire_time):
+    if rule == 'previous_hour':
+        end = fire_time.replace(minute=0, second=0, microsecond=0)
+        begin = end - datetime.timedelta(hours=1)
+        return begin.strftime('%Y-%m-%d %H:00:00'), end.strftime('%Y-%m-%d %H:00:00')
+    if rule == 'previous_day':
+        end = fire_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        begin = end - datetime.timedelta(days=1)
+        return begin.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+    raise ValueError(f"schedule: unknown window rule '{rule}'")
+
+
+def load_schedule(schedule_file):
+    """读取调度配置，见 resource/schedule.yml"""
+    with open(schedule_file, encoding='utf-8', mode='r') as f:
+        conf = yaml.safe_load(f)
+    jobs = []
+    for item in conf.get('jobs') or []:
+        sql_list_files = item['sql_list_file']
+        if isinstance(sql_list_files, str):
+            sql_list_files = [sql_list_files]
+        jobs.append({'name': item['name'], 'cron': parse_cron(item['cron']), 'cron_expr': item['cron'],
+                     'sql_list_files': sql_list_files, 'window': item.get('window', 'previous_hour'),
+                     'workers': item.get('workers'), 'options': item.get('options') or {}})
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("schedule: duplicate job names")
+    return jobs
+
+
+def job_paths(job):
+    return {os.path.normpath(path) for path in job['sql_list_files']}
+
+
+# --------------------------------
+# 常驻调度
+# --------------------------------
+# 一个进程内按 cron 运行多个 sql_list，共用连接池；
+# 每次运行前用 load_config 重新读取配置(nacos 缓存过期时刷新，见 service/nacos_config.py)，
+# 读取失败时本次运行跳过并告警；数据库连接参数变化时新建连接池，旧连接池在没有运行中的 job 时关闭；
+# job 中的 sql_list 还在运行(上一次未结束，或在其他 job 中)时，本次触发跳过，同一个 sql_list 不会重叠运行
+class Scheduler(object):
+
+    def __init__(self, jobs, pool, run_params, load_config=None, **pg_params):
+        self.jobs = jobs
+        self.pool = pool
+        self.run_params = run_params
+        self.load_config = load_config
+        self.pg_params = pg_params
+        self._stop = threading.Event()
+        self._running = set()  # 运行中的 sql_list 路径
+        self._retired = []  # 配置变化后不再借出的连接池
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        now = datetime.datetime.now()
+        next_times = {job['name']: next_fire_time(job['cron'], now) for job in self.jobs}
+        for job in self.jobs:
+            logger.info(f"schedule: job {job['name']} '{job['cron_expr']}' next run at {next_times[job['name']]}.")
+        with ThreadPoolExecutor(max_workers=max(len(self.jobs), 1), thread_name_prefix='job') as thread_pool:
+            while not self._stop.is_set() and self.jobs:
+                fire_time = min(next_times.values())
+                wait_seconds = (fire_time - datetime.datetime.now()).total_seconds()
+                if wait_seconds > 0 and self._stop.wait(min(wait_seconds, 60)):
+                    break
+                if datetime.datetime.now() < fire_time:
+                    continue
+                for job in self.jobs:
+                    if next_times[job['name']] == fire_time:
+                        self.submit(thread_pool, job, fire_time)
+                        next_times[job['name']] = next_fire_time(job['cron'], fire_time)
+            logger.info("schedule: stopping, wait for running jobs.")
+
+    def submit(self, thread_pool, job, fire_time):
+        with self._lock:
+            paths = job_paths(job)
+            busy = sorted(self._running & paths)
+            if busy:
+                logger.warning(f"schedule: job {job['name']} skip run at {fire_time}, "
+                               f"sql_list still running: {','.join(busy)}.")
+                return
+            self._running.update(paths)
+        thread_pool.submit(self.run_job, job, fire_time)
+
+    def reload_config(self):
+        """重新读取配置，返回本次运行使用的 (连接池, pg_params)"""
+        if self.load_config is None:
+            return self.pool, self.pg_params
+        pg_params = self.load_config()
+        with self._lock:
+            if any(pg_params.get(key) != self.pg_params.get(key) for key in CONNECTION_KEYS):
+                logger.info(f"schedule: database config changed, new pool for "
+                            f"{pg_params.get('pg_host')}:{pg_params.get('pg_port')}/{pg_params.get('pg_dbname')}.")
+                self._retired.append(self.pool)
+                self.pool = pg_pool.create_pool(self.pool.pool_size, **pg_params)
+            self.pg_params = pg_params
+            return self.pool, self.pg_params
+
+    def close_retired(self):
+        with self._lock:
+            if self._running:
+                return
+            retired, self._retired = self._retired, []
+        for pool in retired:
+            pool.closeall()
+
+    def run_job(self, job, fire_time):
+        try:
+            try:
+                pool, pg_params = self.reload_config()
+            except Exception as e:
+                logger.error(f"schedule: job {job['name']} skipped, load config failed: {e}")
+                alert.warn('schedule:config', f"ETL配置读取异常，job：{job['name']}，{e}")
+                return
+            begin_date, end_date = get_window(job['window'], fire_time)
+            sql_params = {'sql_file': None, 'mapping_name': None, 'run_id': common.new_run_id(),
+                          'parameter_values': f"begin_date={begin_date},end_date={end_date}",
+                          'begin_date': begin_date, 'end_date': end_date}
+            options = dict(self.run_params['options'])
+            options.update(job['options'])
+            workers = job['workers'] or self.run_params['workers']
+            logger.info(f"schedule: job {job['name']} begin, {begin_date} ~ {end_date}.")
+            # 与 start_etl.sh 一样，多个 sql_list 依次执行
+            for sql_list_file in job['sql_list_files']:
+                sql_params['sql_list_file'] = sql_list_file
+                executor.call_sql_files(sql_list_file, pool=pool, workers=workers, options=options,
+                                        **pg_params, **sql_params)
+            logger.info(f"schedule: job {job['name']} end.")
+        except Exception as e:
+            logger.error(f"schedule: job {job['name']} failed: {e}")
+        finally:
+            with self._lock:
+                self._running.difference_update(job_paths(job))
+            self.close_retired()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# --------------------------------
+# sql_list 文件解析
+# --------------------------------
+# 每行一个步骤，#开头为注释，格式：
+#   etl/dws_x.sql
+#   etl/dws_x.sql after dim_dict,dim_extend_update
+#   etl/dws_x.sql after dim_dict key=value
+#   default timeout=1800
+# after 后为依赖的步骤名(sql文件名，不含目录和后缀)，key=value 为步骤选项，
+# default 行的选项为本文件所有步骤的默认值
+# 文件中没有任何 after 时按行顺序串行执行(与原来一致)；有 after 时按依赖关系并行执行，
+# 没有写 after 的步骤视为没有依赖
+
+
+def get_mapping_name(file_name):
+    return file_name.split('/')[-1].split('.')[0].lower()
+
+
+def parse_line(line):
+    """解析一行，注释或空行返回 None"""
+    line = line.strip()
+    if len(line) == 0 or line.startswith('#'):
+        return None
+    items = line.split()
+    step = {'sql_file': items[0], 'mapping_name': get_mapping_name(items[0]), 'after': [], 'options': {}}
+    i = 1
+    while i < len(items):
+        item = items[i]
+        if item == 'after':
+            i += 1
+            if i >= len(items):
+                raise ValueError(f"sql_list: missing step names after 'after': {line}")
+            step['after'].extend(get_mapping_name(name) for name in items[i].split(',') if name)
+        elif '=' in item:
+            key, value = item.split('=', 1)
+            step['options'][key] = value
+        else:
+            raise ValueError(f"sql_list: unknown item '{item}': {line}")
+        i += 1
+    return step
+
+
+def parse_sql_list(sql_list_file_name):
+    steps = []
+    defaults = {}
+    with open(sql_list_file_name, encoding='utf-8', mode='r') as list_f:
+        for line in list_f:
+            step = parse_line(line)
+            if step is None:
+                continue
+            if step['sql_file'] == 'default':
+                if step['after']:
+                    raise ValueError(f"sql_list: 'after' is not allowed in default line: {line.strip()}")
+                defaults.update(step['options'])
+            else:
+                steps.append(step)
+    for step in steps:
+        step['options'] = dict(defaults, **step['options'])
+    return steps
+
+
+def has_dependencies(steps):
+    return any(step['after'] for step in steps)
+
+
+def check_steps(steps):
+    """校验步骤名不重复、依赖存在且无环，返回拓扑序的步骤名列表"""
+    names = [step['mapping_name'] for step in steps]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError(f"sql_list: duplicate steps: {','.join(duplicates)}")
+    for step in steps:
+        unknown = [name for name in step['after'] if name not in names]
+        if unknown:
+            raise ValueError(f"sql_list: step {step['mapping_name']} depends on unknown steps: {','.join(unknown)}")
+
+    # Kahn 拓扑排序，剩余未排序的步骤即存在环
+    in_degree = {step['mapping_name']: len(set(step['after'])) for step in steps}
+    ordered = [name for name in names if in_degree[name] == 0]
+    i = 0
+    while i < len(ordered):
+        for step in steps:
+            if ordered[i] in step['after']:
+                in_degree[step['mapping_name']] -= 1
+                if in_degree[step['mapping_name']] == 0:
+                    ordered.append(step['mapping_name'])
+        i += 1
+    if len(ordered) < len(steps):
+        cycle = [name for name in names if name not in ordered]
+        raise ValueError(f"sql_list: dependency cycle among steps: {','.join(cycle)}")
+    return ordered
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+import re
+import time
+
+from psycopg2.extras import execute_values
+
+from utils import common
+
+logger = common.get_logger(__name__)
+
+DOLLAR_TAG = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)?\$')
+# 可以 EXPLAIN 的语句(DO 块、DDL 等不支持)
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with', 'values', 'merge', 'table')
+
+
+# --------------------------------
+# sql 文件拆分为单条语句
+# --------------------------------
+# 按 ; 拆分，跳过注释(--、/* */)、字符串('...'、E'...'、"...")和 $$ ... $$ 块中的 ;
+# 注释保留在其后的语句中，只有注释的片段丢弃
+def split_statements(sql):
+    statements = []
+    start = 0
+    has_code = False
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith('--', i):
+            j = sql.find('\n', i)
+            i = n if j < 0 else j + 1
+            continue
+        if sql.startswith('/*', i):
+            depth = 1
+            i += 2
+            while i < n and depth > 0:
+                if sql.startswith('/*', i):
+                    depth += 1
+                    i += 2
+                elif sql.startswith('*/', i):
+                    depth -= 1
+                    i += 2
+                else:
+                    i += 1
+            continue
+        if c in ("'", '"'):
+            escape = c == "'" and i > 0 and sql[i - 1] in 'eE'
+            j = i + 1
+            while j < n:
+                if escape and sql[j] == '\\':
+                    j += 2
+                    continue
+                if sql[j] == c:
+                    if j + 1 < n and sql[j + 1] == c:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            i = j + 1
+            has_code = True
+            continue
+        if c == '$':
+            m = DOLLAR_TAG.match(sql, i)
+            if m:
+                j = sql.find(m.group(0), m.end())
+                i = n if j < 0 else j + len(m.group(0))
+                has_code = True
+                continue
+        if c == ';':
+            if has_code:
+                statements.append(sql[start:i].strip())
+            start = i + 1
+            has_code = False
+        elif not c.isspace():
+            has_code = True
+        i += 1
+    if has_code:
+        statements.append(sql[start:].strip())
+    return statements
+
+
+def first_keyword(statement):
+    """去掉开头注释后的第一个关键字(小写)"""
+    text = re.sub(r'^(\s*(--[^\n]*\n?|/\*.*?\*/))*\s*', '', statement, flags=re.S)
+    m = re.match(r'[A-Za-z]+', text)
+    return m.group(0).lower() if m else ''
+
+
+def execute_instrumented(cur, sql, pg_params, stats, slow_seconds=None, explain='plain'):
+    """逐条执行 sql 文件中的语句，每条语句的耗时、影响行数追加到 stats；
+    耗时超过 slow_seconds 的语句记录执行计划：plain 为 EXPLAIN，analyze 为 EXPLAIN (ANALYZE, BUFFERS)
+    (会在保存点内再执行一次并回滚)"""
+    for no, statement in enumerate(split_statements(sql), start=1):
+        item = {'statement_no': no, 'statement_text': statement,
+                'start_datetime': datetime.datetime.now(), 'duration_ms': None, 'row_count': None,
+                'plan_text': None, 'error_info': None}
+        stats.append(item)
+        begin = time.perf_counter()
+        try:
+            cur.execute(statement, pg_params)
+        except Exception as e:
+            item['duration_ms'] = round((time.perf_counter() - begin) * 1000, 3)
+            item['error_info'] = str(e)
+            raise
+        duration = time.perf_counter() - begin
+        item['duration_ms'] = round(duration * 1000, 3)
+        item['row_count'] = cur.rowcount
+        if slow_seconds is not None and duration >= slow_seconds and first_keyword(statement) in EXPLAINABLE:
+            logger.info(f"slow statement #{no}: {item['duration_ms']} ms, capture plan.")
+            item['plan_text'] = explain_statement(cur, statement, pg_params, explain)
+
+
+def explain_statement(cur, statement, pg_params, explain='plain'):
+    """在保存点内获取执行计划，失败时回滚到保存点，不影响步骤本身的事务"""
+    options = '(ANALYZE, BUFFERS)' if explain == 'analyze' else ''
+    cur.execute('SAVEPOINT etl_explain')
+    try:
+        cur.execute(f"EXPLAIN {options} {statement}", pg_params)
+        plan = '\n'.join(row[0] for row in cur.fetchall())
+    except Exception as e:
+        plan = None
+        logger.warning(f"explain failed: {e}")
+    cur.execute('ROLLBACK TO SAVEPOINT etl_explain')
+    return plan
+
+
+def save_stats(conn, stats, **pg_params):
+    """语句明细写入 public.etl_log_statement，写入失败只记录日志"""
+    if not stats:
+        return
+    sql = """
+        insert into public.etl_log_statement
+        (run_id, etl_log_id, etl_name, statement_no, statement_text, start_datetime, duration_ms, row_count,
+         plan_text, error_info)
+        values %s
+        """
+    etl_log_id = f"{pg_params.get('begin_date') or ''}_{pg_params['mapping_name']}"
+    rows = [(pg_params.get('run_id'), etl_log_id, pg_params['mapping_name'], item['statement_no'],
+             item['statement_text'][:4000], item['start_datetime'], item['duration_ms'], item['row_count'],
+             item['plan_text'], item['error_info']) for item in stats]
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, sql, rows)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"statement log execution failed: {e}")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import threading
+
+import psycopg2
+
+from utils import common
+
+logger = common.get_logger(__name__)
+
+
+# --------------------------------
+# 步骤超时看门狗
+# --------------------------------
+# 服务端 statement_timeout 只限制单条语句，看门狗限制整个步骤：
+# 到期后通过取消请求(libpq 另建连接发送 CancelRequest)取消正在执行的语句，
+# 宽限期后仍未结束则另建连接执行 pg_terminate_backend，释放锁和数据库资源
+class StepWatchdog(object):
+
+    def __init__(self, conn, timeout, grace_seconds=30, **pg_params):
+        self.conn = conn
+        self.timeout = timeout
+        self.grace_seconds = grace_seconds
+        self.pg_params = pg_params
+        self.fired = False
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.timeout:
+            self._thread = threading.Thread(target=self._run, name='etl-watchdog', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        if self._done.wait(self.timeout):
+            return
+        self.fired = True
+        pid = self.conn.get_backend_pid()
+        logger.warning(f"step timeout after {self.timeout}s, cancel backend {pid}.")
+        try:
+            self.conn.cancel()
+        except Exception as e:
+            logger.error(f"cancel backend {pid} failed: {e}")
+        if self._done.wait(self.grace_seconds):
+            return
+        logger.warning(f"backend {pid} still running after cancel, terminate it.")
+        terminate_backend(pid, **self.pg_params)
+
+
+def terminate_backend(pid, **pg_params):
+    try:
+        conn = psycopg2.connect(host=pg_params['pg_host'],
+                                port=pg_params['pg_port'],
+                                dbname=pg_params['pg_dbname'],
+                                user=pg_params['pg_user'],
+                                password=pg_params['pg_password'])
+    except Exception as e:
+        logger.error(f"terminate backend {pid} failed: {e}")
+        return
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute('select pg_terminate_backend(%s)', (pid,))
+    except Exception as e:
+        logger.error(f"terminate backend {pid} failed: {e}")
+    finally:
+        conn.close()
+
+
+def statement_timeout_sql(timeout):
+    """事务内设置 statement_timeout 的 sql，提交或回滚后自动恢复，不影响归还连接池后的连接；与步骤 sql 拼在一起发送"""
+    return f"select set_config('statement_timeout', '{int(timeout * 1000)}', true);"
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*-coding:utf-8*-
+# 表级血缘：列出 sql 文件读、写的表，不连接数据库
+# python3 lineage.py                                      # etl/ 下全部 sql 文件，按表列出写入、读取的文件
+# python3 lineage.py --sql_list_file etl/etl_sql_list_day.txt                              # 各步骤的读写表和上游步骤
+# python3 lineage.py --sql_list_file etl/etl_sql_list_day.txt --rerun_downstream_of dw.x   # 预览 main.py 将重跑的步骤
+from config import cmd_args as args
+from launcher import lineage, sql_list
+
+
+def create_parser():
+    parser = args.create_parser()
+    parser.add_option('--sql_dir', dest='sql_dir', default='etl')
+    return parser
+
+
+def print_tables(files):
+    tables = {}
+    for file_name, item in files.items():
+        for table in item['writes']:
+            tables.setdefault(table, ([], []))[0].append(file_name)
+        for table in item['reads']:
+            tables.setdefault(table, ([], []))[1].append(file_name)
+    for table in sorted(tables):
+        writers, readers = tables[table]
+        print(f"{table}\n  written by: {', '.join(writers) or '-'}\n  read by:    {', '.join(readers) or '-'}")
+
+
+def print_steps(steps, downstream_of=None):
+    if downstream_of:
+        steps = lineage.select_downstream(steps, downstream_of)
+    tables = lineage.analyze_steps(steps)
+    upstreams = lineage.step_upstreams(steps, tables)
+    for step in steps:
+        name = step['mapping_name']
+        print(f"{step['sql_file']}\n  reads:  {', '.join(tables[name]['reads']) or '-'}"
+              f"\n  writes: {', '.join(tables[name]['writes']) or '-'}"
+              f"\n  after:  {', '.join(sorted(upstreams[name])) or '-'}")
+
+
+def main():
+    parser = create_parser()
+    options, _ = parser.parse_args()
+    if options.sql_list_file:
+        print_steps(sql_list.parse_sql_list(options.sql_list_file), options.rerun_downstream_of)
+    else:
+        print_tables(lineage.analyze_dir(options.sql_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*-coding:utf-8*-
+# 日志分析：读取 logs/etl.log.*(含 .gz 压缩的)，输出每天每个步骤的耗时分布和反复出现的错误，不连接数据库
+# python3 log_report.py                                                     # 步骤耗时、错误以 csv 输出到屏幕
+# python3 log_report.py --log_files "logs/etl.log.2023-03-*" --report_file report/etl.csv   # 另写 report/etl_errors.csv
+# python3 log_report.py --report_format html --report_file report/etl.html
+import os
+
+from config import cmd_args as args
+from launcher import log_report
+
+
+def create_parser():
+    parser = args.create_parser()
+    # 日志文件，glob 通配，多个用逗号分隔
+    parser.add_option('--log_files', dest='log_files', default='logs/etl.log*')
+    parser.add_option('--report_format', dest='report_format', choices=['csv', 'html'], default='csv')
+    parser.add_option('--report_file', dest='report_file')
+    return parser
+
+
+def main():
+    parser = create_parser()
+    options, _ = parser.parse_args()
+    paths = log_report.list_files([pattern for pattern in options.log_files.split(',') if pattern])
+    if not paths:
+        parser.error(f"no log files match {options.log_files}")
+    report = log_report.LogReport()
+    report.feed_files(paths)
+    if options.report_file and os.path.dirname(options.report_file):
+        os.makedirs(os.path.dirname(options.report_file), exist_ok=True)
+    if options.report_format == 'html':
+        outputs = log_report.write_html(report, options.report_file)
+    else:
+        outputs = log_report.write_csv(report, options.report_file)
+    if options.report_file:
+        print(f"{report.files} files, {report.lines} lines -> {', '.join(outputs)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,9 @@
 # -*-coding:utf-8*-
 from config import cmd_args as args
 from config import default_pg_args
-from launcher import executor
-from service import nacos_config, wechat
-from utils import common
+from launcher import executor, micro_batch, sql_list
+from service import alert, nacos_config, wechat
+from utils import common, metrics, pg_pool
 
 
 logger = common.get_logger(__name__)
@@ -12,22 +12,72 @@ logger = common.get_logger(__name__)
 db_conn_flag = 'local'
 
 
+def get_pg_params(nacos_params):
+    # 适配没有部署nacos的情况
+    if db_conn_flag == 'remote':
+        pg_params = nacos_config.get_cached_pg_params(**nacos_params)
+        # 微信告警使用远程配置
+        wechat.configure(**pg_params)
+        return pg_params
+    else:
+        return default_pg_args.get_pg_params()
+
+
+def write_metrics(run_params, sql_params):
+    """运行结束时写 node_exporter textfile；各 sql_list 最近成功时间沿用文件中的旧值，本次失败时不丢失"""
+    if not run_params['metrics_file']:
+        return
+    name = sql_list.get_mapping_name(sql_params['sql_list_file'] or sql_params['sql_file'] or 'etl')
+    metrics.write_textfile(run_params['metrics_file'].format(sql_list=name),
+                           keep=(executor.LIST_LAST_SUCCESS.name,))
+
+
 def main():
     logger.info("========================etl begin========================")
     parser = args.create_parser()
     nacos_params = args.get_nacos_params(parser)
     sql_params = args.get_sql_params(parser)
+    run_params = args.get_run_params(parser)
+    sql_params['run_id'] = common.new_run_id()
     logger.info(f"sql_params: {sql_params}")
-    # 适配没有部署nacos的情况
-    if db_conn_flag == 'remote':
-        pg_params = nacos_config.get_pg_params(**nacos_params)
-    else:
-        pg_params = default_pg_args.get_pg_params()
+    pg_params = get_pg_params(nacos_params)
     sql_list_file = sql_params['sql_list_file']
-    if sql_list_file:
-        executor.call_sql_files(sql_list_file, **pg_params, **sql_params)  # pg_params字典、sql_params字典拆包后传入
-    else:
-        executor.call_sql_file(sql_params['sql_file'], **pg_params, **sql_params)
+    if sql_list_file and run_params['engine'] == 'async':
+        # 异步引擎自建连接，psycopg 3 只在使用时导入
+        from launcher import async_executor
+        async_executor.call_sql_files(sql_list_file, workers=run_params['workers'], resume=run_params['resume'],
+                                      force=run_params['force'], options=run_params['options'],
+                                      downstream_of=run_params['downstream_of'], **pg_params, **sql_params)
+        write_metrics(run_params, sql_params)
+        logger.info("=========================etl end=========================\n\n")
+        return
+    # 连接池只创建一次，sql_list中的各个步骤共用
+    try:
+        # 并行执行时每个线程占用一个连接，连接池不小于并发数
+        # 微批另占一个连接持有高水位锁
+        pool_size = max(run_params['pool_size'], run_params['workers'] + (1 if run_params['micro_batch'] else 0))
+        pool = pg_pool.create_pool(pool_size, **pg_params)
+    except Exception as e:
+        logger.error(f"数据库连接池创建失败: {e}.")
+        alert.warn('database:connection', f"数据库连接异常：{e}")
+        write_metrics(run_params, sql_params)
+        return
+    try:
+        if sql_list_file and run_params['micro_batch']:
+            micro_batch.run_micro_batch(sql_list_file, pool=pool, workers=run_params['workers'],
+                                        options=run_params['options'], **run_params['micro_batch_params'],
+                                        **pg_params, **sql_params)
+        elif sql_list_file:
+            executor.call_sql_files(sql_list_file, pool=pool, workers=run_params['workers'],
+                                    resume=run_params['resume'], force=run_params['force'],
+                                    options=run_params['options'], downstream_of=run_params['downstream_of'],
+                                    **pg_params, **sql_params)  # pg_params字典、sql_params字典拆包后传入
+        else:
+            executor.call_sql_file(sql_params['sql_file'], pool=pool, options=run_params['options'],
+                                   **pg_params, **sql_params)
+    finally:
+        pool.closeall()
+    write_metrics(run_params, sql_params)
     logger.info("=========================etl end=========================\n\n")
 
 
@@ -2,7 +2,7 @@
 # -*-coding:utf-8*-
 import psycopg2
 from config import default_pg_args
-from service import wechat
+from service import alert
 from utils import common
 
 logger = common.get_logger(__name__)
@@ -26,10 +26,11 @@ sql1 =  '''
         '''
 sql2 =  '''
         select concat(a.etl_name,'_',a.etl_params_end_date,'_',a.create_datetime,'_', a.update_datetime) etl_info
+              ,a.etl_name
         from public.etl_log a 
         where a.create_datetime  >= current_timestamp - interval '1 hour'
-        and a.create_datetime   < to_char(current_timestamp,'yyyy-mm--dd HH24:00:00')::timestamp
-        and a.update_datetime   > to_char(current_timestamp,'yyyy-mm--dd HH24:00:00')::timestamp
+        and a.create_datetime   < date_trunc('hour', localtimestamp)
+        and a.update_datetime   > date_trunc('hour', localtimestamp)
         '''
 
 try:                        
@@ -41,7 +42,7 @@ try:
         set1 = cur.fetchone()
         print(set1)
         if set1[0] != 1:
-            wechat.send_warning(f"监控程序：当前周期的ETL程序未运行")
+            alert.warn('monitor:not_started', f"监控程序：当前周期的ETL程序未运行")
        
         # 超时
         cur.execute(sql2)
@@ -50,10 +51,10 @@ try:
             if set2[0] is not None:
                 # print(f"ETL任务超时:{set2[0]}")
                 logger.error(f"ETL任务超时:{set2[0]}")
-                wechat.send_warning(f"ETL任务超时:{set2[0]}")
+                alert.warn(f"{set2[1]}:timeout", f"ETL任务超时:{set2[0]}")
         
 except Exception as e:     
     logger.error(f"监控程序执行失败: {e}.")
-    # wechat.send_warning(f"监控程序执行失败: {e}")
+    # alert.warn('monitor:failed', f"监控程序执行失败: {e}")
 finally:
     conn.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding:utf-8-*-
+import atexit
+import collections
+import threading
+import time
+
+from service import wechat
+from utils import common
+
+logger = common.get_logger(__name__)
+
+# 告警合并配置
+config = {
+    'window_seconds': 10,  # 第一条告警到达后等待的秒数，窗口内的告警合并为一条汇总消息
+    'dedup_seconds': 600,  # 同一 key 在该秒数内已发送过则不再单独列出，只计数
+    'max_per_minute': 5,  # 每分钟最多发送的消息数，超出的告警并入下一条汇总消息
+    'top_n': 5,  # 汇总消息中列出的告警数
+}
+
+
+# --------------------------------
+# 告警合并
+# --------------------------------
+# 调用方用 warn(key, content) 代替 wechat.send_warning(content)，key 一般为 步骤名:异常类型，
+# 同一窗口内的告警按 key 去重计数，合并为一条汇总消息(只有一条时原样发送)，再交给 wechat 发送队列
+class AlertAggregator(object):
+
+    def __init__(self, send=None):
+        self.send = send
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()  # key -> {'count', 'content'}
+        self._first_time = None
+        self._last_sent = {}  # key -> 发送时间
+        self._send_times = collections.deque()
+        self._thread = None
+
+    def warn(self, key, content):
+        logger.warning(f"alert [{key}]: {content}")
+        with self._cond:
+            item = self._pending.get(key)
+            if item is None:
+                self._pending[key] = {'count': 1, 'content': str(content)}
+            else:
+                item['count'] += 1
+            if self._first_time is None:
+                self._first_time = time.time()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='alert-aggregator', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._first_time is None:
+                    self._cond.wait()
+                wait_seconds = self._first_time + config['window_seconds'] - time.time()
+                budget_wait = self._budget_wait()
+                if max(wait_seconds, budget_wait) > 0:
+                    self._cond.wait(max(wait_seconds, budget_wait))
+                    continue
+            self.flush()
+
+    def _budget_wait(self):
+        """距离下一次可以发送的秒数(每分钟预算)"""
+        now = time.time()
+        while self._send_times and self._send_times[0] <= now - 60:
+            self._send_times.popleft()
+        if len(self._send_times) < config['max_per_minute']:
+            return 0
+        return self._send_times[0] + 60 - now
+
+    def flush(self):
+        with self._cond:
+            if not self._pending:
+                self._first_time = None
+                return
+            pending, self._pending = self._pending, collections.OrderedDict()
+            self._first_time = None
+            now = time.time()
+            fresh = [(key, item) for key, item in pending.items()
+                     if now - self._last_sent.get(key, 0) >= config['dedup_seconds']]
+            for key, _ in fresh:
+                self._last_sent[key] = now
+            content = build_digest(pending, fresh)
+            if content is not None:
+                self._send_times.append(now)
+        if content is not None:
+            (self.send or wechat.send_warning)(content)
+
+
+def build_digest(pending, fresh):
+    """只有一条告警时原样发送；多条时汇总为数量 + 出现次数最多的告警；全部为近期重复告警时不发送"""
+    if not fresh:
+        logger.info(f"alert: {sum(item['count'] for item in pending.values())} duplicate alerts suppressed.")
+        return None
+    if len(pending) == 1 and fresh[0][1]['count'] == 1:
+        return fresh[0][1]['content']
+    total = sum(item['count'] for item in pending.values())
+    lines = [f"告警汇总：{total}条告警，{len(pending)}类"]
+    top = sorted(fresh, key=lambda kv: kv[1]['count'], reverse=True)[:config['top_n']]
+    for key, item in top:
+        lines.append(f"[{item['count']}次] {item['content']}")
+    others = len(pending) - len(top)
+    if others > 0:
+        lines.append(f"其他{others}类告警(含近期已发送的重复告警)省略")
+    return '\n'.join(lines)
+
+
+aggregator = AlertAggregator()
+# atexit 后注册先执行：先发出汇总消息，再等待 wechat 发送队列
+atexit.register(aggregator.flush)
+
+
+def warn(key, content):
+    aggregator.warn(key, content)
+
+
+def flush():
+    aggregator.flush()
@@ -1,12 +1,29 @@
 #!/usr/bin/env python
 # -*-coding:utf-8*-
+import atexit
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
 
 import nacos
 import yaml
 from urllib.parse import urlparse
 
+from utils import common
+
 logging.getLogger("nacos.client").setLevel(logging.WARNING)
+logger = common.get_logger(__name__)
+
+# 本地缓存目录、有效期(秒)
+CACHE_DIR = 'cache'
+CACHE_TTL = 600
+# 过期缓存最多使用的秒数，超过后必须从 nacos 获取，获取失败时抛出异常，不再使用旧配置
+CACHE_MAX_STALE = 86400
+# 进程退出时等待后台刷新完成的最长秒数，nacos 不可用时不拖住退出
+REFRESH_WAIT_SECONDS = 5
 
 
 def get_pg_params(**params):
@@ -40,6 +57,94 @@ def get_pg_params(**params):
             'wechat_corpsecret': wechat_corpsecret, 'wechat_agentid': wechat_agentid,'project_name': project_name}  #2022-10-25 微信告警title配置
 
 
+# --------------------------------
+# 本地缓存
+# --------------------------------
+# 解析后的配置按 server_addresses/namespace/data_id/group 缓存到本地文件，多个进程共用：
+# 缓存未过期直接使用，不访问nacos；已过期不超过 max_stale 秒时先返回旧配置，后台刷新；
+# 没有缓存或缓存过旧时同步获取，获取失败时抛出异常
+def get_cache_file(**params):
+    key = '|'.join(str(params.get(name)) for name in ('server_addresses', 'namespace', 'data_id', 'group'))
+    return os.path.join(CACHE_DIR, f"nacos_{hashlib.md5(key.encode('utf-8')).hexdigest()}.json")
+
+
+def read_cache(cache_file):
+    try:
+        with open(cache_file, encoding='utf-8', mode='r') as f:
+            cache = json.load(f)
+        return cache['update_time'], cache['pg_params']
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+def write_cache(cache_file, pg_params):
+    # 先写临时文件再替换，其他进程不会读到写了一半的文件；配置含密码，只允许当前用户读写
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, encoding='utf-8', mode='w') as f:
+        json.dump({'update_time': time.time(), 'pg_params': pg_params}, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+
+
+def refresh_cache(cache_file, **params):
+    pg_params = get_pg_params(**params)
+    write_cache(cache_file, pg_params)
+    return pg_params
+
+
+def _refresh_quietly(cache_file, **params):
+    try:
+        refresh_cache(cache_file, **params)
+        logger.info("nacos config cache refreshed.")
+    except Exception as e:
+        logger.warning(f"nacos config refresh failed, keep stale cache: {e}")
+
+
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+
+def start_refresh(cache_file, **params):
+    """后台刷新缓存(守护线程)，同时只有一个刷新线程；常驻进程每次读取配置都可能调用"""
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(target=_refresh_quietly, args=(cache_file,), kwargs=params,
+                                           name='nacos-refresh', daemon=True)
+        _refresh_thread.start()
+
+
+def wait_refresh():
+    # 进程退出时最多等待 REFRESH_WAIT_SECONDS 秒，刷新完成后下次运行即可使用新缓存
+    thread = _refresh_thread
+    if thread is not None:
+        thread.join(REFRESH_WAIT_SECONDS)
+
+
+atexit.register(wait_refresh)
+
+
+def get_cached_pg_params(ttl=CACHE_TTL, max_stale=CACHE_MAX_STALE, **params):
+    cache_file = get_cache_file(**params)
+    update_time, pg_params = read_cache(cache_file)
+    age = None if pg_params is None else time.time() - update_time
+    if age is not None and age < ttl:
+        return pg_params
+    if age is not None and age < max_stale:
+        logger.info("nacos config cache expired, use stale config and refresh in background.")
+        start_refresh(cache_file, **params)
+        return pg_params
+    try:
+        return refresh_cache(cache_file, **params)
+    except Exception as e:
+        if age is None:
+            raise
+        raise RuntimeError(f"nacos config refresh failed and cache is {int(age)}s old "
+                           f"(max_stale {max_stale}s): {e}") from e
+
+
 if __name__ == '__main__':
     import config.cmd_args as args
 
@@ -1,23 +1,74 @@
 #!/usr/bin/env python
 # -*- coding:utf-8-*-
+import atexit
+import http.client
 import json
+import queue
+import threading
 import time
 import urllib.request
+from urllib.parse import urlparse
 
-from utils import common
+from utils import common, metrics
 
 logger = common.get_logger(__name__)
 
+# 告警配置，可通过 configure 使用远程配置(如nacos)覆盖
+config = {
+    'wechat_url': 'https://qyapi.weixin.qq.com',
+    'wechat_corpid': 'ww7c622f0333edeb23',
+    'wechat_corpsecret': 'VPNzhUmeMDQQJsQSKmHgCeXHUWEDuBIhI9l2FIQriAw',
+    'wechat_agentid': '1000002',
+    'project_name': '',
+    'queue_size': 1000,  # 告警队列长度，满了丢弃新告警
+    'retries': 3,  # 发送失败重试次数
+    'timeout': 10,  # http 超时秒数
+    'flush_seconds': 30,  # 程序退出时等待告警发送完成的最长秒数
+}
+
+# token 过期错误码，需重新获取 token
+TOKEN_EXPIRED_CODES = (40014, 42001)
+# token 提前刷新的秒数
+TOKEN_EXPIRE_MARGIN = 300
+
+_token_cache = {}
+_token_lock = threading.Lock()
+
+
+def configure(**params):
+    """使用远程配置覆盖告警配置，只取 config 中已有的配置项，值为空的忽略"""
+    for key, value in params.items():
+        if key in config and value not in (None, ''):
+            config[key] = value
+
+
 # --------------------------------
 # 获取企业微信token
 # --------------------------------
 # https://work.weixin.qq.com/api/doc/90000/90135/91039
 # 请求方式： GET（HTTPS）
 # 请求地址： https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid=ID&corpsecret=SECRET
-def get_token(url, corpid, corpsecret):
-    token_url = f'{url}/cgi-bin/gettoken?corpid={corpid}&corpsecret={corpsecret}'
-    token = json.loads(urllib.request.urlopen(token_url).read().decode())['access_token']
-    return token
+# 返回的 access_token 有效期为 expires_in(7200)秒，缓存后重复使用
+def get_token(url, corpid, corpsecret, refresh=False, http=None):
+    key = (url, corpid)
+    with _token_lock:
+        cached = _token_cache.get(key)
+        if cached and not refresh and cached[1] > time.time():
+            return cached[0]
+        token_path = f'/cgi-bin/gettoken?corpid={corpid}&corpsecret={corpsecret}'
+        if http is None:
+            result = json.loads(urllib.request.urlopen(url + token_path, timeout=config['timeout']).read().decode())
+        else:
+            result = http.request('GET', token_path)
+        token = result['access_token']
+        expires_in = int(result.get('expires_in', 7200))
+        _token_cache[key] = (token, time.time() + max(expires_in - TOKEN_EXPIRE_MARGIN, 0))
+        return token
+
+
+def invalidate_token(url, corpid):
+    with _token_lock:
+        _token_cache.pop((url, corpid), None)
 
 
 # --------------------------------
@@ -41,37 +92,141 @@ def messages(agent_id, content):
 # --------------------------------
 def send_message(url, token, data):
     send_url = f'{url}/cgi-bin/message/send?access_token={token}'
-    response = urllib.request.urlopen(urllib.request.Request(url=send_url, data=data)).read()
-    print(response)
+    response = urllib.request.urlopen(urllib.request.Request(url=send_url, data=data), timeout=config['timeout']).read()
+    logger.debug(f'wechat response: {response.decode()}')
     x = json.loads(response.decode())['errcode']
     if x == 0:
         logger.info('Send message to wechat successfully.')
     else:
         logger.info('Send message to wechat Failed.')
+    return x
+
+
+# --------------------------------
+# 保持连接的 http 客户端，只在发送线程中使用
+# --------------------------------
+class KeepAliveHttp(object):
+
+    def __init__(self, url, timeout=10):
+        parsed = urlparse(url)
+        self.https = parsed.scheme == 'https'
+        self.netloc = parsed.netloc
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        # 连接被服务端关闭时重连一次
+        for attempt in range(2):
+            if self.conn is None:
+                if self.https:
+                    self.conn = http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+                else:
+                    self.conn = http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+            try:
+                headers = {'Content-Type': 'application/json; charset=utf-8'} if body is not None else {}
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                return json.loads(response.read().decode())
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt == 1:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# --------------------------------
+# 异步告警队列
+# --------------------------------
+# send_warning 只把告警放入队列，由后台线程发送(保持连接、失败重试)，不阻塞 ETL 步骤；
+# 程序退出时等待队列发送完成(最多 flush_seconds 秒)
+class AlertSender(object):
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=config['queue_size'])
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, content):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(content)
+        except queue.Full:
+            self.dropped += 1
+            ALERTS_DROPPED.inc()
+            logger.error(f"wechat alert queue is full, alert dropped: {content}")
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='wechat-sender', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        clients = {}
+        while True:
+            content = self.queue.get()
+            try:
+                url = config['wechat_url']
+                if url not in clients:
+                    clients[url] = KeepAliveHttp(url, config['timeout'])
+                self._send(clients[url], content)
+            except Exception as e:
+                logger.error(f"Send message to wechat Failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _send(self, client, content):
+        url, corpid = config['wechat_url'], config['wechat_corpid']
+        data = messages(config['wechat_agentid'], content)
+        for attempt in range(config['retries'] + 1):
+            try:
+                token = get_token(url, corpid, config['wechat_corpsecret'], http=client)
+                errcode = client.request('POST', f'/cgi-bin/message/send?access_token={token}', data).get('errcode')
+                if errcode == 0:
+                    logger.info('Send message to wechat successfully.')
+                    return
+                logger.info(f'Send message to wechat Failed, errcode: {errcode}.')
+                if errcode in TOKEN_EXPIRED_CODES:
+                    # token 失效，重新获取后立即重试
+                    invalidate_token(url, corpid)
+                    continue
+            except Exception as e:
+                logger.info(f'Send message to wechat Failed: {e}.')
+            if attempt < config['retries']:
+                time.sleep(min(2 ** attempt, 30))
+        raise RuntimeError(f"give up after {config['retries']} retries")
+
+    def flush(self, timeout=None):
+        """等待队列中的告警发送完成，返回是否全部发送"""
+        if self._thread is None:
+            return True
+        deadline = time.time() + (config['flush_seconds'] if timeout is None else timeout)
+        while self.queue.unfinished_tasks > 0 and time.time() < deadline:
+            time.sleep(0.05)
+        if self.queue.unfinished_tasks > 0:
+            logger.error(f"wechat alert queue flush timeout, {self.queue.unfinished_tasks} alerts not sent.")
+            return False
+        return True
+
+
+ALERTS_DROPPED = metrics.counter('etl_alerts_dropped_total', '告警队列已满而丢弃的告警数')
+sender = AlertSender()
+atexit.register(sender.flush)
+metrics.gauge('etl_alert_queue_depth', '等待发送的企业微信告警数').set_function(lambda: sender.queue.qsize())
+
 
-# 参数可以远程配置
-# def send_warning(content, **params):
-#     url = params['wechat_url']  # 'https://qyapi.weixin.qq.com'
-#     corpid = params['wechat_corpid']  #  'ww7c622f0333edeb23' 
-#     corpsecret = params['wechat_corpsecret']  # 'VPNzhUmeMDQQJsQSKmHgCeXHUWEDuBIhI9l2FIQriAw'
-#     wechat_agentid = params['wechat_agentid']
-#     project_name = params['project_name']    
-#     token = get_token(url, corpid, corpsecret)
-#     current_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
-#     message_data = messages(wechat_agentid, current_time + '\n' + project_name + '\n' + str(content))  #2022-10-25添加微信告警title
-#     send_message(url, token, message_data)
-
-# 测试
 def send_warning(content):
-    url = 'https://qyapi.weixin.qq.com'
-    corpid = 'ww7c622f0333edeb23'
-    corpsecret = 'VPNzhUmeMDQQJsQSKmHgCeXHUWEDuBIhI9l2FIQriAw'
-    wechat_agentid = '1000002'
-    project_name = ''
-    token = get_token(url, corpid, corpsecret)
     current_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
-    message_data = messages(wechat_agentid, current_time + '\n' + project_name + '\n' + str(content))  #2022-10-25添加微信告警title
-    send_message(url, token, message_data)
+    sender.put(current_time + '\n' + config['project_name'] + '\n' + str(content))  #2022-10-25添加微信告警title
+
+
+def flush(timeout=None):
+    return sender.flush(timeout)
 
 
 
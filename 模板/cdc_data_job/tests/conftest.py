@@ -0,0 +1,9 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+
+# 与 main.py 相同，以作业目录为当前目录运行(日志配置、etl/ 等均为相对路径)
+JOB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(JOB_DIR)
+if JOB_DIR not in sys.path:
+    sys.path.insert(0, JOB_DIR)
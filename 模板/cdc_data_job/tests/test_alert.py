@@ -0,0 +1,87 @@
+# -*- coding:utf-8 -*-
+import collections
+import time
+
+import pytest
+
+from service import alert
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(alert.time, 'time', lambda: now[0])
+    return now
+
+
+def pending(*items):
+    return collections.OrderedDict((key, {'count': count, 'content': f"{key} content"}) for key, count in items)
+
+
+def test_build_digest_single():
+    items = pending(('a:failed', 1))
+    assert alert.build_digest(items, list(items.items())) == 'a:failed content'
+
+
+def test_build_digest_merge(monkeypatch):
+    monkeypatch.setitem(alert.config, 'top_n', 2)
+    items = pending(('a:failed', 1), ('b:timeout', 3), ('c:failed', 2), ('d:lock', 1))
+    # d 近期已发送过，计入总数但不列出
+    fresh = [(key, item) for key, item in items.items() if key != 'd:lock']
+    assert alert.build_digest(items, fresh).split('\n') == [
+        '告警汇总：7条告警，4类', '[3次] b:timeout content', '[2次] c:failed content',
+        '其他2类告警(含近期已发送的重复告警)省略']
+    # 同一 key 多次也汇总，显示次数
+    items = pending(('a:failed', 2))
+    assert alert.build_digest(items, list(items.items())).split('\n') == [
+        '告警汇总：2条告警，1类', '[2次] a:failed content']
+
+
+def test_build_digest_all_duplicates():
+    assert alert.build_digest(pending(('a:failed', 4)), []) is None
+
+
+def test_flush_dedup(clock):
+    sent = []
+    aggregator = alert.AlertAggregator(send=sent.append)
+    aggregator._pending = pending(('a:failed', 1))
+    aggregator.flush()
+    # dedup_seconds 内同一 key 不再发送
+    clock[0] += alert.config['dedup_seconds'] - 1
+    aggregator._pending = pending(('a:failed', 1))
+    aggregator.flush()
+    clock[0] += 1
+    aggregator._pending = pending(('a:failed', 1), ('b:failed', 1))
+    aggregator.flush()
+    assert sent == ['a:failed content', '告警汇总：2条告警，2类\n[1次] a:failed content\n[1次] b:failed content']
+    aggregator.flush()
+    assert len(sent) == 2 and aggregator._first_time is None
+
+
+def test_budget_wait(clock, monkeypatch):
+    monkeypatch.setitem(alert.config, 'max_per_minute', 2)
+    aggregator = alert.AlertAggregator(send=lambda content: None)
+    assert aggregator._budget_wait() == 0
+    for key in ('a', 'b'):
+        aggregator._pending = pending((key, 1))
+        aggregator.flush()
+        clock[0] += 10
+    # 一分钟内已发送 2 条，等最早的一条满 60 秒
+    assert aggregator._budget_wait() == 40
+    clock[0] += 40
+    assert aggregator._budget_wait() == 0
+    assert len(aggregator._send_times) == 1
+
+
+def test_window_merges_alerts(monkeypatch):
+    monkeypatch.setitem(alert.config, 'window_seconds', 0.2)
+    sent = []
+    aggregator = alert.AlertAggregator(send=sent.append)
+    aggregator.warn('a:failed', 'a content')
+    aggregator.warn('b:QueryCanceled', 'b content')
+    aggregator.warn('a:failed', 'a content')
+    assert sent == []
+    deadline = time.time() + 5
+    while not sent and time.time() < deadline:
+        time.sleep(0.05)
+    assert sent == ['告警汇总：3条告警，2类\n[2次] a content\n[1次] b content']
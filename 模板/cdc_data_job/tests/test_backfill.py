@@ -0,0 +1,72 @@
+# -*- coding:utf-8 -*-
+import threading
+
+import pytest
+
+from launcher import backfill, executor
+
+
+def test_split_windows_hour():
+    assert backfill.split_windows('2026-10-18 22:00:00', '2026-10-19 01:00:00') == [
+        ('2026-10-18 22:00:00', '2026-10-18 23:00:00'),
+        ('2026-10-18 23:00:00', '2026-10-19 00:00:00'),
+        ('2026-10-19 00:00:00', '2026-10-19 01:00:00'),
+    ]
+
+
+def test_split_windows_day():
+    assert backfill.split_windows('2026-02-27', '2026-03-02', 'day') == [
+        ('2026-02-27', '2026-02-28'), ('2026-02-28', '2026-03-01'), ('2026-03-01', '2026-03-02')]
+
+
+def test_split_windows_not_aligned():
+    # 按日期格式输出会截断为整点/整天，不能静默丢掉 11:00 ~ 11:30
+    with pytest.raises(ValueError, match="not aligned to grain hour"):
+        backfill.split_windows('2026-10-18 10:00', '2026-10-18 11:30', 'hour')
+    with pytest.raises(ValueError, match="not aligned to grain day"):
+        backfill.split_windows('2026-10-18 10:00', '2026-10-20', 'day')
+
+
+def test_split_windows_empty():
+    assert backfill.split_windows('2026-10-18', '2026-10-18', 'day') == []
+    assert backfill.split_windows('2026-10-19', '2026-10-18', 'day') == []
+
+
+def test_split_windows_invalid():
+    with pytest.raises(ValueError, match="invalid grain"):
+        backfill.split_windows('2026-10-18', '2026-10-19', 'week')
+    with pytest.raises(ValueError, match="invalid date"):
+        backfill.split_windows('2026/10/18', '2026-10-19')
+
+
+def sequential_step(name):
+    return {'mapping_name': name, 'options': {'window_sequential': '1'}}
+
+
+def test_window_gate_waits_previous_window():
+    gate = backfill.WindowGate()
+    gate.leave(0, 'a', executor.STATUS_SUCCESS)
+    gate.finish_window(0, {'a': executor.STATUS_SUCCESS, 'b': executor.STATUS_FAILED})
+    assert gate.enter(1, sequential_step('a')) is True
+    assert gate.enter(1, sequential_step('b')) is False
+    assert gate.enter(1, {'mapping_name': 'b', 'options': {}}) is True
+
+
+def test_window_gate_previous_window_raised(monkeypatch):
+    # 周期 0 在执行任何步骤前抛出异常，周期 1 的串行步骤不能一直等待
+    entered = []
+
+    def call_sql_files(sql_list_file_name, gate=None, **kwargs):
+        if kwargs['begin_date'] == '2026-10-18 00:00:00':
+            raise RuntimeError('connection refused')
+        entered.append(gate.enter(sequential_step('a')))
+        return {'a': executor.STATUS_UPSTREAM_FAILED}
+
+    monkeypatch.setattr(backfill.executor, 'call_sql_files', call_sql_files)
+    worker = threading.Thread(target=backfill.run_backfill, args=('etl/l.txt', None),
+                              kwargs={'begin_date': '2026-10-18 00:00:00', 'end_date': '2026-10-18 02:00:00'},
+                              daemon=True)
+    worker.start()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert entered == [False]
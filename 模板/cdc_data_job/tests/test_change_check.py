@@ -0,0 +1,61 @@
+# -*- coding:utf-8 -*-
+import pytest
+
+from launcher import change_check
+
+
+def test_parse_sources():
+    assert change_check.parse_sources(' ods.t_dict, t_type ,') == ['ods.t_dict', 't_type']
+    for value in ('ods.t;drop table x', 'a.b.c', 'ods."t"'):
+        with pytest.raises(ValueError, match="invalid source table"):
+            change_check.parse_sources(value)
+
+
+def test_indicator_sql():
+    sql, params = change_check.indicator_sql('ods.t', 'stats')
+    assert 'pg_stat_user_tables' in sql and 'to_regclass(%s)' in sql and params == ['ods.t']
+    assert change_check.indicator_sql('ods.t', 'max', 'update_time') == (
+        '(select max(update_time)::text from ods.t)', [])
+    sql, params = change_check.indicator_sql('ods.t', 'checksum')
+    assert sql.startswith('(select count(*)') and 'from ods.t t' in sql and params == []
+
+
+def test_indicator_sql_errors():
+    with pytest.raises(ValueError, match="invalid change_column"):
+        change_check.indicator_sql('ods.t', 'max')
+    with pytest.raises(ValueError, match="invalid change_column"):
+        change_check.indicator_sql('ods.t', 'max', 'a) from x; --')
+    with pytest.raises(ValueError, match="unknown method"):
+        change_check.indicator_sql('ods.t', 'count')
+
+
+def test_check_query_defaults():
+    # 默认 stats，不扫描表；写了 change_column 时默认 max；checksum 只能显式指定
+    sql, params, sources = change_check.check_query('dim_dict', {'sources': 'ods.a,ods.b'})
+    assert sql.count('pg_stat_user_tables') == 2 and 'count(*)' not in sql
+    assert params == ['ods.a', 'ods.b', 'dim_dict', ''] and sources == ['ods.a', 'ods.b']
+    sql, params, _ = change_check.check_query('dim_x', {'sources': 'ods.a', 'change_column': 'update_time'})
+    assert 'max(update_time)' in sql and params == ['dim_x', '']
+    sql, _, _ = change_check.check_query('dim_x', {'sources': 'ods.a', 'change_check': 'checksum'})
+    assert 'count(*)' in sql
+    assert sql.endswith('where etl_name = %s and etl_window = %s)')
+
+
+def test_window_key():
+    # 默认只按步骤保存，新周期与上一次比较
+    params = {'begin_date': '2026-10-18 10:00:00', 'end_date': '2026-10-18 11:00:00'}
+    assert change_check.window_key({}, **params) == ''
+    assert change_check.window_key({'change_window': '0'}, **params) == ''
+    assert change_check.window_key({'change_window': '1'}, **params) == '2026-10-18 10:00:00 ~ 2026-10-18 11:00:00'
+    assert change_check.window_key({'change_window': 'true'}) == ' ~ '
+
+
+def test_compare():
+    sources = ['ods.a', 'ods.b']
+    assert change_check.compare((['1/2/0/16384', '5'], 'ods.a=1/2/0/16384;ods.b=5'), sources) == (
+        'ods.a=1/2/0/16384;ods.b=5', True)
+    assert change_check.compare((['1/2/0/16384', '6'], 'ods.a=1/2/0/16384;ods.b=5'), sources) == (
+        'ods.a=1/2/0/16384;ods.b=6', False)
+    assert change_check.compare((['1', '5'], None), sources) == ('ods.a=1;ods.b=5', False)
+    # 取不到指标时视为有变化，不保存签名
+    assert change_check.compare(([None, '5'], 'ods.a=;ods.b=5'), sources) == (None, False)
@@ -0,0 +1,48 @@
+# -*- coding:utf-8 -*-
+import pytest
+
+from launcher import chunked
+
+STAGING = 'dw.dwd_x_chunk_0a1b2c3d'
+
+
+def test_redirect_writes():
+    sql = """create temp table tmp_a as select * from ods.a where ts >= %(begin_date)s;
+DELETE FROM dw.dwd_x where ts >= %(begin_date)s;
+insert into dw.dwd_x select * from tmp_a join dw.dwd_x_history h using (id);"""
+    assert chunked.redirect_writes(sql, 'dw.dwd_x', STAGING) == f"""create temp table tmp_a as select * from ods.a where ts >= %(begin_date)s;
+DELETE FROM {STAGING} where ts >= %(begin_date)s;
+insert into {STAGING} select * from tmp_a join dw.dwd_x_history h using (id);"""
+
+
+def test_redirect_writes_requires_insert():
+    with pytest.raises(ValueError, match="does not insert into chunk_table"):
+        chunked.redirect_writes("insert into dw.other select 1", 'dw.dwd_x', STAGING)
+
+
+@pytest.mark.parametrize('sql', ["insert into dw.dwd_x select 1; update dw.job_state set done = true",
+                                 "truncate dw.log_t; insert into dw.dwd_x select 1"])
+def test_redirect_writes_rejects_other_tables(sql):
+    # 其他表的写入每块都会执行一次且不能回滚
+    with pytest.raises(ValueError, match="other than chunk_table"):
+        chunked.redirect_writes(sql, 'dw.dwd_x', STAGING)
+
+
+def test_split_window():
+    assert chunked.split_window('2026-10-18 00:00:00', '2026-10-18 01:00:00', 3) == [
+        ('2026-10-18 00:00:00', '2026-10-18 00:20:00'), ('2026-10-18 00:20:00', '2026-10-18 00:40:00'),
+        ('2026-10-18 00:40:00', '2026-10-18 01:00:00')]
+    assert len(chunked.split_window('2026-10-18 00:00:00', '2026-10-18 00:00:02', 8)) == 2
+    with pytest.raises(ValueError, match="invalid window"):
+        chunked.split_window('2026-10-18', '2026-10-18', 2)
+
+
+def test_check_options():
+    assert chunked.check_options({'chunk_table': 'dw.dwd_x', 'chunk_column': 'ts'}) == ('dw.dwd_x', 'ts')
+    # 不配置 chunk_column 时只能追加，重跑会重复插入
+    with pytest.raises(ValueError, match="chunk_column is required"):
+        chunked.check_options({'chunk_table': 'dw.dwd_x'})
+    with pytest.raises(ValueError, match="invalid chunk_column"):
+        chunked.check_options({'chunk_table': 'dw.dwd_x', 'chunk_column': 'ts; drop'})
+    with pytest.raises(ValueError, match="schema.table"):
+        chunked.check_options({'chunk_table': 'dwd_x', 'chunk_column': 'ts'})
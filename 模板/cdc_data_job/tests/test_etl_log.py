@@ -0,0 +1,49 @@
+# -*- coding:utf-8 -*-
+import pytest
+
+from launcher import etl_log
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(etl_log.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(etl_log, '_log_function', {})
+    return now
+
+
+def test_log_function_check_expires(clock):
+    assert etl_log.log_function_exists() is None
+    etl_log.set_log_function_exists(False)
+    assert etl_log.log_function_exists() is False
+    assert etl_log.current_log_sql() == etl_log.read_sql_file(etl_log.LOG_SQL_FILE)
+    # 过期后重新检查，检查前仍使用上次的结果
+    clock[0] += etl_log.LOG_FUNCTION_CHECK_SECONDS
+    assert etl_log.log_function_exists() is None
+    etl_log.set_log_function_exists(True)
+    assert etl_log.log_function_exists() is True
+    assert etl_log.current_log_sql() == etl_log.LOG_FUNCTION_CALL
+
+
+class FakeCursor(object):
+
+    def __init__(self, exists):
+        self.exists = exists
+        self.checks = 0
+
+    def execute(self, sql, params=None):
+        self.checks += 1
+
+    def fetchone(self):
+        return (self.exists,)
+
+
+def test_get_log_sql_rechecks(clock):
+    cur = FakeCursor(False)
+    assert etl_log.get_log_sql(cur) != etl_log.LOG_FUNCTION_CALL
+    cur.exists = True
+    assert etl_log.get_log_sql(cur) != etl_log.LOG_FUNCTION_CALL
+    assert cur.checks == 1
+    clock[0] += etl_log.LOG_FUNCTION_CHECK_SECONDS
+    assert etl_log.get_log_sql(cur) == etl_log.LOG_FUNCTION_CALL
+    assert cur.checks == 2
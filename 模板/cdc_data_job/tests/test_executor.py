@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+import pytest
+
+from launcher import executor, run_lock, sql_list
+
+
+def parse_steps(*lines):
+    return [sql_list.parse_line(line) for line in lines]
+
+
+@pytest.fixture
+def fake_steps(monkeypatch):
+    """run_step 按 statuses 返回状态，log_sql_file 记录上游失败的步骤"""
+    statuses, logged = {}, []
+
+    def run_step(step, pool, gate=None, options=None, **pg_params):
+        return statuses.get(step['mapping_name'], executor.STATUS_SUCCESS)
+
+    monkeypatch.setattr(executor, 'run_step', run_step)
+    monkeypatch.setattr(executor, 'log_sql_file', lambda file_name, status, *args, **kwargs: logged.append(file_name))
+    return statuses, logged
+
+
+def test_lock_skipped_dependency_not_failed(fake_steps):
+    # 其他进程正在执行 a 而跳过时，依赖 a 的步骤照常执行
+    statuses, logged = fake_steps
+    statuses['a'] = executor.STATUS_LOCK_SKIPPED
+    results = executor.run_steps(parse_steps('etl/a.sql', 'etl/b.sql after a'), None, 2)
+    assert results == {'a': executor.STATUS_LOCK_SKIPPED, 'b': executor.STATUS_SUCCESS}
+    assert logged == []
+
+
+@pytest.mark.parametrize('status', [executor.STATUS_FAILED, executor.STATUS_TIMEOUT, executor.STATUS_LOCK_FAILED])
+def test_failed_dependency(fake_steps, status):
+    statuses, logged = fake_steps
+    statuses['a'] = status
+    results = executor.run_steps(parse_steps('etl/a.sql', 'etl/b.sql after a', 'etl/c.sql after b'), None, 2)
+    assert results == {'a': status, 'b': executor.STATUS_UPSTREAM_FAILED, 'c': executor.STATUS_UPSTREAM_FAILED}
+    assert sorted(logged) == ['etl/b.sql', 'etl/c.sql']
+
+
+def test_check_options():
+    steps = parse_steps('etl/a.sql lock=wait', 'etl/b.sql')
+    executor.check_options(steps, {'lock': 'skip'})
+    executor.check_options(steps)
+    with pytest.raises(ValueError, match="step b: lock: unknown policy 'skipp'"):
+        executor.check_options(steps, {'lock': 'skipp'})
+    with pytest.raises(ValueError, match="unknown policy"):
+        executor.check_options(parse_steps('etl/a.sql lock=block'))
+
+
+def test_check_policy():
+    assert run_lock.check_policy(None) == 'none'
+    assert run_lock.check_policy('wait') == 'wait'
+    with pytest.raises(ValueError):
+        run_lock.check_policy('Skip')
+
+
+def test_check_options_chunked():
+    executor.check_options(parse_steps('etl/a.sql chunks=4 chunk_table=dw.a chunk_column=ts', 'etl/b.sql chunks=1'))
+    with pytest.raises(ValueError, match="step a: chunk: chunk_column is required"):
+        executor.check_options(parse_steps('etl/a.sql chunks=4 chunk_by=key chunk_table=dw.a'))
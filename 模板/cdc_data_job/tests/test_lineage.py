@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+import pytest
+
+from launcher import lineage
+
+
+def test_parse_insert_select():
+    sql = """
+-- insert into dw.commented select * from dw.ignored
+insert into dw.dwd_orders (id, amount)
+select o.id, o.amount from ods.orders o
+left join "ods"."Customers" c on c.id = o.customer_id
+where o.note <> 'from dw.string_literal'
+  and extract(year from o.ts) = 2026
+  and o.a is distinct from o.b;
+"""
+    assert lineage.parse_sql(sql) == (['ods.customers', 'ods.orders'], ['dw.dwd_orders'])
+
+
+def test_parse_comma_from_list():
+    sql = "insert into dw.t select * from dw.a a, dw.b as b, lateral (select 1) x, generate_series(1, 3) g, c"
+    assert lineage.parse_sql(sql) == (['dw.a', 'dw.b', 'public.c'], ['dw.t'])
+    sql = "delete from dw.t using dw.u, dw.v where dw.t.id = dw.u.id"
+    assert lineage.parse_sql(sql) == (['dw.u', 'dw.v'], ['dw.t'])
+
+
+def test_parse_unqualified_names():
+    # 不带 schema 的按 search_path 补全为 public
+    assert lineage.parse_sql("update orders set a = 1 from pg_stat_user_tables s") == (
+        ['pg_catalog.pg_stat_user_tables'], ['public.orders'])
+
+
+def test_parse_excludes_cte_and_temp():
+    sql = """
+create temp table tmp_x as select * from dw.a;
+with recent as (select * from dw.b), agg as materialized (select * from recent)
+merge into dw.c t using agg s on t.id = s.id
+when matched then update set v = s.v;
+insert into dw.d select * from tmp_x;
+"""
+    assert lineage.parse_sql(sql) == (['dw.a', 'dw.b'], ['dw.c', 'dw.d'])
+
+
+def test_parse_writes():
+    sql = """
+truncate table dw.a, dw.b;
+create table if not exists dw.c (id int);
+copy dw.d (id) from stdin;
+insert into dw.e values (1) on conflict (id) do update set v = 1;
+select * from dw.f for update;
+do $$ begin delete from only dw.g where 1 = 1; end $$;
+"""
+    assert lineage.parse_sql(sql) == (['dw.f'], ['dw.a', 'dw.b', 'dw.c', 'dw.d', 'dw.e', 'dw.g'])
+
+
+def test_downstream_steps():
+    tables = {
+        'ods_load': {'reads': [], 'writes': ['ods.orders']},
+        'dwd_orders': {'reads': ['ods.orders'], 'writes': ['dw.dwd_orders']},
+        'dim_user': {'reads': ['ods.users'], 'writes': ['dw.dim_user']},
+        'ads_orders': {'reads': ['dw.dwd_orders', 'dw.dim_user'], 'writes': ['public.ads_orders']},
+    }
+    steps = [{'mapping_name': name, 'after': []} for name in tables]
+    upstreams = lineage.step_upstreams(steps, tables)
+    assert upstreams['ads_orders'] == {'dwd_orders', 'dim_user'}
+    assert lineage.downstream_steps(tables, upstreams, 'dwd_orders') == {'dwd_orders', 'ads_orders'}
+    assert lineage.downstream_steps(tables, upstreams, 'ODS.Orders') == {'dwd_orders', 'ads_orders'}
+    assert lineage.downstream_steps(tables, upstreams, 'ods.users') == {'dim_user', 'ads_orders'}
+    with pytest.raises(ValueError, match="neither a step nor a table"):
+        lineage.downstream_steps(tables, upstreams, 'ads_orders_table')
+
+
+def test_downstream_unqualified_target():
+    tables = {'a': {'reads': ['public.orders'], 'writes': []}}
+    upstreams = lineage.step_upstreams([{'mapping_name': 'a', 'after': []}], tables)
+    assert lineage.downstream_steps(tables, upstreams, 'orders') == {'a'}
+
+
+def test_cache_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(lineage, 'CACHE_FILE', str(tmp_path / 'lineage.json'))
+    monkeypatch.setattr(lineage, '_cache', None)
+    sql_file = tmp_path / 'dwd_x.sql'
+    sql_file.write_text('insert into dw.x select * from dw.a, dw.b', encoding='utf-8')
+    stat = sql_file.stat()
+    # 旧版本解析的结果(只有第一个表)重新解析
+    lineage.load_cache()[str(sql_file)] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                                           'reads': ['dw.a'], 'writes': ['dw.x']}
+    assert lineage.analyze_file(str(sql_file)) == {'reads': ['dw.a', 'dw.b'], 'writes': ['dw.x']}
+    lineage.save_cache()
+    monkeypatch.setattr(lineage, '_cache', None)
+    assert lineage.load_cache()[str(sql_file)]['version'] == lineage.PARSER_VERSION
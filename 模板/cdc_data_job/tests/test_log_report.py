@@ -0,0 +1,51 @@
+# -*- coding:utf-8 -*-
+import math
+import random
+
+import pytest
+
+from launcher import log_report
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+def test_quantile_empty():
+    assert log_report.LatencyStats().quantile(0.5) is None
+
+
+def test_quantile_single():
+    stats = log_report.LatencyStats()
+    stats.add(12.3)
+    # 只有一个样本时限制在最小值、最大值之间，即为该样本
+    assert stats.quantile(0.01) == stats.quantile(0.5) == stats.quantile(1) == 12.3
+
+
+@pytest.mark.parametrize('q', [0.01, 0.5, 0.9, 0.95, 0.99, 1.0])
+def test_quantile_relative_error(q):
+    rng = random.Random(20261018)
+    values = [rng.lognormvariate(1, 1.5) for _ in range(5000)]
+    stats = log_report.LatencyStats()
+    for value in values:
+        stats.add(value)
+    expected = exact_quantile(values, q)
+    assert abs(stats.quantile(q) - expected) / expected <= math.sqrt(log_report.BUCKET_BASE) - 1 + 1e-9
+
+
+def test_quantile_bounds():
+    stats = log_report.LatencyStats()
+    for value in (0, -1, 0.0001, 5, 5, 5):
+        stats.add(value)
+    assert stats.count == 6 and stats.min == 0 and stats.max == 5
+    # 小于 MIN_SECONDS 的耗时都在第一个桶，分辨率为 MIN_SECONDS
+    assert 0 <= stats.quantile(0) <= log_report.MIN_SECONDS * log_report.BUCKET_BASE
+    assert stats.quantile(0.5) == stats.quantile(0)
+    assert stats.quantile(0.99) == 5
+    assert stats.total == pytest.approx(15.0001)
+
+
+def test_error_signature():
+    assert log_report.error_signature('relation "dw.t_123" does not exist at line 42\n') == \
+        "relation '?' does not exist at line N"
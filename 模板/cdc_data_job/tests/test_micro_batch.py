@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+import datetime
+import sys
+
+import pytest
+
+from launcher import micro_batch
+
+
+def at(hour, minute, second=0):
+    return datetime.datetime(2026, 10, 18, hour, minute, second)
+
+
+def test_floor_time():
+    assert micro_batch.floor_time(at(10, 7, 59), 5) == at(10, 5)
+    assert micro_batch.floor_time(at(10, 59), 60) == at(10, 0)
+    assert micro_batch.floor_time(at(0, 0), 5) == at(0, 0)
+
+
+def test_next_window_first_run():
+    # 没有高水位时从上一个完整周期开始
+    assert micro_batch.next_window(None, at(10, 7, 30)) == (at(10, 0), at(10, 5))
+
+
+def test_next_window_incremental():
+    assert micro_batch.next_window(at(10, 0), at(10, 7)) == (at(10, 0), at(10, 5))
+    assert micro_batch.next_window(at(10, 5), at(10, 10)) == (at(10, 5), at(10, 10))
+
+
+def test_next_window_not_ready():
+    assert micro_batch.next_window(at(10, 5), at(10, 9, 59)) is None
+    # 高水位超过当前时间(时钟回拨)
+    assert micro_batch.next_window(at(10, 15), at(10, 12)) is None
+
+
+def test_next_window_lateness():
+    assert micro_batch.next_window(at(10, 0), at(10, 7), lateness_minutes=3) is None
+    assert micro_batch.next_window(at(10, 0), at(10, 8), lateness_minutes=3) == (at(10, 0), at(10, 5))
+
+
+def test_next_window_catch_up():
+    # 积压的周期合并为一批，最长 max_batch_minutes 分钟
+    assert micro_batch.next_window(at(9, 0), at(9, 40)) == (at(9, 0), at(9, 40))
+    assert micro_batch.next_window(at(8, 0), at(10, 2)) == (at(8, 0), at(9, 0))
+    assert micro_batch.next_window(at(8, 0), at(10, 2), max_batch_minutes=0) == (at(8, 0), at(10, 0))
+    assert micro_batch.next_window(at(8, 0), at(10, 2), batch_minutes=15, max_batch_minutes=30) == \
+        (at(8, 0), at(8, 30))
+
+
+def test_async_engine_rejected(monkeypatch):
+    # 异步引擎不读高水位，同时指定时报错退出，不能按命令行周期静默执行
+    from config import cmd_args
+    monkeypatch.setattr(sys, 'argv', ['main.py', '--micro_batch', '--engine', 'async'])
+    with pytest.raises(SystemExit):
+        cmd_args.get_run_params(cmd_args.create_parser())
+    monkeypatch.setattr(sys, 'argv', ['main.py', '--micro_batch', '--engine', 'sync'])
+    assert cmd_args.get_run_params(cmd_args.create_parser())['micro_batch'] is True
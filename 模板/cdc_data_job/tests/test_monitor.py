@@ -0,0 +1,88 @@
+# -*- coding:utf-8 -*-
+import collections
+import datetime
+
+import pytest
+
+from launcher import executor, monitor
+
+Column = collections.namedtuple('Column', 'name')
+
+
+class FakeCursor(object):
+    """重建时的查询：耗时基线表不存在，etl_log 返回 rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+        self.description = None
+
+    def execute(self, sql, params=None):
+        if sql == monitor.REBUILD_SQL:
+            self.description = [Column(name) for name in ('id', 'etl_name', 'status', 'start_datetime', 'error_info')]
+            self.result = [tuple(row[column.name] for column in self.description) for row in self.rows]
+        else:
+            self.result = [(False,)]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    sent = []
+    monkeypatch.setattr(monitor.alert, 'warn', lambda key, content: sent.append(key))
+    return sent
+
+
+def running_row(key, started):
+    return {'id': key, 'etl_name': key, 'status': executor.STATUS_RUNNING,
+            'start_datetime': started.strftime(monitor.DATE_FORMAT), 'error_info': ''}
+
+
+def new_monitor():
+    config = {'timeout_minutes': 30.0, 'step_timeout_minutes': {}, 'lookback_hours': 24.0, 'expect': []}
+    return monitor.EtlMonitor(config)
+
+
+def test_rebuild_skips_rows_timed_out_before_start(alerts):
+    now = datetime.datetime.now()
+    etl_monitor = new_monitor()
+    # 已退出进程留下的执行中记录，监控启动前已超时
+    etl_monitor.rebuild(FakeCursor([running_row('dead', now - datetime.timedelta(hours=2)),
+                                    running_row('live', now - datetime.timedelta(minutes=5))]))
+    assert etl_monitor.stale == ['dead']
+    assert list(etl_monitor.running) == ['live']
+    for _, value in etl_monitor.wheel.advance((now + datetime.timedelta(minutes=10)).timestamp()):
+        etl_monitor.fire(value)
+    assert alerts == []
+
+
+def test_rebuild_does_not_repeat_alerts(alerts):
+    now = datetime.datetime.now()
+    etl_monitor = new_monitor()
+    cur = FakeCursor([running_row('slow_step', now - datetime.timedelta(minutes=29, seconds=58))])
+    etl_monitor.rebuild(cur)
+    for _, value in etl_monitor.wheel.advance((now + datetime.timedelta(seconds=5)).timestamp()):
+        etl_monitor.fire(value)
+    assert alerts == ['slow_step:monitor_timeout']
+    # 断线重连后重建，已告警的超时不再告警
+    etl_monitor.rebuild(cur)
+    assert list(etl_monitor.running) == ['slow_step']
+    for _, value in etl_monitor.wheel.advance((now + datetime.timedelta(seconds=10)).timestamp()):
+        etl_monitor.fire(value)
+    assert alerts == ['slow_step:monitor_timeout']
+
+
+def test_timeout_during_disconnect_still_alerts(alerts):
+    # 监控启动后才超时的步骤，即使超时发生在断线期间，重建后仍告警
+    now = datetime.datetime.now()
+    etl_monitor = new_monitor()
+    etl_monitor.started_at = now - datetime.timedelta(hours=1)
+    etl_monitor.rebuild(FakeCursor([running_row('hung', now - datetime.timedelta(minutes=40))]))
+    for _, value in etl_monitor.wheel.advance((now + datetime.timedelta(seconds=2)).timestamp()):
+        etl_monitor.fire(value)
+    assert alerts == ['hung:monitor_timeout']
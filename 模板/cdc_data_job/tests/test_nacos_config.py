@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+import json
+import os
+
+import pytest
+
+from service import nacos_config
+
+NACOS_PARAMS = {'server_addresses': 'http://nacos:8848', 'namespace': 'prod', 'data_id': 'data-service.yml',
+                'group': 'DEFAULT_GROUP'}
+
+
+@pytest.fixture
+def nacos(tmp_path, monkeypatch):
+    """get_pg_params 返回 config['pg_host']，config['error'] 不为空时抛出异常；refreshes 记录同步、后台刷新"""
+    config = {'pg_host': 'db1', 'error': None}
+    refreshes = []
+
+    def get_pg_params(**params):
+        refreshes.append(config['pg_host'])
+        if config['error']:
+            raise ConnectionError(config['error'])
+        return {'pg_host': config['pg_host']}
+
+    monkeypatch.setattr(nacos_config, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(nacos_config, 'get_pg_params', get_pg_params)
+    return config, refreshes
+
+
+def age_cache(seconds):
+    cache_file = nacos_config.get_cache_file(**NACOS_PARAMS)
+    with open(cache_file, encoding='utf-8') as f:
+        cache = json.load(f)
+    cache['update_time'] -= seconds
+    with open(cache_file, encoding='utf-8', mode='w') as f:
+        json.dump(cache, f)
+
+
+def test_cache_fresh(nacos):
+    config, refreshes = nacos
+    assert nacos_config.get_cached_pg_params(**NACOS_PARAMS) == {'pg_host': 'db1'}
+    assert oct(os.stat(nacos_config.get_cache_file(**NACOS_PARAMS)).st_mode & 0o777) == '0o600'
+    config['pg_host'] = 'db2'
+    assert nacos_config.get_cached_pg_params(**NACOS_PARAMS) == {'pg_host': 'db1'}
+    assert refreshes == ['db1']
+
+
+def test_cache_stale_refresh_in_background(nacos):
+    config, refreshes = nacos
+    nacos_config.get_cached_pg_params(**NACOS_PARAMS)
+    age_cache(nacos_config.CACHE_TTL)
+    config['pg_host'] = 'db2'
+    # 先返回旧配置，后台刷新完成后使用新配置
+    assert nacos_config.get_cached_pg_params(**NACOS_PARAMS) == {'pg_host': 'db1'}
+    nacos_config.wait_refresh()
+    assert nacos_config.get_cached_pg_params(**NACOS_PARAMS) == {'pg_host': 'db2'}
+    assert refreshes == ['db1', 'db2']
+
+
+def test_cache_stale_nacos_down(nacos):
+    config, refreshes = nacos
+    nacos_config.get_cached_pg_params(**NACOS_PARAMS)
+    config['error'] = 'connection refused'
+    age_cache(nacos_config.CACHE_MAX_STALE - 60)
+    assert nacos_config.get_cached_pg_params(**NACOS_PARAMS) == {'pg_host': 'db1'}
+    nacos_config.wait_refresh()
+    # 超过 max_stale 后不再使用旧配置
+    age_cache(60)
+    with pytest.raises(RuntimeError, match="cache is .* old"):
+        nacos_config.get_cached_pg_params(**NACOS_PARAMS)
+    config['error'] = None
+    assert nacos_config.get_cached_pg_params(**NACOS_PARAMS) == {'pg_host': 'db1'}
+
+
+def test_no_cache_nacos_down(nacos):
+    config, _ = nacos
+    config['error'] = 'connection refused'
+    with pytest.raises(ConnectionError):
+        nacos_config.get_cached_pg_params(**NACOS_PARAMS)
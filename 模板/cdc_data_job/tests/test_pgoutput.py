@@ -0,0 +1,93 @@
+# -*- coding:utf-8 -*-
+import datetime
+import struct
+
+import pytest
+
+from utils import pgoutput
+
+COMMIT_TIME = datetime.datetime(2026, 10, 18, 8, 30, tzinfo=datetime.timezone.utc)
+COMMIT_MICROS = (COMMIT_TIME - pgoutput.PG_EPOCH) // datetime.timedelta(microseconds=1)
+
+
+# --------------------------------
+# 按协议格式构造消息
+# --------------------------------
+def string(value):
+    return value.encode('utf-8') + b'\0'
+
+
+def tuple_data(*values):
+    data = struct.pack('>h', len(values))
+    for value in values:
+        if value is None:
+            data += b'n'
+        elif value is pgoutput.UNCHANGED_TOAST:
+            data += b'u'
+        else:
+            raw = value.encode('utf-8')
+            data += b't' + struct.pack('>i', len(raw)) + raw
+    return data
+
+
+def test_begin_commit():
+    message = pgoutput.parse_message(b'B' + struct.pack('>QqI', 0x16B3748, COMMIT_MICROS, 1234))
+    assert message == {'type': 'begin', 'final_lsn': 0x16B3748, 'commit_time': COMMIT_TIME, 'xid': 1234}
+    message = pgoutput.parse_message(b'C' + struct.pack('>bQQq', 0, 0x16B3748, 0x16B3780, COMMIT_MICROS))
+    assert message == {'type': 'commit', 'commit_lsn': 0x16B3748, 'end_lsn': 0x16B3780, 'commit_time': COMMIT_TIME}
+
+
+def test_relation():
+    data = (b'R' + struct.pack('>I', 16384) + string('dw') + string('orders') + b'd' + struct.pack('>h', 2)
+            + struct.pack('>b', 1) + string('id') + struct.pack('>Ii', 20, -1)
+            + struct.pack('>b', 0) + string('名称') + struct.pack('>Ii', 1043, 104))
+    assert pgoutput.parse_message(data) == {
+        'type': 'relation', 'relation_id': 16384, 'schema': 'dw', 'table': 'orders',
+        'columns': [{'name': 'id', 'key': True}, {'name': '名称', 'key': False}]}
+
+
+def test_insert():
+    data = b'I' + struct.pack('>I', 16384) + b'N' + tuple_data('1', None, '中文')
+    assert pgoutput.parse_message(data) == {'type': 'insert', 'relation_id': 16384, 'old': None,
+                                            'old_key_only': False, 'new': ['1', None, '中文']}
+
+
+def test_update():
+    # 主键未变化时没有旧行
+    data = b'U' + struct.pack('>I', 16384) + b'N' + tuple_data('1', pgoutput.UNCHANGED_TOAST)
+    message = pgoutput.parse_message(data)
+    assert message['old'] is None and message['new'][1] is pgoutput.UNCHANGED_TOAST
+    # 主键变化(K)、replica identity full(O)
+    data = b'U' + struct.pack('>I', 16384) + b'K' + tuple_data('1', None) + b'N' + tuple_data('2', 'b')
+    assert pgoutput.parse_message(data) == {'type': 'update', 'relation_id': 16384, 'old': ['1', None],
+                                            'old_key_only': True, 'new': ['2', 'b']}
+    data = b'U' + struct.pack('>I', 16384) + b'O' + tuple_data('1', 'a') + b'N' + tuple_data('1', 'b')
+    message = pgoutput.parse_message(data)
+    assert message['old'] == ['1', 'a'] and not message['old_key_only']
+
+
+def test_delete():
+    data = b'D' + struct.pack('>I', 16384) + b'K' + tuple_data('1', None)
+    assert pgoutput.parse_message(data) == {'type': 'delete', 'relation_id': 16384, 'old': ['1', None],
+                                            'old_key_only': True, 'new': None}
+
+
+def test_truncate():
+    data = b'T' + struct.pack('>Ib', 2, 0) + struct.pack('>II', 16384, 16390)
+    assert pgoutput.parse_message(data) == {'type': 'truncate', 'relation_ids': [16384, 16390]}
+
+
+def test_other_messages():
+    assert pgoutput.parse_message(b'O' + struct.pack('>Q', 1) + string('origin')) == {'type': None}
+    assert pgoutput.parse_message(memoryview(b'Y' + struct.pack('>I', 1))) == {'type': None}
+
+
+def test_unknown_tuple_kind():
+    with pytest.raises(ValueError, match="unknown tuple data kind"):
+        pgoutput.parse_message(b'I' + struct.pack('>I', 1) + b'N' + struct.pack('>h', 1) + b'x')
+
+
+def test_lsn():
+    assert pgoutput.format_lsn(0x16B3748) == '0/16B3748'
+    assert pgoutput.parse_lsn('1A/2B') == (0x1A << 32) + 0x2B
+    assert pgoutput.parse_lsn(pgoutput.format_lsn(0xFFFFFFFF00000001)) == 0xFFFFFFFF00000001
@@ -0,0 +1,132 @@
+# -*- coding:utf-8 -*-
+import datetime
+
+import pytest
+
+from launcher import scheduler
+
+
+def test_parse_field():
+    assert scheduler.parse_field('*', 0, 6) == set(range(7))
+    assert scheduler.parse_field('*/15', 0, 59) == {0, 15, 30, 45}
+    assert scheduler.parse_field('5/20', 0, 59) == {5, 25, 45}
+    assert scheduler.parse_field('1-10/3,20,30-31', 1, 31) == {1, 4, 7, 10, 20, 30, 31}
+
+
+@pytest.mark.parametrize('expr', ['60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *', '* * * * 8',
+                                  '5-1 * * * *', '*/0 * * * *', 'a * * * *', '* * * *'])
+def test_parse_cron_invalid(expr):
+    with pytest.raises(ValueError):
+        scheduler.parse_cron(expr)
+
+
+def test_weekday_sunday():
+    # 0 和 7 都表示周日；2026-10-18 为周日
+    sunday = datetime.datetime(2026, 10, 18, 2, 0)
+    assert scheduler.cron_match(scheduler.parse_cron('0 2 * * 7'), sunday)
+    assert scheduler.cron_match(scheduler.parse_cron('0 2 * * 0'), sunday)
+    assert not scheduler.cron_match(scheduler.parse_cron('0 2 * * 1-6'), sunday)
+
+
+def test_day_or_weekday():
+    # 日、周都有限制时满足其一即可，任一为 * (含 */n)时须同时满足
+    cron = scheduler.parse_cron('0 0 1 * 1')
+    assert scheduler.cron_match(cron, datetime.datetime(2026, 10, 1))  # 周四，1日
+    assert scheduler.cron_match(cron, datetime.datetime(2026, 10, 19))  # 周一
+    assert not scheduler.cron_match(cron, datetime.datetime(2026, 10, 20))
+    cron = scheduler.parse_cron('0 0 */2 * 1')
+    assert scheduler.cron_match(cron, datetime.datetime(2026, 10, 5))  # 周一，5日
+    assert not scheduler.cron_match(cron, datetime.datetime(2026, 10, 26))  # 周一，26日
+    assert not scheduler.cron_match(cron, datetime.datetime(2026, 10, 3))  # 周六，3日
+
+
+def test_next_fire_time():
+    cron = scheduler.parse_cron('5 * * * *')
+    assert scheduler.next_fire_time(cron, datetime.datetime(2026, 10, 18, 10, 4, 59)) == \
+        datetime.datetime(2026, 10, 18, 10, 5)
+    # 不含 after 本身
+    assert scheduler.next_fire_time(cron, datetime.datetime(2026, 10, 18, 10, 5)) == \
+        datetime.datetime(2026, 10, 18, 11, 5)
+    cron = scheduler.parse_cron('30 1 29 2 *')
+    assert scheduler.next_fire_time(cron, datetime.datetime(2026, 10, 18)) == datetime.datetime(2028, 2, 29, 1, 30)
+
+
+def test_next_fire_time_never():
+    with pytest.raises(ValueError, match="never fires"):
+        scheduler.next_fire_time(scheduler.parse_cron('0 0 30 2 *'), datetime.datetime(2026, 10, 18))
+
+
+def test_get_window():
+    fire_time = datetime.datetime(2026, 10, 18, 0, 5)
+    assert scheduler.get_window('previous_hour', fire_time) == ('2026-10-17 23:00:00', '2026-10-18 00:00:00')
+    assert scheduler.get_window('previous_day', fire_time) == ('2026-10-17', '2026-10-18')
+    with pytest.raises(ValueError):
+        scheduler.get_window('previous_week', fire_time)
+
+
+class FakePool(object):
+
+    def __init__(self, pool_size=1, **pg_params):
+        self.pool_size = pool_size
+        self.pg_params = pg_params
+        self.closed = False
+
+    def closeall(self):
+        self.closed = True
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scheduler.pg_pool, 'create_pool', FakePool)
+    monkeypatch.setattr(scheduler.executor, 'call_sql_files',
+                        lambda sql_list_file_name, pool=None, **kwargs: calls.append((sql_list_file_name, pool,
+                                                                                      kwargs['pg_host'])))
+    monkeypatch.setattr(scheduler.alert, 'warn', lambda key, content: calls.append(key))
+    return calls
+
+
+def test_run_job_reloads_config(runs):
+    # 常驻进程每次运行前重新读取配置，连接参数变化时换新连接池
+    config = {'pg_host': 'db1', 'pg_port': 5432}
+    job = scheduler.load_schedule('resource/schedule.yml')[0]
+    pool = FakePool(4, **config)
+    daemon = scheduler.Scheduler([job], pool, {'options': {}, 'workers': 1}, load_config=lambda: dict(config),
+                                 **config)
+    fire_time = datetime.datetime(2026, 10, 18, 10, 5)
+    daemon.run_job(job, fire_time)
+    assert [call[1:] for call in runs] == [(pool, 'db1')] * len(job['sql_list_files'])
+    del runs[:]
+    config['pg_host'] = 'db2'
+    daemon.run_job(job, fire_time)
+    assert daemon.pool is not pool and daemon.pool.pool_size == 4 and pool.closed
+    assert [call[1:] for call in runs] == [(daemon.pool, 'db2')] * len(job['sql_list_files'])
+
+
+def test_run_job_config_error(runs):
+    def load_config():
+        raise RuntimeError('nacos config refresh failed')
+
+    job = scheduler.load_schedule('resource/schedule.yml')[0]
+    daemon = scheduler.Scheduler([job], FakePool(), {'options': {}, 'workers': 1}, load_config=load_config)
+    daemon.run_job(job, datetime.datetime(2026, 10, 18, 10, 5))
+    assert runs == ['schedule:config']
+
+
+def test_overlap_by_sql_list():
+    # 不同 job 包含同一个 sql_list 时不能同时运行
+    submitted = []
+
+    class FakeThreadPool(object):
+        def submit(self, fn, job, fire_time):
+            submitted.append(job['name'])
+
+    jobs = [{'name': 'hour', 'sql_list_files': ['etl/a.txt', 'etl/b.txt']},
+            {'name': 'hour_again', 'sql_list_files': ['./etl/b.txt']},
+            {'name': 'other', 'sql_list_files': ['etl/c.txt']}]
+    daemon = scheduler.Scheduler(jobs, FakePool(), {'options': {}, 'workers': 1})
+    fire_time = datetime.datetime(2026, 10, 18, 10, 5)
+    for job in jobs + jobs[:1]:
+        daemon.submit(FakeThreadPool(), job, fire_time)
+    assert submitted == ['hour', 'other']
+    assert daemon._running == {'etl/a.txt', 'etl/b.txt', 'etl/c.txt'}
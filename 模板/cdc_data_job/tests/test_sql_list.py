@@ -0,0 +1,70 @@
+# -*- coding:utf-8 -*-
+import pytest
+
+from launcher import sql_list
+
+
+def write_list(tmp_path, text):
+    file_name = tmp_path / 'etl_sql_list.txt'
+    file_name.write_text(text, encoding='utf-8')
+    return str(file_name)
+
+
+def test_parse_line():
+    assert sql_list.parse_line('  # comment') is None
+    assert sql_list.parse_line('') is None
+    step = sql_list.parse_line('etl/dws/DWS_X.sql after etl/dim_dict.sql,dim_extend timeout=60 lock=wait')
+    assert step == {'sql_file': 'etl/dws/DWS_X.sql', 'mapping_name': 'dws_x',
+                    'after': ['dim_dict', 'dim_extend'], 'options': {'timeout': '60', 'lock': 'wait'}}
+
+
+def test_parse_line_errors():
+    with pytest.raises(ValueError, match="missing step names"):
+        sql_list.parse_line('etl/a.sql after')
+    with pytest.raises(ValueError, match="unknown item"):
+        sql_list.parse_line('etl/a.sql before b')
+
+
+def test_parse_sql_list_default(tmp_path):
+    file_name = write_list(tmp_path, """
+# 默认选项对所有步骤生效，步骤上的选项优先
+default timeout=1800 instrument=1
+etl/a.sql
+etl/b.sql after a timeout=60
+""")
+    steps = sql_list.parse_sql_list(file_name)
+    assert [step['mapping_name'] for step in steps] == ['a', 'b']
+    assert steps[0]['options'] == {'timeout': '1800', 'instrument': '1'}
+    assert steps[1]['options'] == {'timeout': '60', 'instrument': '1'}
+    assert sql_list.has_dependencies(steps)
+
+
+def test_parse_sql_list_default_after(tmp_path):
+    with pytest.raises(ValueError, match="not allowed in default"):
+        sql_list.parse_sql_list(write_list(tmp_path, 'default after a\netl/a.sql\n'))
+
+
+def test_check_steps_order():
+    steps = [sql_list.parse_line(line) for line in
+             ['etl/d.sql after b,c', 'etl/b.sql after a', 'etl/c.sql after a,a', 'etl/a.sql']]
+    assert sql_list.check_steps(steps) == ['a', 'b', 'c', 'd']
+    assert not sql_list.has_dependencies([sql_list.parse_line('etl/a.sql')])
+
+
+def test_check_steps_cycle():
+    steps = [sql_list.parse_line(line) for line in
+             ['etl/a.sql', 'etl/b.sql after a,d', 'etl/c.sql after b', 'etl/d.sql after c']]
+    with pytest.raises(ValueError, match="dependency cycle among steps: b,c,d"):
+        sql_list.check_steps(steps)
+
+
+def test_check_steps_self_dependency():
+    with pytest.raises(ValueError, match="dependency cycle among steps: a"):
+        sql_list.check_steps([sql_list.parse_line('etl/a.sql after a')])
+
+
+def test_check_steps_unknown_and_duplicate():
+    with pytest.raises(ValueError, match="unknown steps: x"):
+        sql_list.check_steps([sql_list.parse_line('etl/a.sql after x')])
+    with pytest.raises(ValueError, match="duplicate steps: a"):
+        sql_list.check_steps([sql_list.parse_line('etl/a.sql'), sql_list.parse_line('etl/sub/a.sql')])
@@ -0,0 +1,54 @@
+# -*- coding:utf-8 -*-
+from launcher import statements
+
+
+def test_split_simple():
+    assert statements.split_statements("delete from t; insert into t select 1;\n") == [
+        'delete from t', 'insert into t select 1']
+    assert statements.split_statements("select 1") == ['select 1']
+    assert statements.split_statements(" ;; \n") == []
+
+
+def test_split_dollar_quotes():
+    sql = """
+do $$
+begin
+    execute 'truncate t; vacuum t';
+end
+$$;
+create function f() returns int as $body$ select 1; $body$ language sql;
+select $a$;$a$, $$x;$$"""
+    assert statements.split_statements(sql) == [
+        "do $$\nbegin\n    execute 'truncate t; vacuum t';\nend\n$$",
+        "create function f() returns int as $body$ select 1; $body$ language sql",
+        "select $a$;$a$, $$x;$$",
+    ]
+
+
+def test_split_nested_dollar_tags():
+    # $$ 块内其他标签的 $x$ 不结束该块
+    sql = "do $outer$ begin perform $$;$$; end $outer$; select 2"
+    assert statements.split_statements(sql) == ["do $outer$ begin perform $$;$$; end $outer$", "select 2"]
+
+
+def test_split_comments():
+    sql = """-- 删除本周期数据; 先删后插
+delete from t where ts >= %(begin_date)s; /* 插入; 含
+ /* 嵌套 */ 注释 */ insert into t select 1;
+-- 只有注释的片段丢弃;
+"""
+    assert statements.split_statements(sql) == [
+        "-- 删除本周期数据; 先删后插\ndelete from t where ts >= %(begin_date)s",
+        "/* 插入; 含\n /* 嵌套 */ 注释 */ insert into t select 1",
+    ]
+
+
+def test_split_strings():
+    sql = """select 'a;''b', E'c\\';d', "col;x" from t; select 2"""
+    assert statements.split_statements(sql) == ["""select 'a;''b', E'c\\';d', "col;x" from t""", "select 2"]
+
+
+def test_split_unterminated():
+    # 未结束的字符串、$$ 块保留到文件末尾，由数据库报错
+    assert statements.split_statements("select 1; do $$ begin; end") == ['select 1', 'do $$ begin; end']
+    assert statements.split_statements("select 'a;b") == ["select 'a;b"]
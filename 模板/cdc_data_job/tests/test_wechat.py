@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from service import wechat
+
+
+# --------------------------------
+# 本地 qyapi 桩服务：gettoken 依次返回 token-1、token-2...，message/send 按 send_codes 依次返回 errcode
+# --------------------------------
+class QyapiStub(object):
+
+    def __init__(self):
+        self.expires_in = 7200
+        self.send_codes = []
+        self.token_requests = 0
+        self.messages = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.token_requests += 1
+                self.reply({'errcode': 0, 'access_token': f'token-{stub.token_requests}',
+                            'expires_in': stub.expires_in})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+                token = parse_qs(urlparse(self.path).query)['access_token'][0]
+                stub.messages.append((token, body['text']['content']))
+                self.reply({'errcode': stub.send_codes.pop(0) if stub.send_codes else 0})
+
+            def reply(self, result):
+                data = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = QyapiStub()
+    saved = dict(wechat.config)
+    wechat.configure(wechat_url=server.url, wechat_corpid='corp', wechat_corpsecret='secret', retries=3, timeout=5)
+    wechat._token_cache.clear()
+    yield server
+    wechat.config.update(saved)
+    wechat._token_cache.clear()
+    server.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录退避等待的秒数，不实际等待"""
+    calls = []
+    monkeypatch.setattr(wechat.time, 'sleep', calls.append)
+    return calls
+
+
+def test_token_cached(stub):
+    client = wechat.KeepAliveHttp(stub.url)
+    assert wechat.get_token(stub.url, 'corp', 'secret', http=client) == 'token-1'
+    assert wechat.get_token(stub.url, 'corp', 'secret', http=client) == 'token-1'
+    assert wechat.get_token(stub.url, 'corp', 'secret') == 'token-1'
+    assert stub.token_requests == 1
+    client.close()
+
+
+def test_token_refetched_after_expiry(stub):
+    # 有效期不超过提前刷新的秒数，缓存立即过期
+    stub.expires_in = wechat.TOKEN_EXPIRE_MARGIN
+    assert wechat.get_token(stub.url, 'corp', 'secret') == 'token-1'
+    assert wechat.get_token(stub.url, 'corp', 'secret') == 'token-2'
+    assert stub.token_requests == 2
+
+
+def test_send_refetches_expired_token(stub, sleeps):
+    client = wechat.KeepAliveHttp(stub.url)
+    stub.send_codes = [42001]
+    wechat.sender._send(client, 'alert')
+    assert stub.messages == [('token-1', 'alert'), ('token-2', 'alert')]
+    assert sleeps == []
+    client.close()
+
+
+def test_send_retries_with_backoff(stub, sleeps):
+    client = wechat.KeepAliveHttp(stub.url)
+    stub.send_codes = [-1, -1]
+    wechat.sender._send(client, 'alert')
+    assert len(stub.messages) == 3
+    assert sleeps == [1, 2]
+    assert stub.token_requests == 1
+    client.close()
+
+
+def test_send_gives_up(stub, sleeps):
+    client = wechat.KeepAliveHttp(stub.url)
+    wechat.configure(retries=2)
+    stub.send_codes = [-1, -1, -1]
+    with pytest.raises(RuntimeError):
+        wechat.sender._send(client, 'alert')
+    assert len(stub.messages) == 3
+    assert sleeps == [1, 2]
+    client.close()
+
+
+def test_send_warning_through_queue(stub):
+    wechat.configure(project_name='test')
+    wechat.send_warning('step failed')
+    assert wechat.flush(5)
+    token, content = stub.messages[0]
+    assert token == 'token-1'
+    assert content.endswith('\ntest\nstep failed')
+
+
+def test_send_message(stub, capsys):
+    token = wechat.get_token(stub.url, 'corp', 'secret')
+    assert wechat.send_message(stub.url, token, wechat.messages('1000002', 'hello')) == 0
+    assert stub.messages == [('token-1', 'hello')]
+    assert capsys.readouterr().out == ''
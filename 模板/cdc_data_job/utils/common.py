@@ -1,12 +1,53 @@
 # -*- coding:utf-8 -*-
+import atexit
+import datetime
 import logging.config
+import logging.handlers
+import os
+import queue
+import uuid
+
 import yaml
 
-with open("resource/log_config.yml", encoding="utf-8", mode="r") as f:
-    dict_conf = yaml.safe_load(f)
+from utils import log_format
+
+
+def setup_logging(config_file):
+    with open(config_file, encoding="utf-8", mode="r") as f:
+        dict_conf = yaml.safe_load(f)
+    # queue 不是 dictConfig 的配置项：为 true 时 root 的 handler 改由 QueueListener 线程输出，
+    # 记录日志的线程只把 record 放入队列，不等待文件、控制台 I/O
+    use_queue = dict_conf.pop('queue', False)
+    # 文件 handler 的目录(logs/)不存在时先创建，运行时日志不纳入版本库
+    for handler in dict_conf.get('handlers', {}).values():
+        if handler.get('filename'):
+            os.makedirs(os.path.dirname(handler['filename']) or '.', exist_ok=True)
     # 配置信息字典传递给 dictConfig() 函数
     logging.config.dictConfig(dict_conf)
+    if not use_queue:
+        return
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # 上下文字段(run_id、step 等)保存在 contextvars 中，须在记录日志的线程中取值
+    queue_handler.addFilter(log_format.ContextFilter())
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # 退出前输出队列中剩余的日志
+    atexit.register(listener.stop)
+
+
+setup_logging("resource/log_config.yml")
 
 
 def get_logger(name):
     return logging.getLogger(name)
+
+
+def new_run_id():
+    # 一次运行的标识，用于关联同一次运行的各步骤明细
+    return datetime.datetime.now().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:8]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+
+# 日志中关联运行、步骤的字段，duration 由 logger.info(..., extra={'duration': 秒}) 传入
+CONTEXT_FIELDS = ('run_id', 'list', 'step', 'window')
+
+_context = contextvars.ContextVar('etl_log_context', default={})
+
+
+# --------------------------------
+# 日志上下文
+# --------------------------------
+# 当前运行、sql_list、步骤、周期保存在 contextvars 中：asyncio 的每个 task 各有一份，
+# 线程池中的线程不继承，提交任务时用 submit 带上提交时的上下文
+@contextlib.contextmanager
+def log_context(**fields):
+    """with 块内记录的日志带上 fields(值为 None 的字段不覆盖外层)"""
+    context = dict(_context.get())
+    context.update((key, value) for key, value in fields.items() if value is not None)
+    token = _context.set(context)
+    try:
+        yield context
+    finally:
+        _context.reset(token)
+
+
+def get_context():
+    return _context.get()
+
+
+def submit(thread_pool, fn, *args, **kwargs):
+    """在线程池中以当前的日志上下文执行 fn"""
+    return thread_pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def window(begin_date=None, end_date=None, **kwargs):
+    if not begin_date and not end_date:
+        return None
+    return f"{begin_date} ~ {end_date}"
+
+
+class ContextFilter(logging.Filter):
+    """把日志上下文写入 record；须在记录日志的线程中执行(异步日志时加在 QueueHandler 上)，已有的字段不覆盖"""
+
+    def filter(self, record):
+        context = _context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        if not hasattr(record, 'duration'):
+            record.duration = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 json，值为空的字段不输出"""
+
+    def format(self, record):
+        item = {'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                'level': record.levelname, 'process': record.process, 'thread': record.threadName,
+                'logger': record.name, 'file': record.filename, 'line': record.lineno,
+                'message': record.getMessage()}
+        for field in CONTEXT_FIELDS:
+            item[field] = getattr(record, field, None)
+        duration = getattr(record, 'duration', None)
+        item['duration'] = round(duration, 3) if isinstance(duration, float) else duration
+        if record.exc_info:
+            item['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            item['exception'] = record.exc_text
+        return json.dumps({key: value for key, value in item.items() if value is not None},
+                          ensure_ascii=False, default=str)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import collections
+import http.server
+import os
+import re
+import threading
+
+from utils import common
+
+logger = common.get_logger(__name__)
+
+# 耗时类直方图的默认分桶(秒)
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+_registry = collections.OrderedDict()  # 指标名 -> 指标
+_registry_lock = threading.Lock()
+
+
+# --------------------------------
+# Prometheus 指标
+# --------------------------------
+# 进程内的计数器、仪表、直方图，按 Prometheus 文本格式输出，不依赖 prometheus_client：
+#   常驻进程(daemon.py、etl_monitor.py)用 --metrics_port 启动本地 http 端点，由 Prometheus 拉取；
+#   cron 运行(main.py、backfill.py)用 --metrics_file 在结束时写 node_exporter textfile
+class Metric(object):
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 标签值 -> 值
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"metrics: {self.name} expects labels {self.labelnames}")
+        return LabeledMetric(self, tuple(str(value) for value in values))
+
+    def samples(self):
+        """返回 [(指标名后缀, [(标签名, 标签值)], 值)]"""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', list(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, key=()):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, key=()):
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, key=()):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_function(self, function):
+        """输出时调用 function 取值(无标签)，如队列长度"""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                return [('', [], self._function())]
+            except Exception as e:
+                logger.warning(f"metrics: {self.name} collect failed: {e}")
+                return []
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, key=()):
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                item = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    item['buckets'][i] += 1
+            item['sum'] += value
+            item['count'] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(item, buckets=list(item['buckets']))) for key, item in self._values.items())
+        result = []
+        for key, item in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, item['buckets']):
+                result.append(('_bucket', labels + [('le', format_value(bound))], count))
+            result.append(('_bucket', labels + [('le', '+Inf')], item['count']))
+            result.append(('_sum', labels, item['sum']))
+            result.append(('_count', labels, item['count']))
+        return result
+
+
+class LabeledMetric(object):
+    """指标的一组标签值"""
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1):
+        self.metric.inc(amount, self.key)
+
+    def set(self, value):
+        self.metric.set(value, self.key)
+
+    def observe(self, value):
+        self.metric.observe(value, self.key)
+
+
+def register(metric_class, name, documentation, labelnames=(), **kwargs):
+    """同名指标只注册一次"""
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = metric_class(name, documentation, labelnames, **kwargs)
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+# --------------------------------
+# 文本格式
+# --------------------------------
+def format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def unescape(value):
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def render():
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        samples = metric.samples()
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{name}="{escape(str(label))}"' for name, label in labels)
+            lines.append(f"{metric.name}{suffix}{{{label_text}}} {format_value(value)}" if label_text
+                         else f"{metric.name}{suffix} {format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def restore(path, names):
+    """从上一次写入的 textfile 读取 names 中的仪表，本进程没有的标签组合沿用旧值(如上次成功时间)"""
+    try:
+        with open(path, encoding='utf-8', mode='r') as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    for line in lines:
+        match = re.match(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$', line.strip())
+        if match is None or match.group(1) not in names:
+            continue
+        metric = _registry.get(match.group(1))
+        if not isinstance(metric, Gauge):
+            continue
+        labels = {name: unescape(value) for name, value in LABEL_PATTERN.findall(match.group(2) or '')}
+        key = tuple(labels.get(name, '') for name in metric.labelnames)
+        with metric._lock:
+            if key not in metric._values:
+                metric._values[key] = float(match.group(3))
+
+
+def write_textfile(path, keep=()):
+    """写 node_exporter textfile：先写临时文件再改名，node_exporter 不会读到半个文件"""
+    try:
+        if keep:
+            restore(path, keep)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, encoding='utf-8', mode='w') as f:
+            f.write(render())
+        os.replace(tmp_file, path)
+    except OSError as e:
+        logger.warning(f"metrics: write {path} failed: {e}")
+
+
+# --------------------------------
+# http 端点
+# --------------------------------
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, addr=''):
+    """后台线程提供 http://addr:port/metrics，返回 server(shutdown() 停止)"""
+    server = http.server.ThreadingHTTPServer((addr, int(port)), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"metrics: serving on port {port}.")
+    return server
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+from utils import common, metrics
+
+logger = common.get_logger(__name__)
+
+ACQUIRE_SECONDS = metrics.histogram('etl_pool_acquire_seconds', '从连接池借出连接的耗时(秒)，含等待空闲连接和健康检查',
+                                    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60))
+
+
+# --------------------------------
+# 数据库连接池
+# --------------------------------
+# 一次ETL运行(sql_list)只建立一次连接，各个步骤从池中借用、用完归还
+# 借出时做健康检查(select 1)，断开或异常的连接会被关闭并重新建立；
+# 归还后 check_idle_seconds 秒内再次借出的连接不检查，减少步骤之间的往返
+class PgPool(object):
+
+    def __init__(self, pool_size=1, check_idle_seconds=10, **pg_params):
+        self.pool_size = max(int(pool_size), 1)
+        self.check_idle_seconds = check_idle_seconds
+        self._returned = {}  # id(conn) -> 归还时间
+        self._pool = pool.ThreadedConnectionPool(0, self.pool_size,
+                                                 host=pg_params['pg_host'],
+                                                 port=pg_params['pg_port'],
+                                                 dbname=pg_params['pg_dbname'],
+                                                 user=pg_params['pg_user'],
+                                                 password=pg_params['pg_password'])
+        # 限制同时借出的连接数，池满时等待而不是抛出 PoolError
+        self._semaphore = threading.BoundedSemaphore(self.pool_size)
+
+    def getconn(self):
+        begin = time.perf_counter()
+        self._semaphore.acquire()
+        try:
+            # 最多重试 pool_size+1 次，池中的连接可能都已失效
+            for _ in range(self.pool_size + 1):
+                conn = self._pool.getconn()
+                returned = self._returned.pop(id(conn), None)
+                if conn.closed == 0 and returned is not None and time.time() - returned < self.check_idle_seconds:
+                    ACQUIRE_SECONDS.observe(time.perf_counter() - begin)
+                    return conn
+                if is_healthy(conn):
+                    ACQUIRE_SECONDS.observe(time.perf_counter() - begin)
+                    return conn
+                logger.warning("pg pool: broken connection discarded.")
+                self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("pg pool: no healthy connection available")
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            close = conn.closed != 0
+            if not close:
+                status = conn.get_transaction_status()
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    rollback(conn)
+                # 借用方可能切换为自动提交，归还时恢复默认
+                if not close and conn.autocommit:
+                    conn.autocommit = False
+        except Exception:
+            close = True
+        if not close:
+            self._returned[id(conn)] = time.time()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._semaphore.release()
+
+    def closeall(self):
+        if not self._pool.closed:
+            self._pool.closeall()
+
+
+def is_healthy(conn):
+    """借出前的连接检查：已关闭或 select 1 失败视为不可用；临时切换为自动提交，只有一次往返"""
+    if conn.closed != 0:
+        return False
+    autocommit = conn.autocommit
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute('select 1')
+        conn.autocommit = autocommit
+        return True
+    except Exception as e:
+        logger.warning(f"pg pool: health check failed: {e}")
+        return False
+
+
+def rollback(conn):
+    """回滚当前事务；自动提交模式下由 sql 显式 BEGIN 开启的事务 conn.rollback() 不会回滚，需发送 ROLLBACK"""
+    if conn.autocommit:
+        if conn.get_transaction_status() in (extensions.TRANSACTION_STATUS_INTRANS,
+                                             extensions.TRANSACTION_STATUS_INERROR):
+            with conn.cursor() as cur:
+                cur.execute('ROLLBACK')
+    else:
+        conn.rollback()
+
+
+def create_pool(pool_size=1, **pg_params):
+    return PgPool(pool_size, **pg_params)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# coding: utf-8
+import datetime
+import struct
+
+# pgoutput 时间戳为 2000-01-01 起的微秒数
+PG_EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+# --------------------------------
+# pgoutput 逻辑复制消息解析(协议版本 1)
+# --------------------------------
+# https://www.postgresql.org/docs/current/protocol-logicalrep-message-formats.html
+# 每条消息解析为 dict，'type' 为 begin/commit/relation/insert/update/delete/truncate，
+# 其他消息(origin、type、message)返回 type 为 None；列值为 postgres 的文本格式，null 为 None，
+# 未变化的 toast 列为 UNCHANGED_TOAST
+UNCHANGED_TOAST = object()
+
+
+class Reader(object):
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values if len(values) > 1 else values[0]
+
+    def string(self):
+        end = self.data.index(b'\0', self.pos)
+        value = self.data[self.pos:end].decode('utf-8')
+        self.pos = end + 1
+        return value
+
+    def byte(self):
+        value = self.data[self.pos:self.pos + 1].decode('ascii')
+        self.pos += 1
+        return value
+
+    def tuple_data(self):
+        values = []
+        for _ in range(self.unpack('>h')):
+            kind = self.byte()
+            if kind == 'n':
+                values.append(None)
+            elif kind == 'u':
+                values.append(UNCHANGED_TOAST)
+            elif kind in ('t', 'b'):
+                length = self.unpack('>i')
+                raw = self.data[self.pos:self.pos + length]
+                self.pos += length
+                values.append(raw.decode('utf-8') if kind == 't' else raw)
+            else:
+                raise ValueError(f"pgoutput: unknown tuple data kind '{kind}'")
+        return values
+
+
+def to_datetime(micros):
+    return PG_EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def parse_message(data):
+    reader = Reader(data)
+    kind = reader.byte()
+    if kind == 'B':
+        final_lsn, commit_time, xid = reader.unpack('>QqI')
+        return {'type': 'begin', 'final_lsn': final_lsn, 'commit_time': to_datetime(commit_time), 'xid': xid}
+    if kind == 'C':
+        _, commit_lsn, end_lsn, commit_time = reader.unpack('>bQQq')
+        return {'type': 'commit', 'commit_lsn': commit_lsn, 'end_lsn': end_lsn,
+                'commit_time': to_datetime(commit_time)}
+    if kind == 'R':
+        relation_id = reader.unpack('>I')
+        schema, table = reader.string(), reader.string()
+        reader.byte()  # replica identity
+        columns = []
+        for _ in range(reader.unpack('>h')):
+            flags = reader.unpack('>b')
+            name = reader.string()
+            reader.unpack('>Ii')  # 类型 oid、typmod
+            columns.append({'name': name, 'key': bool(flags & 1)})
+        return {'type': 'relation', 'relation_id': relation_id, 'schema': schema, 'table': table, 'columns': columns}
+    if kind == 'I':
+        relation_id = reader.unpack('>I')
+        reader.byte()  # 'N'
+        return {'type': 'insert', 'relation_id': relation_id, 'old': None, 'old_key_only': False,
+                'new': reader.tuple_data()}
+    if kind == 'U':
+        relation_id = reader.unpack('>I')
+        old = None
+        marker = reader.byte()
+        if marker in ('K', 'O'):
+            old = reader.tuple_data()
+            reader.byte()  # 'N'
+        return {'type': 'update', 'relation_id': relation_id, 'old': old, 'old_key_only': marker == 'K',
+                'new': reader.tuple_data()}
+    if kind == 'D':
+        relation_id = reader.unpack('>I')
+        # K 为只有主键列的旧行(其他列为 null)，O 为整行(replica identity full)
+        marker = reader.byte()
+        return {'type': 'delete', 'relation_id': relation_id, 'old': reader.tuple_data(), 'old_key_only': marker == 'K',
+                'new': None}
+    if kind == 'T':
+        count = reader.unpack('>I')
+        reader.unpack('>b')  # cascade / restart identity
+        return {'type': 'truncate', 'relation_ids': [reader.unpack('>I') for _ in range(count)]}
+    return {'type': None}
+
+
+def format_lsn(lsn):
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+
+def parse_lsn(text):
+    high, low = text.split('/')
+    return (int(high, 16) << 32) + int(low, 16)